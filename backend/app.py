@@ -1,64 +1,893 @@
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, request, jsonify, send_file, render_template, Response
 from flask_cors import CORS
 import sqlite3
-from datetime import datetime
-import pandas as pd
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+import threading
+import time
+from datetime import datetime, timedelta
 import io
 import os
+import json
+import base64
+from xlsx_stream import stream_xlsx, XLSX_MIMETYPE
+from export_jobs import ExportJobManager, ExportQueueFull, job_key, DONE
+from pdf_report import SectionCache, build_report
+from order_events import EventBroker, event_stream_response, ORDER_CREATED, ORDER_CLOSED, ORDERS_ARCHIVED, RESYNC
+from order_import import read_manifest, batches, ManifestError
+from response_cache import ResponseCache, MemoryBackend
+from response_encoder import ResponseEncoder
+from metrics import Instrumentation
+from open_orders import OpenOrderIndex
+from group_commit import GroupCommitWriter, WriterClosed
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'X-Total-Count', 'X-Change-Version', 'X-Has-More'])
 
-DATABASE = 'orders.db'
+DATABASE = os.getenv('SQLITE_DATABASE', 'orders.db')
 
-def get_db():
-    conn = sqlite3.connect(DATABASE)
+# ✅ NUEVO: Una conexión SQLite por hilo, reutilizada entre peticiones (conserva
+# la caché de sentencias preparadas). En modo WAL los lectores no bloquean al
+# escritor y busy_timeout espera al lock de escritura en lugar de fallar.
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', '5'))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', '20000'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SQLITE_CACHED_STATEMENTS = int(os.getenv('SQLITE_CACHED_STATEMENTS', '256'))
+SQLITE_SYNCHRONOUS_VALUES = ['OFF', 'NORMAL', 'FULL', 'EXTRA']
+
+# ✅ NUEVO: Escrituras agrupadas (GROUP_COMMIT=true): las escrituras de la API
+# (altas, cierres, cierre masivo, importación, archivo y migración legada) se
+# encolan a un hilo escritor que las confirma juntas en una transacción (las
+# que llegan durante un commit forman el siguiente lote, hasta
+# GROUP_COMMIT_MAX_BATCH; GROUP_COMMIT_MAX_DELAY_MS > 0 además espera a más).
+# Cada petición responde tras el commit de su lote; GROUP_COMMIT_SYNCHRONOUS
+# fija su durabilidad (FULL: sincroniza el WAL en disco en cada lote)
+GROUP_COMMIT = os.getenv('GROUP_COMMIT', 'false').lower() == 'true'
+GROUP_COMMIT_MAX_BATCH = int(os.getenv('GROUP_COMMIT_MAX_BATCH', '64'))
+GROUP_COMMIT_MAX_DELAY_MS = float(os.getenv('GROUP_COMMIT_MAX_DELAY_MS', '0'))
+GROUP_COMMIT_SYNCHRONOUS = os.getenv('GROUP_COMMIT_SYNCHRONOUS', SQLITE_SYNCHRONOUS)
+
+# ✅ NUEVO: Paginación por cursor (order_date, id) para el listado de órdenes
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+VALID_CELDAS = ['Celda 10', 'Celda 11', 'Celda 15', 'Celda 16']
+
+# ✅ NUEVO: Índice de búsqueda FTS5 (tokenizador trigram). Los términos más
+# cortos que un trigrama no pueden usar el índice y caen a LIKE.
+SEARCH_INDEX_ENABLED = False
+MIN_TRIGRAM_LENGTH = 3
+
+# ✅ NUEVO: Métricas de peticiones, SQL y exportaciones (/metrics) y log de
+# consultas lentas con su plan (SLOW_QUERY_SECONDS)
+instrumentation = Instrumentation(
+    'sqlite',
+    slow_query_seconds=float(os.getenv('SLOW_QUERY_SECONDS', '0.5')),
+    enabled=os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+)
+instrumentation.init_app(app)
+
+# ✅ NUEVO: Serialización de los listados (orjson / MessagePack) con compresión
+# gzip/br a partir de RESPONSE_COMPRESS_MIN_SIZE bytes
+response_encoder = ResponseEncoder(
+    compress_min_size=int(os.getenv('RESPONSE_COMPRESS_MIN_SIZE', '1024')),
+    compress_level=int(os.getenv('RESPONSE_COMPRESS_LEVEL', '6')),
+    observe=instrumentation.observe_encode
+)
+
+# ✅ NUEVO: Caché de respuestas de los listados con ETag; add_order y
+# close_order lo invalidan. Cada representación negociada se guarda aparte
+response_cache = ResponseCache(
+    MemoryBackend(max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '256'))),
+    ttl=int(os.getenv('RESPONSE_CACHE_TTL', '60')),
+    variant=response_encoder.variant
+)
+
+def encode_cursor(order_date, order_id):
+    """Codifica la posición (order_date, id) como un token opaco"""
+    raw = json.dumps([order_date, order_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Decodifica un token de cursor; lanza ValueError si no es válido"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        order_date, order_id = json.loads(base64.urlsafe_b64decode(padded))
+        return int(order_date), int(order_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+def parse_page_size(args):
+    """Lee 'limit' de la query string y lo acota a MAX_PAGE_SIZE"""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('El parámetro limit debe ser un entero')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def get_search_term(args):
+    """Término de búsqueda; /api/search_orders usa 'q' y /api/get_orders 'search'"""
+    return args.get('search') or args.get('q', '')
+
+def uses_search_index(search_term):
+    return SEARCH_INDEX_ENABLED and len(search_term) >= MIN_TRIGRAM_LENGTH
+
+def fts_phrase(search_term):
+    """Escapa el término como frase FTS5 (coincidencia de subcadena con trigram)"""
+    return '"' + search_term.replace('"', '""') + '"'
+
+def parse_datetime_param(value):
+    """Interpreta una fecha ISO (YYYY-MM-DD o YYYY-MM-DDTHH:MM[:SS][±HH:MM]) como epoch"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Fecha inválida: {value}')
+    # Las fechas sin zona horaria se interpretan en la hora local del servidor
+    return int(parsed.astimezone().timestamp())
+
+def parse_date_range(args):
+    """Convierte date / from / to en un rango semiabierto [inicio, fin) en epoch.
+
+    date acepta un día (YYYY-MM-DD) o un mes (YYYY-MM); from y to aceptan
+    fechas u horas ISO y tienen prioridad sobre date.
+    """
+    start = end = None
+    date_filter = args.get('date', '')
+
+    if date_filter:
+        try:
+            if len(date_filter) == 7:
+                month = datetime.strptime(date_filter, '%Y-%m')
+                next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+                start, end = month, next_month
+            else:
+                day = datetime.strptime(date_filter, '%Y-%m-%d')
+                start, end = day, day + timedelta(days=1)
+        except ValueError:
+            raise ValueError('Fecha inválida. Formatos válidos: YYYY-MM-DD, YYYY-MM')
+        start = int(start.astimezone().timestamp())
+        end = int(end.astimezone().timestamp())
+
+    if args.get('from'):
+        start = parse_datetime_param(args['from'])
+    if args.get('to'):
+        end = parse_datetime_param(args['to'])
+
+    return start, end
+
+def include_archived(args):
+    """archived=1: la consulta incluye también las órdenes archivadas"""
+    return str(args.get('archived', '')).lower() in ('1', 'true')
+
+def order_tables(args):
+    """(órdenes, accesorios) a consultar: las tablas activas o las vistas que suman el archivo"""
+    if include_archived(args):
+        return 'orders_all', 'order_accessories_all'
+    return 'orders', 'order_accessories'
+
+def build_order_filters(args, include_search=True):
+    """Construye la cláusula WHERE compartida por listado y exportaciones"""
+    search_term = get_search_term(args) if include_search else ''
+    archived = include_archived(args)
+    _, accessories_table = order_tables(args)
+    start, end = parse_date_range(args)
+    celda = args.get('celda', '')
+    status = args.get('status', '')
+
+    clauses = []
+    params = []
+
+    # El índice FTS solo cubre las órdenes activas; con el archivo se usa LIKE
+    if search_term and uses_search_index(search_term) and not archived:
+        clauses.append("o.id IN (SELECT rowid FROM orders_search WHERE orders_search MATCH ?)")
+        params.append(fts_phrase(search_term))
+    elif search_term:
+        clauses.append(
+            "(o.order_number LIKE ? OR o.celda LIKE ? OR EXISTS ("
+            f"SELECT 1 FROM {accessories_table} oa WHERE oa.order_id = o.id AND oa.accessory_type LIKE ?))"
+        )
+        params.extend([f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"])
+
+    # ✅ ACTUALIZADO: Rango semiabierto sobre el epoch indexado (sin LIKE sobre texto)
+    if start is not None:
+        clauses.append("o.order_date >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("o.order_date < ?")
+        params.append(end)
+
+    if celda:
+        clauses.append("o.celda = ?")
+        params.append(celda)
+
+    if status == 'open':
+        clauses.append("o.is_closed = 0")
+    elif status == 'closed':
+        clauses.append("o.is_closed = 1")
+    elif status:
+        raise ValueError("Estado inválido. Opciones válidas: open, closed")
+
+    return clauses, params
+
+def parse_since(args):
+    """Lee 'since' (última versión de cambios vista por el cliente)"""
+    try:
+        since = int(args.get('since', 0))
+    except ValueError:
+        raise ValueError('El parámetro since debe ser un entero')
+    if since < 0:
+        raise ValueError('El parámetro since no puede ser negativo')
+    return since
+
+def current_change_version(cursor):
+    cursor.execute("SELECT version FROM order_change_counter WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def order_event(cursor, event_type, order_id):
+    """Datos del evento en tiempo real de una orden (leídos antes del commit)"""
+    cursor.execute("SELECT id, order_number, celda, change_version FROM orders WHERE id = ?", (order_id,))
+    return dict(cursor.fetchone(), type=event_type)
+
+db_local = threading.local()
+
+# ✅ NUEVO: Conexiones cuyos cursores registran duración y filas de cada sentencia
+SQLiteConnection = instrumentation.sqlite_connection_class()
+
+def connect_db(synchronous=SQLITE_SYNCHRONOUS):
+    if synchronous.upper() not in SQLITE_SYNCHRONOUS_VALUES:
+        raise ValueError(f'synchronous inválido. Opciones válidas: {", ".join(SQLITE_SYNCHRONOUS_VALUES)}')
+    conn = sqlite3.connect(
+        DATABASE, timeout=SQLITE_BUSY_TIMEOUT, cached_statements=SQLITE_CACHED_STATEMENTS,
+        factory=SQLiteConnection
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {synchronous.upper()}")
+    conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
+def get_db():
+    """Conexión del hilo actual; se abre y configura una sola vez por hilo"""
+    conn = getattr(db_local, 'conn', None)
+    if conn is None:
+        started = time.perf_counter()
+        conn = db_local.conn = connect_db()
+        instrumentation.observe_acquire(time.perf_counter() - started)
+    return conn
+
+group_commit = GroupCommitWriter(
+    lambda: connect_db(GROUP_COMMIT_SYNCHRONOUS),
+    max_batch=GROUP_COMMIT_MAX_BATCH,
+    max_delay=GROUP_COMMIT_MAX_DELAY_MS / 1000
+) if GROUP_COMMIT else None
+
+def write_transaction(db, operation):
+    """Ejecuta operation(cursor) y confirma: en el lote del escritor agrupado o en la conexión del hilo.
+
+    Todas las escrituras de la API pasan por aquí, así con GROUP_COMMIT ninguna
+    compite con el escritor por el lock de SQLite. Solo init_db escribe por su
+    cuenta, antes de atender peticiones.
+    """
+    if group_commit is not None:
+        return group_commit.submit(operation)
+    cursor = db.cursor()
+    try:
+        # Lock de escritura desde el inicio, como en el lote: lo que la
+        # operación lee no cambia antes de que escriba
+        cursor.execute("BEGIN IMMEDIATE")
+        result = operation(cursor)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    db.commit()
+    return result
+
+@app.teardown_appcontext
+def reset_db(error):
+    """Ninguna petición deja una transacción abierta en la conexión del hilo"""
+    conn = getattr(db_local, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+def table_columns(cursor, table):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [column[1] for column in cursor.fetchall()]
+
+def column_type(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    for row in cursor.fetchall():
+        if row[1] == column:
+            return row[2].upper()
+    return None
+
+def migrate_order_date_to_epoch(db):
+    """Reconstruye 'orders' con order_date INTEGER (epoch UTC) a partir del texto local.
+
+    SQLite no permite cambiar el tipo de una columna, así que se copia la
+    tabla. Las claves foráneas se desactivan para que el DROP no borre en
+    cascada los accesorios; índices y triggers se recrean en init_db.
+    """
+    db.commit()
+    db.execute("PRAGMA foreign_keys = OFF")
+    try:
+        cursor = db.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute('''
+            CREATE TABLE orders_typed (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_number TEXT NOT NULL UNIQUE,
+                extra_accessory BOOLEAN NOT NULL,
+                celda TEXT NOT NULL,
+                order_date INTEGER NOT NULL,
+                is_closed BOOLEAN DEFAULT FALSE,
+                accessories_added BOOLEAN DEFAULT FALSE
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO orders_typed (id, order_number, extra_accessory, celda, order_date, is_closed, accessories_added)
+            SELECT id, order_number, extra_accessory, celda,
+                   CAST(strftime('%s', order_date, 'utc') AS INTEGER), is_closed, accessories_added
+            FROM orders
+        ''')
+        cursor.execute("DROP TABLE orders")
+        cursor.execute("ALTER TABLE orders_typed RENAME TO orders")
+        db.commit()
+        print("✅ Migración completada: order_date TEXT → INTEGER (epoch)")
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    finally:
+        db.execute("PRAGMA foreign_keys = ON")
+
 def init_db():
     with app.app_context():
         db = get_db()
         cursor = db.cursor()
-        
-        # ✅ ACTUALIZADO: Crear tabla con columna 'celda' como TEXT para almacenar nombres de celda
+
+        columns = table_columns(cursor, 'orders')
+
+        # ✅ NUEVO: El esquema antiguo guardaba una fila por accesorio en 'orders'.
+        # Se renombra a 'orders_legacy' y se migra por lotes con migrate_legacy_orders()
+        if 'accessory_type' in columns:
+            if 'selected' in columns and 'celda' not in columns:
+                # Migrar de 'selected' a 'celda'
+                cursor.execute('ALTER TABLE orders ADD COLUMN celda TEXT DEFAULT "No especificada"')
+                cursor.execute('UPDATE orders SET celda = CASE WHEN selected = 1 THEN "Celda 10" ELSE "No especificada" END')
+                print("✅ Migración completada: columna 'selected' → 'celda'")
+            cursor.execute('ALTER TABLE orders RENAME TO orders_legacy')
+            print("✅ Tabla 'orders' renombrada a 'orders_legacy' para migrar al esquema normalizado")
+        elif columns and 'celda' not in columns:
+            # Esquema normalizado antiguo (con 'selected' y sin 'celda')
+            cursor.execute('ALTER TABLE orders ADD COLUMN celda TEXT NOT NULL DEFAULT "No especificada"')
+            cursor.execute('UPDATE orders SET celda = CASE WHEN selected = 1 THEN "Celda 10" ELSE "No especificada" END')
+            print("✅ Migración completada: columna 'selected' → 'celda'")
+
+        if columns and 'accessory_type' not in columns and column_type(cursor, 'orders', 'order_date') == 'TEXT':
+            migrate_order_date_to_epoch(db)
+
+        # ✅ ACTUALIZADO: Esquema normalizado (una fila por orden + sus accesorios).
+        # order_date es un epoch UTC en segundos
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS orders (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_number TEXT NOT NULL,
-                accessory_type TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
+                order_number TEXT NOT NULL UNIQUE,
                 extra_accessory BOOLEAN NOT NULL,
                 celda TEXT NOT NULL,
-                order_date TEXT NOT NULL,
+                order_date INTEGER NOT NULL,
                 is_closed BOOLEAN DEFAULT FALSE,
-                accessories_added BOOLEAN DEFAULT FALSE
+                accessories_added BOOLEAN DEFAULT FALSE,
+                change_version INTEGER NOT NULL DEFAULT 0
             )
         ''')
-        
-        # ✅ NUEVO: Verificar si existe la columna 'selected' y migrar datos si es necesario
-        cursor.execute("PRAGMA table_info(orders)")
-        columns = [column[1] for column in cursor.fetchall()]
-        
-        if 'selected' in columns and 'celda' not in columns:
-            # Migrar de 'selected' a 'celda'
-            cursor.execute('ALTER TABLE orders ADD COLUMN celda TEXT DEFAULT "No especificada"')
-            cursor.execute('UPDATE orders SET celda = CASE WHEN selected = 1 THEN "Celda 10" ELSE "No especificada" END')
-            print("✅ Migración completada: columna 'selected' → 'celda'")
-        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS order_accessories (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER NOT NULL REFERENCES orders (id) ON DELETE CASCADE,
+                accessory_type TEXT NOT NULL,
+                quantity INTEGER NOT NULL
+            )
+        ''')
+
+        # ✅ NUEVO: Índices para listado paginado, filtros y cierre de órdenes
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_date_id ON orders (order_date, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_celda_date ON orders (celda, order_date, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_closed_date ON orders (is_closed, order_date, id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_accessories_order_id ON order_accessories (order_id)")
+
+        init_search_index(cursor)
+        init_change_feed(cursor)
+        init_archive(cursor)
+        init_stats(cursor)
+
+        if 'orders_legacy' in table_names(cursor):
+            # Las órdenes migradas conservan su id original; las nuevas deben empezar después
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'orders_legacy'")
+            legacy_seq = cursor.fetchone()
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'orders'")
+            if legacy_seq and cursor.fetchone() is None:
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('orders', ?)", (legacy_seq[0],))
+
         db.commit()
 
+    # ✅ NUEVO: Cargar las órdenes abiertas en el índice en memoria (si está activo)
+    if open_orders is not None:
+        open_orders.warm(fetch_open_orders)
+
+def init_search_index(cursor):
+    """Crea el índice FTS5 'orders_search' y los triggers que lo mantienen.
+
+    Una fila por orden (rowid = orders.id) con número de orden, celda y los
+    tipos de accesorio. Si SQLite no trae FTS5 la búsqueda sigue con LIKE.
+    """
+    global SEARCH_INDEX_ENABLED
+
+    created = 'orders_search' not in table_names(cursor)
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS orders_search USING fts5(
+                order_number, celda, accessories, tokenize = 'trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Índice de búsqueda FTS5 no disponible, se usará LIKE: {e}")
+        SEARCH_INDEX_ENABLED = False
+        return
+
+    # Mientras 'search_index_deferred' tenga filas (solo dentro de la transacción
+    # de una importación masiva) el índice se rellena por lotes en lugar de por fila
+    cursor.execute("CREATE TABLE IF NOT EXISTS search_index_deferred (id INTEGER PRIMARY KEY)")
+    cursor.execute("DROP TRIGGER IF EXISTS orders_search_insert")
+    cursor.execute('''
+        CREATE TRIGGER orders_search_insert AFTER INSERT ON orders
+        WHEN NOT EXISTS (SELECT 1 FROM search_index_deferred) BEGIN
+            INSERT INTO orders_search (rowid, order_number, celda, accessories)
+            VALUES (new.id, new.order_number, new.celda, '');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS orders_search_update AFTER UPDATE OF order_number, celda ON orders BEGIN
+            UPDATE orders_search SET order_number = new.order_number, celda = new.celda
+            WHERE rowid = new.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS orders_search_delete AFTER DELETE ON orders BEGIN
+            DELETE FROM orders_search WHERE rowid = old.id;
+        END
+    ''')
+    cursor.execute("DROP TRIGGER IF EXISTS orders_search_accessory")
+    cursor.execute('''
+        CREATE TRIGGER orders_search_accessory AFTER INSERT ON order_accessories
+        WHEN NOT EXISTS (SELECT 1 FROM search_index_deferred) BEGIN
+            UPDATE orders_search SET accessories = accessories || ' ' || new.accessory_type
+            WHERE rowid = new.order_id;
+        END
+    ''')
+
+    cursor.execute("DELETE FROM search_index_deferred")
+    if created:
+        # Rellenar el índice con las órdenes existentes
+        fill_search_index(cursor)
+
+    SEARCH_INDEX_ENABLED = True
+
+def fill_search_index(cursor, after_id=0):
+    """Indexa en bloque las órdenes con id > after_id (con sus accesorios)"""
+    cursor.execute('''
+        INSERT INTO orders_search (rowid, order_number, celda, accessories)
+        SELECT o.id, o.order_number, o.celda,
+               COALESCE((SELECT GROUP_CONCAT(accessory_type, ' ') FROM order_accessories WHERE order_id = o.id), '')
+        FROM orders o
+        WHERE o.id > ?
+    ''', (after_id,))
+
+def init_change_feed(cursor):
+    """Versión de cambios monótona por orden para /api/get_order_changes.
+
+    Cada alta o modificación de una orden (incluido el cierre) toma la
+    siguiente versión de 'order_change_counter'. Se usa un contador en lugar
+    de MAX(change_version) para que la versión nunca retroceda aunque se
+    borren órdenes.
+    """
+    if 'change_version' not in table_columns(cursor, 'orders'):
+        cursor.execute("ALTER TABLE orders ADD COLUMN change_version INTEGER NOT NULL DEFAULT 0")
+        # Las órdenes existentes reciben una versión única (su id)
+        cursor.execute("UPDATE orders SET change_version = id")
+        print("✅ Migración completada: columna 'change_version'")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_change_version ON orders (change_version)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_change_counter (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO order_change_counter (id, version)
+        SELECT 1, COALESCE(MAX(change_version), 0) FROM orders
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS orders_change_insert AFTER INSERT ON orders BEGIN
+            UPDATE order_change_counter SET version = version + 1 WHERE id = 1;
+            UPDATE orders SET change_version = (SELECT version FROM order_change_counter WHERE id = 1)
+            WHERE id = new.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS orders_change_update
+        AFTER UPDATE OF order_number, extra_accessory, celda, order_date, is_closed, accessories_added ON orders BEGIN
+            UPDATE order_change_counter SET version = version + 1 WHERE id = 1;
+            UPDATE orders SET change_version = (SELECT version FROM order_change_counter WHERE id = 1)
+            WHERE id = new.id;
+        END
+    ''')
+
+def init_archive(cursor):
+    """Tablas de archivo para las órdenes cerradas antiguas (archive_closed_orders).
+
+    Las vistas orders_all / order_accessories_all unen las tablas activas con
+    las de archivo para las consultas con archived=1. Un número de orden
+    archivado sigue ocupado: el trigger rechaza volver a darlo de alta.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders_archive (
+            id INTEGER PRIMARY KEY,
+            order_number TEXT NOT NULL UNIQUE,
+            extra_accessory BOOLEAN NOT NULL,
+            celda TEXT NOT NULL,
+            order_date INTEGER NOT NULL,
+            is_closed BOOLEAN DEFAULT FALSE,
+            accessories_added BOOLEAN DEFAULT FALSE,
+            change_version INTEGER NOT NULL DEFAULT 0,
+            archived_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_accessories_archive (
+            id INTEGER PRIMARY KEY,
+            order_id INTEGER NOT NULL REFERENCES orders_archive (id) ON DELETE CASCADE,
+            accessory_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_archive_date_id ON orders_archive (order_date, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_archive_celda_date ON orders_archive (celda, order_date, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_accessories_archive_order_id ON order_accessories_archive (order_id)")
+
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS orders_all AS
+        SELECT id, order_number, extra_accessory, celda, order_date, is_closed, accessories_added, change_version
+        FROM orders
+        UNION ALL
+        SELECT id, order_number, extra_accessory, celda, order_date, is_closed, accessories_added, change_version
+        FROM orders_archive
+    ''')
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS order_accessories_all AS
+        SELECT id, order_id, accessory_type, quantity FROM order_accessories
+        UNION ALL
+        SELECT id, order_id, accessory_type, quantity FROM order_accessories_archive
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS orders_archived_number BEFORE INSERT ON orders
+        WHEN EXISTS (SELECT 1 FROM orders_archive WHERE order_number = new.order_number)
+        BEGIN
+            SELECT RAISE(ABORT, 'UNIQUE constraint failed: orders.order_number');
+        END
+    ''')
+
+def local_hour(column):
+    """SQL: inicio (epoch) de la hora local de `column`.
+
+    Con la hora local, y no la de UTC, un bucket nunca cruza el cambio de día
+    local aunque la zona tenga un desfase de media hora (p. ej. UTC+5:30).
+    """
+    return f"({column} - CAST(strftime('%s', {column}, 'unixepoch', 'localtime') AS INTEGER) % 3600)"
+
+def local_hour_start(epoch):
+    return epoch - (epoch + time.localtime(epoch).tm_gmtoff) % 3600
+
+def replace_trigger(cursor, name, sql):
+    """Crea el trigger, o lo reemplaza si su definición guardada es otra"""
+    sql = sql.strip()
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,))
+    row = cursor.fetchone()
+    if row is not None and row[0] == sql:
+        return
+    if row is not None:
+        cursor.execute(f"DROP TRIGGER {name}")
+    cursor.execute(sql)
+
+def init_stats(cursor):
+    """Tablas de resumen por hora para /api/stats, mantenidas por triggers.
+
+    Los contadores se actualizan en la misma transacción que la escritura
+    (alta, cierre, importación o cierre masivo), así que las estadísticas se
+    leen en O(buckets) y nunca quedan desfasadas. El bucket es el inicio de la
+    hora local (epoch) de order_date; las órdenes archivadas o borradas siguen
+    contando.
+    """
+    existing = table_names(cursor)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_stats_hourly (
+            bucket INTEGER NOT NULL,
+            celda TEXT NOT NULL,
+            orders INTEGER NOT NULL DEFAULT 0,
+            closed INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, celda)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS accessory_stats_hourly (
+            bucket INTEGER NOT NULL,
+            celda TEXT NOT NULL,
+            accessory_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            closed_quantity INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, celda, accessory_type)
+        )
+    ''')
+
+    # ✅ ACTUALIZADO: Los triggers se reemplazan si su definición cambió (antes
+    # el bucket era la hora UTC)
+    replace_trigger(cursor, 'orders_stats_insert', '''
+        CREATE TRIGGER orders_stats_insert AFTER INSERT ON orders BEGIN
+            INSERT INTO order_stats_hourly (bucket, celda, orders, closed)
+            VALUES ({new_bucket}, new.celda, 1, COALESCE(new.is_closed, 0))
+            ON CONFLICT (bucket, celda) DO UPDATE SET
+                orders = orders + 1,
+                closed = closed + excluded.closed;
+        END
+    '''.format(new_bucket=local_hour('new.order_date')))
+    replace_trigger(cursor, 'orders_stats_close', '''
+        CREATE TRIGGER orders_stats_close AFTER UPDATE OF is_closed ON orders
+        WHEN COALESCE(old.is_closed, 0) != COALESCE(new.is_closed, 0) BEGIN
+            UPDATE order_stats_hourly
+            SET closed = closed + (CASE WHEN new.is_closed THEN 1 ELSE -1 END)
+            WHERE bucket = {new_bucket} AND celda = new.celda;
+            UPDATE accessory_stats_hourly
+            SET closed_quantity = closed_quantity + (CASE WHEN new.is_closed THEN 1 ELSE -1 END) * (
+                SELECT SUM(quantity) FROM order_accessories
+                WHERE order_id = new.id AND accessory_type = accessory_stats_hourly.accessory_type
+            )
+            WHERE bucket = {new_bucket} AND celda = new.celda
+              AND accessory_type IN (SELECT accessory_type FROM order_accessories WHERE order_id = new.id);
+        END
+    '''.format(new_bucket=local_hour('new.order_date')))
+    replace_trigger(cursor, 'order_accessories_stats_insert', '''
+        CREATE TRIGGER order_accessories_stats_insert AFTER INSERT ON order_accessories BEGIN
+            INSERT INTO accessory_stats_hourly (bucket, celda, accessory_type, quantity, closed_quantity)
+            SELECT {order_bucket}, o.celda, new.accessory_type, new.quantity,
+                   CASE WHEN o.is_closed THEN new.quantity ELSE 0 END
+            FROM orders o WHERE o.id = new.order_id
+            ON CONFLICT (bucket, celda, accessory_type) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                closed_quantity = closed_quantity + excluded.closed_quantity;
+        END
+    '''.format(order_bucket=local_hour('o.order_date')))
+
+    # Rellenar los resúmenes con las órdenes existentes, o recalcularlos si
+    # tienen buckets que no empiezan en una hora local (esquema anterior en
+    # una zona de media hora, o cambio de zona horaria del servidor)
+    cursor.execute(f"SELECT 1 FROM order_stats_hourly WHERE bucket != {local_hour('bucket')} LIMIT 1")
+    if 'order_stats_hourly' not in existing or cursor.fetchone() is not None:
+        rebuild_stats(cursor)
+
+def rebuild_stats(cursor):
+    """Recalcula las tablas de resumen desde las órdenes activas y archivadas"""
+    cursor.execute("DELETE FROM order_stats_hourly")
+    cursor.execute("DELETE FROM accessory_stats_hourly")
+    cursor.execute(f'''
+        INSERT INTO order_stats_hourly (bucket, celda, orders, closed)
+        SELECT {local_hour('order_date')}, celda, COUNT(*), SUM(COALESCE(is_closed, 0))
+        FROM orders_all
+        GROUP BY 1, 2
+    ''')
+    cursor.execute(f'''
+        INSERT INTO accessory_stats_hourly (bucket, celda, accessory_type, quantity, closed_quantity)
+        SELECT {local_hour('o.order_date')}, o.celda, oa.accessory_type,
+               SUM(oa.quantity), SUM(CASE WHEN o.is_closed THEN oa.quantity ELSE 0 END)
+        FROM order_accessories_all oa
+        JOIN orders_all o ON o.id = oa.order_id
+        GROUP BY 1, 2, 3
+    ''')
+
+def table_names(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return [row[0] for row in cursor.fetchall()]
+
+MIGRATION_BATCH_SIZE = 2000
+
+def migrate_legacy_batch(cursor, batch_size):
+    """Migra el siguiente lote de 'orders_legacy'; devuelve las filas migradas (0: tabla migrada y borrada)"""
+    cursor.execute("SELECT * FROM orders_legacy ORDER BY id LIMIT ?", (batch_size,))
+    rows = cursor.fetchall()
+
+    if not rows:
+        cursor.execute("DROP TABLE orders_legacy")
+        # Las filas legadas de una misma orden pueden mover su fecha entre lotes
+        rebuild_stats(cursor)
+        return 0
+
+    # La primera fila de cada orden (menor id) fija el id de la orden
+    cursor.executemany(
+        """
+        INSERT INTO orders (id, order_number, extra_accessory, celda, order_date, is_closed, accessories_added)
+        VALUES (?, ?, ?, ?, CAST(strftime('%s', ?, 'utc') AS INTEGER), ?, ?)
+        ON CONFLICT (order_number) DO UPDATE SET
+            extra_accessory = MAX(extra_accessory, excluded.extra_accessory),
+            order_date = MAX(order_date, excluded.order_date),
+            is_closed = MAX(is_closed, excluded.is_closed),
+            accessories_added = MAX(accessories_added, excluded.accessories_added)
+        """,
+        [
+            (
+                row['id'],
+                row['order_number'],
+                row['extra_accessory'],
+                row['celda'] or 'No especificada',
+                row['order_date'],
+                row['is_closed'] or 0,
+                row['accessories_added'] or 0
+            )
+            for row in rows
+        ]
+    )
+    cursor.executemany(
+        "INSERT INTO order_accessories (order_id, accessory_type, quantity) "
+        "SELECT id, ?, ? FROM orders WHERE order_number = ?",
+        [(row['accessory_type'], row['quantity'], row['order_number']) for row in rows]
+    )
+    cursor.execute("DELETE FROM orders_legacy WHERE id <= ?", (rows[-1]['id'],))
+    return len(rows)
+
+def migrate_legacy_orders(batch_size=MIGRATION_BATCH_SIZE, pause=0, on_batch=None):
+    """Migra 'orders_legacy' (una fila por accesorio) al esquema normalizado.
+
+    Cada lote es una transacción corta (write_transaction), así que otras
+    escrituras entran entre lotes (`pause` segundos de respiro tras cada uno).
+    Las filas migradas se borran en el mismo lote, por lo que la migración se
+    puede interrumpir y reanudar. `on_batch(filas)` se llama tras cada commit.
+    Devuelve las filas migradas.
+    """
+    db = get_db()
+    cursor = db.cursor()
+    migrated = 0
+
+    try:
+        while 'orders_legacy' in table_names(cursor):
+            rows = write_transaction(db, lambda batch_cursor: migrate_legacy_batch(batch_cursor, batch_size))
+            if not rows:
+                print(f"✅ Migración al esquema normalizado completada ({migrated} filas)")
+                break
+            migrated += rows
+            if on_batch is not None:
+                on_batch(rows)
+            if pause:
+                time.sleep(pause)
+    finally:
+        cursor.close()
+
+    return migrated
+
+# ✅ NUEVO: La migración de 'orders_legacy' corre en segundo plano después del
+# arranque: el worker atiende peticiones mientras tanto (las órdenes aparecen
+# en los listados y en el feed de cambios lote a lote) y un orders.db grande
+# no retrasa el arranque hasta el timeout de gunicorn
+# Lotes pequeños y una pausa entre ellos: las altas esperan como mucho un lote
+LEGACY_MIGRATION_BATCH_SIZE = int(os.getenv('LEGACY_MIGRATION_BATCH_SIZE', '500'))
+LEGACY_MIGRATION_PAUSE_MS = float(os.getenv('LEGACY_MIGRATION_PAUSE_MS', '50'))
+legacy_migration = {'pending': 0, 'running': 0, 'migrated_rows': 0}
+
+def legacy_batch_migrated(rows):
+    legacy_migration['migrated_rows'] += rows
+    response_cache.invalidate()
+    sync_open_orders()
+
+def run_legacy_migration():
+    """Migra 'orders_legacy' si existe; con varios procesos, solo uno a la vez (bloqueo de archivo)"""
+    import fcntl
+
+    with open(DATABASE + '.migrate.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        legacy_migration['running'] = 1
+        try:
+            # Las altas buscan su número en 'orders_legacy' mientras se migra
+            write_transaction(get_db(), lambda cursor: cursor.execute(
+                "CREATE INDEX IF NOT EXISTS orders_legacy_number ON orders_legacy (order_number)"
+            ))
+            migrate_legacy_orders(
+                LEGACY_MIGRATION_BATCH_SIZE, pause=LEGACY_MIGRATION_PAUSE_MS / 1000, on_batch=legacy_batch_migrated
+            )
+        except (sqlite3.Error, WriterClosed) as e:
+            print(f"⚠️ Migración de 'orders_legacy' interrumpida ({e}); se reanuda en el próximo arranque")
+            return
+        finally:
+            legacy_migration['running'] = 0
+        legacy_migration['pending'] = 0
+    # Los tableros recargan con el esquema completo
+    order_events.publish({'type': RESYNC})
+
+def start_legacy_migration():
+    cursor = get_db().cursor()
+    try:
+        pending = 'orders_legacy' in table_names(cursor)
+    finally:
+        cursor.close()
+    if pending:
+        # Desde ahora las altas comprueban 'orders_legacy' (ver legacy_order_exists)
+        legacy_migration['pending'] = 1
+        threading.Thread(target=run_legacy_migration, name='legacy-migration', daemon=True).start()
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+class OrderNumberExists(Exception):
+    """El número de orden ya está en 'orders' o pendiente de migrar en 'orders_legacy'"""
+
+def pending_legacy_numbers(cursor, numbers):
+    """Números de `numbers` que siguen en 'orders_legacy' mientras la migración está pendiente.
+
+    La migración fusiona por order_number las filas legadas de una misma orden
+    (ON CONFLICT DO UPDATE); una orden nueva con uno de esos números se
+    fusionaría con la legada al migrarse, así que se rechaza como duplicada.
+    """
+    if not legacy_migration['pending']:
+        return set()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'orders_legacy'")
+    if cursor.fetchone() is None:
+        # Migrada (quizá por otro proceso): no hace falta volver a comprobar
+        legacy_migration['pending'] = 0
+        return set()
+    cursor.execute(
+        "SELECT DISTINCT order_number FROM orders_legacy WHERE order_number IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(numbers)),)
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+def is_duplicate_order_number(error):
+    return 'UNIQUE constraint failed: orders.order_number' in str(error)
+
+def insert_order(cursor, data):
+    """Inserta la orden y sus accesorios; devuelve (order_id, evento) sin confirmar"""
+    # ✅ NUEVO: Si un lote de la migración mueve el número a 'orders' entre la
+    # comprobación y el INSERT, lo rechaza la restricción UNIQUE
+    if pending_legacy_numbers(cursor, [data['order_number']]):
+        raise OrderNumberExists(data['order_number'])
+    # ✅ ACTUALIZADO: Una fila en 'orders' y una por accesorio en 'order_accessories'
+    cursor.execute(
+        "INSERT INTO orders (order_number, extra_accessory, celda, order_date) VALUES (?, ?, ?, ?)",
+        (
+            data['order_number'],
+            data['extra_accessory'],
+            data['celda'],
+            int(time.time())
+        )
+    )
+    order_id = cursor.lastrowid
+
+    # ✅ ACTUALIZADO: Todos los accesorios en una sola llamada (executemany)
+    cursor.executemany(
+        "INSERT INTO order_accessories (order_id, accessory_type, quantity) VALUES (?, ?, ?)",
+        [(order_id, accessory['accessory_type'], accessory['quantity']) for accessory in data['accessories']]
+    )
+    return order_id, order_event(cursor, ORDER_CREATED, order_id)
+
 @app.route('/api/add_order', methods=['POST'])
 def add_order():
     data = request.get_json()
+    # ✅ ACTUALIZADO: La conexión se obtiene antes del try (el rollback la necesita)
+    db = get_db()
     try:
         # ✅ ACTUALIZADO: Validar datos requeridos con nueva estructura
         required_fields = ['order_number', 'accessories', 'extra_accessory', 'celda']
@@ -66,30 +895,26 @@ def add_order():
             return jsonify({'error': 'Faltan campos requeridos'}), 400
 
         # ✅ NUEVO: Validar que celda sea una de las opciones válidas
-        valid_celdas = ['Celda 10', 'Celda 11', 'Celda 15', 'Celda 16']
-        if data['celda'] not in valid_celdas:
-            return jsonify({'error': f'Celda inválida. Opciones válidas: {", ".join(valid_celdas)}'}), 400
+        if data['celda'] not in VALID_CELDAS:
+            return jsonify({'error': f'Celda inválida. Opciones válidas: {", ".join(VALID_CELDAS)}'}), 400
 
-        db = get_db()
-        cursor = db.cursor()
-        
-        # ✅ ACTUALIZADO: Insertar múltiples accesorios de una orden
-        for accessory in data['accessories']:
-            cursor.execute(
-                "INSERT INTO orders (order_number, accessory_type, quantity, extra_accessory, celda, order_date) VALUES (?, ?, ?, ?, ?, ?)",
-                (
-                    data['order_number'],
-                    accessory['accessory_type'],
-                    accessory['quantity'],
-                    data['extra_accessory'],
-                    data['celda'],  # ✅ CAMBIADO: usar 'celda' en lugar de 'selected'
-                    datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                )
-            )
-        
-        db.commit()
-        return jsonify({'message': 'Orden agregada exitosamente'}), 201
+        # ✅ ACTUALIZADO: Alta confirmada por sí sola o en el lote del escritor agrupado
+        order_id, event = write_transaction(db, lambda cursor: insert_order(cursor, data))
+        response_cache.invalidate()
+        sync_open_orders()
+        order_events.publish(event)
+        return jsonify({'message': 'Orden agregada exitosamente', 'order_id': order_id}), 201
         
+    except OrderNumberExists:
+        db.rollback()
+        return jsonify({'error': 'El número de orden ya existe'}), 400
+    except sqlite3.IntegrityError as e:
+        db.rollback()
+        # ✅ ACTUALIZADO: Solo la restricción UNIQUE de order_number es un duplicado;
+        # NOT NULL, CHECK o claves foráneas son datos inválidos
+        if is_duplicate_order_number(e):
+            return jsonify({'error': 'El número de orden ya existe'}), 400
+        return jsonify({'error': f'Datos de orden inválidos: {str(e)}'}), 400
     except sqlite3.Error as e:
         db.rollback()
         return jsonify({'error': f'Error de base de datos: {str(e)}'}), 500
@@ -97,66 +922,414 @@ def add_order():
         return jsonify({'error': f'Error inesperado: {str(e)}'}), 500
 
 @app.route('/api/get_orders', methods=['GET'])
+@response_cache.cached
 def get_orders():
-    search_term = request.args.get('search', '')
-    date_filter = request.args.get('date', '')
-    
+    """Lista órdenes paginadas por cursor (order_date, id), más recientes primero.
+
+    Parámetros: search (o q), date, celda, status (open/closed), limit, cursor,
+    count=1 y archived=1 (incluir órdenes archivadas). El siguiente cursor se devuelve en la cabecera X-Next-Cursor y el
+    total (solo si count=1) en X-Total-Count. Con sort=relevance y un término
+    de búsqueda se devuelven las `limit` órdenes mejor puntuadas (bm25), sin cursor.
+    """
+    try:
+        search_term = get_search_term(request.args)
+        relevance = (
+            request.args.get('sort') == 'relevance' and uses_search_index(search_term)
+            and not include_archived(request.args)
+        )
+        clauses, params = build_order_filters(request.args, include_search=not relevance)
+        orders_table, accessories_table = order_tables(request.args)
+        limit = parse_page_size(request.args)
+        cursor_token = request.args.get('cursor', '')
+        position = decode_cursor(cursor_token) if cursor_token else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # ✅ NUEVO: Órdenes abiertas desde el índice en memoria, sin consultar la base
+    if open_orders_servable(request.args):
+        return open_orders_page(request.args, limit, position)
+
     db = get_db()
     cursor = db.cursor()
+
+    # ✅ NUEVO: Versión de cambios leída antes de la página; el cliente la usa
+    # como 'since' en /api/get_order_changes (puede repetir algún cambio, nunca perderlo)
+    change_version = current_change_version(cursor)
     
-    # ✅ ACTUALIZADO: Agrupar accesorios por número de orden
+    page_clauses = list(clauses)
+    query_params = list(params)
+    from_sql = f"{orders_table} o"
+    order_sql = "o.order_date DESC, o.id DESC"
+
+    if relevance:
+        # ✅ NUEVO: Ordenar por relevancia con el ranking de FTS5
+        from_sql = "orders_search s JOIN orders o ON o.id = s.rowid"
+        page_clauses.insert(0, "orders_search MATCH ?")
+        query_params.insert(0, fts_phrase(search_term))
+        order_sql = "s.rank, o.id DESC"
+    elif position:
+        # ✅ NUEVO: Keyset pagination - continuar después de la última orden vista
+        page_clauses.append("(o.order_date, o.id) < (?, ?)")
+        query_params.extend(position)
+
+    # ✅ ACTUALIZADO: Paginar sobre 'orders' por índice; los accesorios de cada
+    # orden de la página llegan ya estructurados como JSON (json_group_array)
     query = """
         SELECT 
-            MIN(id) as id,
-            order_number,
-            GROUP_CONCAT(accessory_type || ' (x' || quantity || ')') as accessories,
-            MAX(extra_accessory) as extra_accessory,
-            MAX(celda) as celda,
-            MAX(order_date) as order_date,
-            MAX(is_closed) as is_closed,
-            MAX(accessories_added) as accessories_added
-        FROM orders 
-        WHERE 1=1
-    """
-    params = []
-    
-    if search_term:
-        query += " AND (order_number LIKE ? OR accessory_type LIKE ? OR celda LIKE ?)"
-        params.extend([f"%{search_term}%", f"%{search_term}%", f"%{search_term}%"])
-    
-    if date_filter:
-        query += " AND order_date LIKE ?"
-        params.append(f"%{date_filter}%")
-    
-    query += " GROUP BY order_number ORDER BY MAX(order_date) DESC"
+            o.id,
+            o.order_number,
+            (
+                SELECT json_group_array(json_object('accessory_type', oa.accessory_type, 'quantity', oa.quantity))
+                FROM (
+                    SELECT accessory_type, quantity FROM {accessories_table}
+                    WHERE order_id = o.id ORDER BY id
+                ) oa
+            ) as accessories,
+            o.extra_accessory,
+            o.celda,
+            datetime(o.order_date, 'unixepoch', 'localtime') as order_date,
+            o.order_date as order_ts,
+            o.is_closed,
+            o.accessories_added,
+            o.change_version
+        FROM {from_sql}
+        WHERE 1=1 {filters}
+        ORDER BY {order_sql}
+        LIMIT ?
+    """.format(
+        from_sql=from_sql,
+        accessories_table=accessories_table,
+        filters=''.join(f" AND {clause}" for clause in page_clauses),
+        order_sql=order_sql
+    )
+    query_params.append(limit + 1)
     
-    cursor.execute(query, params)
+    cursor.execute(query, query_params)
     orders = cursor.fetchall()
+
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        if not relevance:
+            next_cursor = encode_cursor(orders[-1]['order_ts'], orders[-1]['id'])
+
+    total = None
+    if request.args.get('count') == '1':
+        count_query = "SELECT COUNT(*) FROM {from_sql} WHERE 1=1".format(from_sql=from_sql)
+        count_params = list(params)
+        if relevance:
+            count_query += " AND orders_search MATCH ?"
+            count_params.insert(0, fts_phrase(search_term))
+        for clause in clauses:
+            count_query += f" AND {clause}"
+        total = cursor.execute(count_query, count_params).fetchone()[0]
     
-    # ✅ NUEVO: Formatear respuesta para compatibilidad con frontend
-    formatted_orders = []
-    for order in orders:
-        formatted_order = dict(order)
-        # Convertir string de accesorios a lista para compatibilidad
-        if formatted_order['accessories']:
-            accessories_list = []
-            for acc_str in formatted_order['accessories'].split(','):
-                # Parsear "bolsa (x2)" → {"accessory_type": "bolsa", "quantity": 2}
-                if '(x' in acc_str and ')' in acc_str:
-                    acc_type = acc_str.split(' (x')[0].strip()
-                    quantity = int(acc_str.split('(x')[1].split(')')[0])
-                    accessories_list.append({"accessory_type": acc_type, "quantity": quantity})
-            formatted_order['accessories'] = accessories_list
-        else:
-            formatted_order['accessories'] = []
-        
-        formatted_orders.append(formatted_order)
-    
-    return jsonify(formatted_orders)
+    # ✅ ACTUALIZADO: Serializar las filas directamente; los accesorios ya
+    # vienen como texto JSON desde SQLite
+    response = response_encoder.rows_response(orders, drop=('order_ts',), json_columns=('accessories',))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if total is not None:
+        response.headers['X-Total-Count'] = str(total)
+    response.headers['X-Change-Version'] = str(change_version)
+    return response
+
+@app.route('/api/get_order_changes', methods=['GET'])
+def get_order_changes():
+    """Órdenes creadas o modificadas (incluidos cierres) después de la versión 'since'.
+
+    Parámetros: since, limit y celda. Las órdenes se devuelven por versión
+    ascendente; X-Change-Version trae el 'since' de la siguiente llamada y
+    X-Has-More indica si quedan cambios por leer.
+    """
+    try:
+        since = parse_since(request.args)
+        limit = parse_page_size(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    db = get_db()
+    cursor = db.cursor()
+
+    # Todo cambio con versión <= current ya está confirmado: si no hay más
+    # filas, el cliente puede avanzar hasta current sin perder ninguno
+    current = current_change_version(cursor)
+
+    query_params = [since, current]
+    celda_filter = ''
+    if request.args.get('celda'):
+        celda_filter = " AND o.celda = ?"
+        query_params.append(request.args['celda'])
+    query_params.append(limit + 1)
+
+    cursor.execute("""
+        SELECT
+            o.id,
+            o.order_number,
+            (
+                SELECT json_group_array(json_object('accessory_type', oa.accessory_type, 'quantity', oa.quantity))
+                FROM (
+                    SELECT accessory_type, quantity FROM order_accessories
+                    WHERE order_id = o.id ORDER BY id
+                ) oa
+            ) as accessories,
+            o.extra_accessory,
+            o.celda,
+            datetime(o.order_date, 'unixepoch', 'localtime') as order_date,
+            o.is_closed,
+            o.accessories_added,
+            o.change_version
+        FROM orders o
+        WHERE o.change_version > ? AND o.change_version <= ?{celda_filter}
+        ORDER BY o.change_version
+        LIMIT ?
+    """.format(celda_filter=celda_filter), query_params)
+    orders = cursor.fetchall()
+
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    version = orders[-1]['change_version'] if has_more else max(since, current)
+
+    response = response_encoder.rows_response(orders, json_columns=('accessories',))
+    response.headers['X-Change-Version'] = str(version)
+    response.headers['X-Has-More'] = '1' if has_more else '0'
+    return response
+
+# ✅ NUEVO: Índice en memoria de las órdenes abiertas (OPEN_ORDER_INDEX=true).
+# El listado de abiertas sin búsqueda ni fechas y la búsqueda por número se
+# sirven desde memoria; cada escritura lo sincroniza con el feed de cambios.
+# Como el caché de respuestas, supone un solo worker (gunicorn.conf.py)
+OPEN_ORDER_INDEX = os.getenv('OPEN_ORDER_INDEX', 'false').lower() == 'true'
+OPEN_ORDER_COLUMNS = (
+    'id', 'order_number', 'accessories', 'extra_accessory', 'celda', 'order_date',
+    'is_closed', 'accessories_added', 'change_version'
+)
+# Parámetros que el índice no resuelve: con cualquiera de ellos se consulta la base
+OPEN_ORDER_UNINDEXED_FIELDS = ['search', 'q', 'date', 'from', 'to', 'archived', 'sort']
+open_orders = OpenOrderIndex(OPEN_ORDER_COLUMNS, sort_column='order_ts') if OPEN_ORDER_INDEX else None
+
+# Misma forma de fila que get_orders (accesorios como texto JSON)
+ORDER_ROW_SELECT = """
+    SELECT
+        o.id,
+        o.order_number,
+        (
+            SELECT json_group_array(json_object('accessory_type', oa.accessory_type, 'quantity', oa.quantity))
+            FROM (
+                SELECT accessory_type, quantity FROM {accessories_table}
+                WHERE order_id = o.id ORDER BY id
+            ) oa
+        ) as accessories,
+        o.extra_accessory,
+        o.celda,
+        datetime(o.order_date, 'unixepoch', 'localtime') as order_date,
+        o.order_date as order_ts,
+        o.is_closed,
+        o.accessories_added,
+        o.change_version
+    FROM {orders_table} o
+"""
+OPEN_ORDER_SELECT = ORDER_ROW_SELECT.format(orders_table='orders', accessories_table='order_accessories')
+
+def fetch_open_orders():
+    cursor = get_db().cursor()
+    try:
+        # La versión se lee antes: lo que cambie mientras tanto se repite en la siguiente sincronización
+        version = current_change_version(cursor)
+        cursor.execute(OPEN_ORDER_SELECT + " WHERE o.is_closed = 0")
+        return cursor.fetchall(), version
+    finally:
+        cursor.close()
+
+def fetch_open_order_changes(since):
+    cursor = get_db().cursor()
+    try:
+        version = current_change_version(cursor)
+        cursor.execute(
+            OPEN_ORDER_SELECT + " WHERE o.change_version > ? AND o.change_version <= ? ORDER BY o.change_version",
+            (since, version)
+        )
+        return cursor.fetchall(), version
+    finally:
+        cursor.close()
+
+def sync_open_orders():
+    """Aplica al índice las escrituras ya confirmadas (llamar tras el commit).
+
+    Si falla, la escritura ya está hecha: la siguiente sincronización se pone al día.
+    """
+    if open_orders is None:
+        return
+    try:
+        open_orders.sync(fetch_open_order_changes)
+    except sqlite3.Error as e:
+        print(f"⚠️ No se pudo sincronizar el índice de órdenes abiertas: {e}")
+
+def open_orders_servable(args):
+    """El listado pedido son solo órdenes abiertas que el índice puede resolver"""
+    return (
+        open_orders is not None and open_orders.ready and args.get('status') == 'open'
+        and not any(args.get(field) for field in OPEN_ORDER_UNINDEXED_FIELDS)
+    )
+
+def open_orders_page(args, limit, position):
+    """Misma respuesta que get_orders (status=open) servida desde el índice"""
+    records, total, version = open_orders.page(args.get('celda') or None, position, limit + 1)
+
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(*records[-1].sort_key)
+
+    response = response_encoder.rows_response(records, json_columns=('accessories',))
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if args.get('count') == '1':
+        response.headers['X-Total-Count'] = str(total)
+    response.headers['X-Change-Version'] = str(version)
+    return response
+
+@app.route('/api/get_order/<order_number>', methods=['GET'])
+def get_order(order_number):
+    """Una orden por número: las abiertas desde el índice, el resto (cerradas o archivadas) desde la base"""
+    order = open_orders.get(order_number) if open_orders is not None and open_orders.ready else None
+    if order is None:
+        cursor = get_db().cursor()
+        try:
+            cursor.execute(
+                ORDER_ROW_SELECT.format(orders_table='orders_all', accessories_table='order_accessories_all')
+                + " WHERE o.order_number = ?",
+                (order_number,)
+            )
+            order = cursor.fetchone()
+        finally:
+            cursor.close()
+    if order is None:
+        return jsonify({'error': 'Orden no encontrada'}), 404
+    return response_encoder.row_response(order, drop=('order_ts',), json_columns=('accessories',))
+
+# ✅ NUEVO: Estadísticas desde las tablas de resumen por hora (O(buckets))
+STATS_BUCKET_LABELS = {
+    'day': "date(bucket, 'unixepoch', 'localtime')",
+    'hour': "strftime('%Y-%m-%d %H:00', bucket, 'unixepoch', 'localtime')",
+}
+
+@app.route('/api/stats', methods=['GET'])
+@response_cache.cached
+def get_stats():
+    """Órdenes abiertas/cerradas y cantidades de accesorios por celda y día u hora.
+
+    Parámetros: granularity (day/hour), date, from, to y celda.
+    """
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in STATS_BUCKET_LABELS:
+        return jsonify({'error': 'Granularidad inválida. Opciones válidas: day, hour'}), 400
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    clauses = []
+    params = []
+    if start is not None:
+        clauses.append("bucket >= ?")
+        params.append(local_hour_start(start))
+    if end is not None:
+        clauses.append("bucket < ?")
+        params.append(end)
+    if request.args.get('celda'):
+        clauses.append("celda = ?")
+        params.append(request.args['celda'])
+    where = ''.join(f" AND {clause}" for clause in clauses)
+    label = STATS_BUCKET_LABELS[granularity]
+
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute(f"""
+        SELECT {label} AS bucket, celda, SUM(orders) AS orders, SUM(closed) AS closed
+        FROM order_stats_hourly
+        WHERE 1=1 {where}
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """, params)
+    orders = [
+        {
+            'bucket': row['bucket'],
+            'celda': row['celda'],
+            'orders': row['orders'],
+            'open': row['orders'] - row['closed'],
+            'closed': row['closed']
+        }
+        for row in cursor.fetchall()
+    ]
+    cursor.execute(f"""
+        SELECT {label} AS bucket, celda, accessory_type,
+               SUM(quantity) AS quantity, SUM(closed_quantity) AS closed_quantity
+        FROM accessory_stats_hourly
+        WHERE 1=1 {where}
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+    """, params)
+    accessories = [
+        {
+            'bucket': row['bucket'],
+            'celda': row['celda'],
+            'accessory_type': row['accessory_type'],
+            'quantity': row['quantity'],
+            'open_quantity': row['quantity'] - row['closed_quantity'],
+            'closed_quantity': row['closed_quantity']
+        }
+        for row in cursor.fetchall()
+    ]
+    cursor.close()
+
+    total = sum(bucket['orders'] for bucket in orders)
+    closed = sum(bucket['closed'] for bucket in orders)
+    return jsonify({
+        'granularity': granularity,
+        'totals': {'orders': total, 'open': total - closed, 'closed': closed},
+        'orders': orders,
+        'accessories': accessories
+    })
+
+# ✅ NUEVO: Eventos en tiempo real (SSE) para los tableros de órdenes abiertas.
+# El broker es local al proceso: app.py corre en un único proceso con SQLite.
+# Cada flujo ocupa un hilo: más de ORDER_EVENTS_MAX_SUBSCRIBERS responden 503
+order_events = EventBroker(
+    max_queue=int(os.getenv('ORDER_EVENTS_MAX_QUEUE', '100')),
+    max_subscribers=int(os.getenv('ORDER_EVENTS_MAX_SUBSCRIBERS', '64'))
+)
+ORDER_EVENTS_HEARTBEAT = float(os.getenv('ORDER_EVENTS_HEARTBEAT', '15'))
+
+@app.route('/api/order_events', methods=['GET'])
+def order_events_stream():
+    """Flujo SSE con order_created / order_closed (parámetro opcional: celda).
+
+    Tras un evento 'resync' o una reconexión, el cliente debe ponerse al día
+    con /api/get_order_changes.
+    """
+    return event_stream_response(order_events, request.args.get('celda') or None, heartbeat=ORDER_EVENTS_HEARTBEAT)
+
+def close_order_row(cursor, order_id, accessories_added):
+    """Cierra la orden; devuelve (encontrada, evento o None) sin confirmar"""
+    cursor.execute("SELECT is_closed FROM orders WHERE id = ?", (order_id,))
+    previous = cursor.fetchone()
+    if previous is None:
+        return False, None
+
+    # ✅ ACTUALIZADO: Una sola fila por orden, búsqueda por clave primaria
+    cursor.execute(
+        "UPDATE orders SET is_closed = ?, accessories_added = ? WHERE id = ?",
+        (True, accessories_added, order_id)
+    )
+
+    # ✅ NUEVO: Solo se notifica el cierre si la orden estaba abierta
+    return True, order_event(cursor, ORDER_CLOSED, order_id) if not previous['is_closed'] else None
 
 @app.route('/api/close_order', methods=['POST'])
 def close_order():
     data = request.get_json()
+    db = get_db()
     try:
         order_id = data.get('order_id')
         accessories_added = data.get('accessories_added', True)
@@ -164,19 +1337,15 @@ def close_order():
         if not order_id:
             return jsonify({'error': 'ID de orden requerido'}), 400
 
-        db = get_db()
-        cursor = db.cursor()
-        
-        # ✅ ACTUALIZADO: Cerrar todas las entradas de la misma orden
-        cursor.execute(
-            "UPDATE orders SET is_closed = ?, accessories_added = ? WHERE order_number = (SELECT order_number FROM orders WHERE id = ?)",
-            (True, accessories_added, order_id)
-        )
-        
-        if cursor.rowcount == 0:
+        # ✅ ACTUALIZADO: Cierre confirmado por sí solo o en el lote del escritor agrupado
+        found, event = write_transaction(db, lambda cursor: close_order_row(cursor, order_id, accessories_added))
+        if not found:
             return jsonify({'error': 'Orden no encontrada'}), 404
-            
-        db.commit()
+
+        response_cache.invalidate()
+        sync_open_orders()
+        if event:
+            order_events.publish(event)
         return jsonify({'message': 'Orden cerrada exitosamente'}), 200
         
     except sqlite3.Error as e:
@@ -185,118 +1354,483 @@ def close_order():
     except Exception as e:
         return jsonify({'error': f'Error inesperado: {str(e)}'}), 500
 
+# ✅ NUEVO: Cierre masivo (fin de turno)
+BULK_CLOSE_MAX_ITEMS = 10000
+BULK_CLOSE_FILTER_FIELDS = ['celda', 'date', 'from', 'to']
+
+def bulk_close_target(data):
+    """Cláusula (sobre 'o') con las órdenes a cerrar: order_ids, order_numbers o filter.
+
+    Las listas se pasan como un único parámetro JSON (json_each), así la
+    sentencia es la misma sin importar cuántas órdenes se cierren.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('El cuerpo debe ser un objeto JSON')
+    for field, column in (('order_ids', 'o.id'), ('order_numbers', 'o.order_number')):
+        if field not in data:
+            continue
+        values = data[field]
+        if not isinstance(values, list) or not values:
+            raise ValueError(f'{field} debe ser una lista no vacía')
+        if len(values) > BULK_CLOSE_MAX_ITEMS:
+            raise ValueError(f'Máximo {BULK_CLOSE_MAX_ITEMS} órdenes por solicitud')
+        if field == 'order_ids' and not all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            raise ValueError('order_ids debe contener enteros')
+        return f"{column} IN (SELECT value FROM json_each(?))", [json.dumps(values)], field, values
+
+    if 'filter' in data:
+        if not isinstance(data['filter'], dict):
+            raise ValueError('filter debe ser un objeto')
+        filters = {field: value for field, value in data['filter'].items() if field in BULK_CLOSE_FILTER_FIELDS}
+        if not filters:
+            raise ValueError(f'El filtro requiere al menos uno de: {", ".join(BULK_CLOSE_FILTER_FIELDS)}')
+        if not all(isinstance(value, str) for value in filters.values()):
+            raise ValueError(f'Los valores del filtro ({", ".join(filters)}) deben ser texto')
+        clauses, params = build_order_filters(filters, include_search=False)
+        clauses.append("o.is_closed = 0")
+        return ' AND '.join(clauses), params, 'filter', None
+
+    raise ValueError('Se requiere order_ids, order_numbers o filter')
+
+def parse_accessories_added(data, default):
+    """accessories_added del cuerpo: debe ser booleano (no se escribe cualquier valor en la columna)"""
+    value = data.get('accessories_added', default)
+    if not isinstance(value, bool):
+        raise ValueError('accessories_added debe ser true o false')
+    return value
+
+def close_matching_orders(cursor, target_sql, target_params, accessories_added):
+    """Cierra las órdenes abiertas del objetivo; devuelve (encontradas, ids cerrados, eventos) sin confirmar"""
+    cursor.execute(f"SELECT o.id, o.order_number, o.is_closed FROM orders o WHERE {target_sql}", target_params)
+    matched = cursor.fetchall()
+
+    to_close = [row['id'] for row in matched if not row['is_closed']]
+    cursor.execute(
+        "UPDATE orders SET is_closed = 1, accessories_added = ? WHERE id IN (SELECT value FROM json_each(?))",
+        (accessories_added, json.dumps(to_close))
+    )
+    cursor.execute(
+        "SELECT id, order_number, celda, change_version FROM orders WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(to_close),)
+    )
+    events = [dict(row, type=ORDER_CLOSED) for row in cursor.fetchall()]
+    return matched, to_close, events
+
+@app.route('/api/close_orders', methods=['POST'])
+def close_orders():
+    """Cierra varias órdenes con una sola sentencia UPDATE y devuelve el resultado por orden.
+
+    Cuerpo: order_ids, order_numbers o filter ({celda, date, from, to}) y
+    accessories_added. Cada orden solicitada se informa como closed,
+    already_closed o not_found.
+    """
+    # ✅ ACTUALIZADO: JSON inválido o que no es un objeto -> 400 con mensaje
+    data = request.get_json(silent=True) or {}
+    try:
+        target_sql, target_params, mode, requested = bulk_close_target(data)
+        accessories_added = parse_accessories_added(data, True)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # ✅ ACTUALIZADO: Una transacción propia o parte del lote del escritor agrupado
+    try:
+        matched, to_close, events = write_transaction(
+            get_db(), lambda cursor: close_matching_orders(cursor, target_sql, target_params, accessories_added)
+        )
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Error de base de datos: {str(e)}'}), 500
+
+    if events:
+        response_cache.invalidate()
+        sync_open_orders()
+        for event in events:
+            order_events.publish(event)
+
+    results = [
+        {'id': row['id'], 'order_number': row['order_number'], 'result': 'already_closed' if row['is_closed'] else 'closed'}
+        for row in matched
+    ]
+    if requested is not None:
+        key = 'id' if mode == 'order_ids' else 'order_number'
+        found = {result[key] for result in results}
+        results.extend(
+            {key: value, 'result': 'not_found'}
+            for value in dict.fromkeys(requested) if value not in found
+        )
+
+    return jsonify({
+        'message': 'Cierre masivo completado',
+        'closed': len(to_close),
+        'already_closed': sum(1 for result in results if result['result'] == 'already_closed'),
+        'not_found': sum(1 for result in results if result['result'] == 'not_found'),
+        'results': results
+    }), 200
+
+# ✅ NUEVO: Archivo de órdenes cerradas antiguas. Los listados, búsquedas y
+# exportaciones leen solo las tablas activas salvo que se pida archived=1
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = 2000
+
+def archive_batch(cursor, cutoff, batch_size):
+    """Mueve al archivo un lote de órdenes cerradas anteriores a `cutoff`; devuelve cuántas (sin confirmar)"""
+    cursor.execute(
+        "SELECT id FROM orders WHERE is_closed = 1 AND order_date < ? ORDER BY order_date, id LIMIT ?",
+        (cutoff, batch_size)
+    )
+    ids = json.dumps([row[0] for row in cursor.fetchall()])
+    if ids == '[]':
+        return 0
+
+    cursor.execute('''
+        INSERT INTO orders_archive (id, order_number, extra_accessory, celda, order_date, is_closed,
+                                    accessories_added, change_version, archived_at)
+        SELECT id, order_number, extra_accessory, celda, order_date, is_closed,
+               accessories_added, change_version, ?
+        FROM orders WHERE id IN (SELECT value FROM json_each(?))
+    ''', (int(time.time()), ids))
+    count = cursor.rowcount
+    cursor.execute('''
+        INSERT INTO order_accessories_archive (id, order_id, accessory_type, quantity)
+        SELECT id, order_id, accessory_type, quantity
+        FROM order_accessories WHERE order_id IN (SELECT value FROM json_each(?))
+    ''', (ids,))
+    # ON DELETE CASCADE borra los accesorios; el trigger de FTS, la fila del índice
+    cursor.execute("DELETE FROM orders WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+    return count
+
+def archive_closed_orders(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """Mueve a orders_archive las órdenes cerradas con order_date de hace más de `older_than_days` días.
+
+    Cada lote es una transacción corta (write_transaction), así que el proceso
+    se puede interrumpir y reanudar. Las tablas de estadísticas no cambian (las
+    órdenes archivadas siguen contando). Devuelve el número de órdenes archivadas.
+    """
+    cutoff = int(time.time()) - older_than_days * 86400
+    db = get_db()
+    archived = 0
+
+    while True:
+        count = write_transaction(db, lambda cursor: archive_batch(cursor, cutoff, batch_size))
+        if not count:
+            break
+        archived += count
+
+    return archived
+
+@app.route('/api/archive_orders', methods=['POST'])
+def archive_orders():
+    """Archiva las órdenes cerradas antiguas (older_than_days, por defecto ARCHIVE_AFTER_DAYS).
+
+    Pensado para ejecutarse periódicamente (cron); las órdenes archivadas se
+    consultan con archived=1 en get_orders, search_orders y exportaciones.
+    """
+    data = request.get_json(silent=True) or {}
+    older_than_days = data.get('older_than_days', ARCHIVE_AFTER_DAYS)
+    if not isinstance(older_than_days, int) or isinstance(older_than_days, bool) or older_than_days < 0:
+        return jsonify({'error': 'older_than_days debe ser un entero no negativo'}), 400
+
+    try:
+        archived = archive_closed_orders(older_than_days)
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Error de base de datos: {str(e)}'}), 500
+
+    if archived:
+        response_cache.invalidate()
+        order_events.publish({'type': ORDERS_ARCHIVED, 'archived': archived})
+
+    return jsonify({
+        'message': 'Archivo completado',
+        'archived': archived,
+        'older_than_days': older_than_days
+    }), 200
+
 @app.route('/api/search_orders', methods=['GET'])
 def search_orders():
-    search_term = request.args.get('q', '')
-    date_filter = request.args.get('date', '')
-    
-    # ✅ REUTILIZAR: Usar la misma lógica que get_orders
+    # ✅ REUTILIZAR: Usar la misma lógica que get_orders ('q' se acepta como término)
     return get_orders()
 
-@app.route('/api/export_excel', methods=['GET'])
-def export_excel():
+# ✅ NUEVO: Importación masiva (CSV/XLSX con el formato de export_excel)
+IMPORT_BATCH_SIZE = 2000
+IMPORT_MAX_ERRORS = 1000
+SQLITE_MAX_PARAMS = 500
+
+def chunked(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def import_batch(cursor, orders, accessories):
+    """Inserta un lote del manifiesto; devuelve (órdenes insertadas, números que ya existían) sin confirmar"""
+    # AUTOINCREMENT: las órdenes de este lote tendrán id > last_id
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM orders")
+    last_id = cursor.fetchone()[0]
+    if SEARCH_INDEX_ENABLED:
+        cursor.execute("INSERT INTO search_index_deferred (id) VALUES (1)")
+
+    existing = set()
+    for numbers in chunked([order[0] for order in orders], SQLITE_MAX_PARAMS):
+        cursor.execute(
+            "SELECT order_number FROM orders_all WHERE order_number IN ({})".format(','.join('?' * len(numbers))),
+            numbers
+        )
+        existing.update(row[0] for row in cursor.fetchall())
+    # ✅ NUEVO: Tampoco los que siguen pendientes de migrar
+    existing.update(pending_legacy_numbers(cursor, [order[0] for order in orders]))
+
+    new_orders = [
+        (number, extra, celda, order_date, closed, added)
+        for number, extra, _, celda, order_date, closed, added in orders
+        if number not in existing
+    ]
+    cursor.executemany(
+        "INSERT INTO orders (order_number, extra_accessory, celda, order_date, is_closed, accessories_added) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        new_orders
+    )
+
+    cursor.execute("SELECT id, order_number FROM orders WHERE id > ?", (last_id,))
+    order_ids = {row[1]: row[0] for row in cursor.fetchall()}
+
+    cursor.executemany(
+        "INSERT INTO order_accessories (order_id, accessory_type, quantity) VALUES (?, ?, ?)",
+        [
+            (order_ids[number], accessory_type, quantity)
+            for number, accessory_type, quantity in accessories
+            if number in order_ids
+        ]
+    )
+    if SEARCH_INDEX_ENABLED:
+        fill_search_index(cursor, last_id)
+        cursor.execute("DELETE FROM search_index_deferred")
+    return len(new_orders), existing
+
+def import_manifest(manifest):
+    """Escribe las órdenes del manifiesto en transacciones de IMPORT_BATCH_SIZE órdenes (write_transaction).
+
+    Devuelve (importadas, errores); las órdenes que ya existen se informan como error.
+    """
+    db = get_db()
+    imported = 0
+    errors = []
+
+    for orders, accessories in batches(manifest, IMPORT_BATCH_SIZE):
+        count, existing = write_transaction(db, lambda cursor: import_batch(cursor, orders, accessories))
+        imported += count
+        errors.extend(
+            {'row': manifest.rows[number], 'order_number': number, 'error': 'El número de orden ya existe'}
+            for number in sorted(existing, key=manifest.rows.get)
+        )
+
+    return imported, errors
+
+@app.route('/api/import_orders', methods=['POST'])
+def import_orders():
+    """Importa un manifiesto CSV/XLSX (campo 'file') y devuelve el resultado por fila"""
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'Archivo requerido (campo file)'}), 400
+
+    try:
+        manifest = read_manifest(upload.stream, upload.filename, valid_celdas=VALID_CELDAS)
+        imported, write_errors = import_manifest(manifest)
+    except ManifestError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.Error as e:
+        return jsonify({'error': f'Error de base de datos: {str(e)}'}), 500
+
+    if imported:
+        response_cache.invalidate()
+        sync_open_orders()
+        # Demasiados eventos para enviarlos uno a uno: los tableros se resincronizan
+        order_events.publish({'type': RESYNC})
+
+    errors = sorted(manifest.errors + write_errors, key=lambda error: error['row'])
+    return jsonify({
+        'message': 'Importación completada',
+        'imported': imported,
+        'rejected': len({error['order_number'] for error in errors}),
+        'errors': errors[:IMPORT_MAX_ERRORS],
+        'errors_truncated': len(errors) > IMPORT_MAX_ERRORS
+    }), 200
+
+EXCEL_HEADER = ['Número de Orden', 'Accesorios', 'Accesorio Extra', 'Celda', 'Fecha de Orden', 'Estado']
+EXPORT_FETCH_SIZE = 1000
+EXPORT_FILTER_FIELDS = ['search', 'q', 'date', 'from', 'to', 'celda', 'status', 'archived']
+
+# ✅ NUEVO: Cola de exportaciones en segundo plano (pool acotado, deduplicación y TTL)
+export_jobs = ExportJobManager(
+    max_workers=int(os.getenv('EXPORT_WORKERS', '2')),
+    max_pending=int(os.getenv('EXPORT_MAX_PENDING', '20')),
+    ttl=int(os.getenv('EXPORT_JOB_TTL', '300')),
+    directory=os.getenv('EXPORT_JOB_DIR'),
+    context=app.app_context
+)
+
+def open_excel_rows(args, job=None):
+    """Ejecuta la consulta de exportación y devuelve un generador de filas.
+
+    Los filtros se validan antes de devolver el generador (ValueError); el
+    cursor se cierra cuando el generador se agota o se cierra.
+    """
+    clauses, params = build_order_filters(args)
+    orders_table, accessories_table = order_tables(args)
+
     db = get_db()
     cursor = db.cursor()
+    cursor.arraysize = EXPORT_FETCH_SIZE
     
-    # ✅ ACTUALIZADO: Exportar con nueva estructura
+    # ✅ ACTUALIZADO: Recorrer 'orders' por índice sin GROUP BY; las filas se
+    # leen del cursor a medida que se escribe el archivo
     cursor.execute("""
         SELECT 
-            order_number as 'Número de Orden',
-            GROUP_CONCAT(accessory_type || ' (x' || quantity || ')') as 'Accesorios',
-            CASE WHEN MAX(extra_accessory) = 1 THEN 'Sí' ELSE 'No' END as 'Accesorio Extra',
-            MAX(celda) as 'Celda',
-            MAX(order_date) as 'Fecha de Orden',
+            o.order_number,
+            (
+                SELECT GROUP_CONCAT(accessory_type || ' (x' || quantity || ')')
+                FROM (SELECT accessory_type, quantity FROM {accessories_table} WHERE order_id = o.id ORDER BY id)
+            ),
+            CASE WHEN o.extra_accessory = 1 THEN 'Sí' ELSE 'No' END,
+            o.celda,
+            datetime(o.order_date, 'unixepoch', 'localtime'),
             CASE 
-                WHEN MAX(is_closed) = 1 THEN 
-                    CASE WHEN MAX(accessories_added) = 1 THEN 'Cerrada - Agregados' ELSE 'Cerrada - No Agregados' END
+                WHEN o.is_closed = 1 THEN 
+                    CASE WHEN o.accessories_added = 1 THEN 'Cerrada - Agregados' ELSE 'Cerrada - No Agregados' END
                 ELSE 'Abierta'
-            END as 'Estado'
-        FROM orders 
-        GROUP BY order_number 
-        ORDER BY MAX(order_date) DESC
-    """)
-    orders = cursor.fetchall()
-    
-    # Convert to DataFrame
-    df = pd.DataFrame([dict(row) for row in orders])
-    
-    # Create Excel file in memory
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Ordenes_Accesorios', index=False)
-    
-    output.seek(0)
-    
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'ordenes_accesorios_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+            END
+        FROM {orders_table} o
+        WHERE 1=1 {filters}
+        ORDER BY o.order_date DESC, o.id DESC
+    """.format(
+        orders_table=orders_table,
+        accessories_table=accessories_table,
+        filters=''.join(f" AND {clause}" for clause in clauses)
+    ), params)
+
+    def rows():
+        try:
+            while True:
+                batch = cursor.fetchmany()
+                if not batch:
+                    break
+                if job is not None:
+                    job.progress += len(batch)
+                yield from (tuple(row) for row in batch)
+        finally:
+            cursor.close()
+
+    return rows()
+
+def write_excel(path, args, job=None):
+    with open(path, 'wb') as output, instrumentation.export_timer('excel'):
+        for chunk in stream_xlsx(EXCEL_HEADER, open_excel_rows(args, job), sheet_name='Ordenes_Accesorios'):
+            output.write(chunk)
+
+PDF_TITLE = "Reporte de Órdenes de Accesorios"
+PDF_HEADER = ['Número de Orden', 'Accesorios', 'Accesorio Extra', 'Celda', 'Fecha', 'Estado']
+PDF_COL_WIDTHS = [80, 150, 55, 55, 95, 105]
+PDF_CACHE_SCOPE_FIELDS = ['search', 'q', 'celda', 'status', 'archived']
+
+# ✅ NUEVO: Caché en disco de las secciones (días) ya renderizadas del reporte PDF
+pdf_cache = SectionCache(os.getenv('PDF_CACHE_DIR'))
+
+def local_day_range(day):
+    """Rango [inicio, fin) en epoch del día local `day` (date)"""
+    start = datetime.combine(day, datetime.min.time()).astimezone()
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time()).astimezone()
+    return int(start.timestamp()), int(end.timestamp())
+
+def build_pdf(target, args, job=None):
+    """Genera el reporte PDF en `target` (ruta o archivo) con los filtros de get_orders.
+
+    El reporte se arma por días: los días pasados cuya huella (conteos y ids)
+    no cambió se toman de pdf_cache y solo se renderizan los demás.
+    """
+    clauses, params = build_order_filters(args)
+    filters = ''.join(f" AND {clause}" for clause in clauses)
+    orders_table, accessories_table = order_tables(args)
+
+    db = get_db()
+    # ✅ NUEVO: Huella por día para decidir qué secciones se pueden reutilizar
+    days = db.execute("""
+        SELECT date(o.order_date, 'unixepoch', 'localtime') as day,
+               COUNT(*), SUM(o.is_closed), SUM(o.accessories_added), MIN(o.id), MAX(o.id), SUM(o.id)
+        FROM {orders_table} o
+        WHERE 1=1 {filters}
+        GROUP BY day
+        ORDER BY day DESC
+    """.format(orders_table=orders_table, filters=filters), params).fetchall()
+
+    def day_rows(day):
+        start, end = local_day_range(day)
+        cursor = db.execute("""
+            SELECT 
+                o.order_number,
+                (
+                    SELECT GROUP_CONCAT(accessory_type || ' (x' || quantity || ')')
+                    FROM (SELECT accessory_type, quantity FROM {accessories_table} WHERE order_id = o.id ORDER BY id)
+                ) as accessories,
+                o.extra_accessory,
+                o.celda,
+                datetime(o.order_date, 'unixepoch', 'localtime') as order_date,
+                o.is_closed,
+                o.accessories_added
+            FROM {orders_table} o
+            WHERE o.order_date >= ? AND o.order_date < ? {filters}
+            ORDER BY o.order_date DESC, o.id DESC
+        """.format(orders_table=orders_table, accessories_table=accessories_table, filters=filters), [start, end] + params)
+
+        for order in cursor:
+            if job is not None:
+                job.progress += 1
+
+            estado = 'Abierta'
+            if order['is_closed']:
+                estado = 'Cerrada - Agregados' if order['accessories_added'] else 'Cerrada - No Agregados'
+
+            yield [
+                order['order_number'],
+                order['accessories'] or '',
+                'Sí' if order['extra_accessory'] else 'No',
+                order['celda'] or 'No especificada',
+                order['order_date'],
+                estado
+            ]
+
+    sections = []
+    for row in days:
+        day = datetime.strptime(row['day'], '%Y-%m-%d').date()
+        sections.append((day, tuple(row)[1:], lambda day=day: day_rows(day)))
+
+    with instrumentation.export_timer('pdf'):
+        build_report(
+            target, PDF_TITLE, PDF_HEADER, PDF_COL_WIDTHS, sections,
+            cache=pdf_cache,
+            cache_scope=job_key('pdf', args, PDF_CACHE_SCOPE_FIELDS),
+            wrap_columns=(1,)
+        )
+
+@app.route('/api/export_excel', methods=['GET'])
+def export_excel():
+    """Exporta a Excel en streaming; acepta los filtros de get_orders (date, from, to, celda, status, search, archived)"""
+    try:
+        rows = open_excel_rows(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # ✅ NUEVO: El archivo se envía por bloques mientras se genera (memoria constante)
+    filename = f'ordenes_accesorios_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    return Response(
+        instrumentation.timed_iter(stream_xlsx(EXCEL_HEADER, rows, sheet_name='Ordenes_Accesorios'), 'excel'),
+        mimetype=XLSX_MIMETYPE,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 @app.route('/api/export_pdf', methods=['GET'])
 def export_pdf():
-    db = get_db()
-    cursor = db.cursor()
-    
-    # ✅ ACTUALIZADO: Exportar con nueva estructura
-    cursor.execute("""
-        SELECT 
-            order_number,
-            GROUP_CONCAT(accessory_type || ' (x' || quantity || ')') as accessories,
-            MAX(extra_accessory) as extra_accessory,
-            MAX(celda) as celda,
-            MAX(order_date) as order_date,
-            MAX(is_closed) as is_closed,
-            MAX(accessories_added) as accessories_added
-        FROM orders 
-        GROUP BY order_number 
-        ORDER BY MAX(order_date) DESC
-    """)
-    orders = cursor.fetchall()
-    
     # Create PDF in memory
     buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    
-    # ✅ ACTUALIZADO: Create table data con nueva estructura
-    data = [['Número de Orden', 'Accesorios', 'Accesorio Extra', 'Celda', 'Fecha', 'Estado']]
-    
-    for order in orders:
-        estado = 'Abierta'
-        if order['is_closed']:
-            estado = 'Cerrada - Agregados' if order['accessories_added'] else 'Cerrada - No Agregados'
-            
-        data.append([
-            order['order_number'],
-            order['accessories'] or '',
-            'Sí' if order['extra_accessory'] else 'No',
-            order['celda'] or 'No especificada',  # ✅ CAMBIADO: mostrar celda
-            order['order_date'],
-            estado
-        ])
-    
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    # Build PDF
-    elements = []
-    styles = getSampleStyleSheet()
-    title = Paragraph("Reporte de Órdenes de Accesorios", styles['Title'])
-    elements.append(title)
-    elements.append(table)
-    
-    doc.build(elements)
+    try:
+        build_pdf(buffer, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     buffer.seek(0)
     
     return send_file(
@@ -306,8 +1840,122 @@ def export_pdf():
         download_name=f'ordenes_accesorios_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
     )
 
+@app.route('/api/export_jobs', methods=['POST'])
+def submit_export_job():
+    """Encola una exportación (format: excel o pdf) con los filtros de get_orders.
+
+    Devuelve 202 con el job_id; el estado se consulta en /api/export_jobs/<id>
+    y el archivo se descarga en /api/export_jobs/<id>/download.
+    """
+    data = request.get_json(silent=True) or {}
+    args = {field: str(data[field]) for field in EXPORT_FILTER_FIELDS if data.get(field)}
+    export_format = data.get('format', 'excel')
+
+    if export_format not in ('excel', 'pdf'):
+        return jsonify({'error': 'Formato inválido. Opciones válidas: excel, pdf'}), 400
+
+    try:
+        build_order_filters(args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if export_format == 'excel':
+        filename = f'ordenes_accesorios_{timestamp}.xlsx'
+        mimetype = XLSX_MIMETYPE
+        render = lambda path, job: write_excel(path, args, job)
+    else:
+        filename = f'ordenes_accesorios_{timestamp}.pdf'
+        mimetype = 'application/pdf'
+        render = lambda path, job: build_pdf(path, args, job)
+
+    try:
+        job = export_jobs.submit(job_key(export_format, args, EXPORT_FILTER_FIELDS), filename, mimetype, render)
+    except ExportQueueFull as e:
+        return jsonify({'error': str(e)}), 429
+
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/export_jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Exportación no encontrada o expirada'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/export_jobs/<job_id>/download', methods=['GET'])
+def download_export_job(job_id):
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Exportación no encontrada o expirada'}), 404
+    if job.status != DONE:
+        return jsonify(job.to_dict()), 409
+    return send_file(job.path, mimetype=job.mimetype, as_attachment=True, download_name=job.filename)
+
+# ✅ NUEVO: Métricas en formato Prometheus y últimas consultas lentas
+instrumentation.add_gauges('orders_response_cache', lambda: response_cache.metrics())
+instrumentation.add_gauges('orders_pdf_cache', lambda: {'hits': pdf_cache.hits, 'misses': pdf_cache.misses})
+if open_orders is not None:
+    instrumentation.add_gauges('orders_open_index', lambda: open_orders.metrics())
+if group_commit is not None:
+    instrumentation.add_gauges('orders_group_commit', lambda: group_commit.metrics())
+instrumentation.add_gauges('orders_legacy_migration', lambda: legacy_migration)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/slow_queries', methods=['GET'])
+def slow_queries():
+    return jsonify(instrumentation.slow_queries()), 200
+
+# ✅ NUEVO: Fábrica para servidores WSGI (gunicorn -c gunicorn.conf.py)
+def shutdown_worker():
+    """Libera los recursos del proceso al terminar el worker"""
+    export_jobs.shutdown()
+    if group_commit is not None:
+        group_commit.close()
+
+# ✅ NUEVO: reportlab/pypdf (PDF) y pandas (importación) se cargan en el primer uso;
+# los workers que solo registran órdenes arrancan antes y ocupan menos memoria.
+# EXPORT_PRELOAD=true los carga al arrancar (p. ej. un gunicorn aparte que
+# solo atiende /api/export* e /api/import*)
+EXPORT_PRELOAD = os.getenv('EXPORT_PRELOAD', 'false').lower() == 'true'
+
+def preload_export_modules():
+    import order_import
+    import pdf_report
+
+    pdf_report.preload()
+    order_import.preload()
+
+def create_app():
+    """Inicializa la base y devuelve la app ('app:create_app()' en gunicorn).
+
+    init_db corre bajo un bloqueo de archivo, así las migraciones se ejecutan
+    una sola vez aunque arranquen varios procesos a la vez. gunicorn.conf.py
+    usa los hooks de 'lifecycle' para el apagado ordenado.
+    """
+    import fcntl
+
+    with open(DATABASE + '.init.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with app.app_context():
+            init_db()
+
+    # ✅ NUEVO: Fuera del bloqueo de arranque: el worker ya atiende peticiones
+    start_legacy_migration()
+
+    # ✅ NUEVO: Un worker dedicado a exportar precarga reportlab/pandas en segundo plano
+    if EXPORT_PRELOAD:
+        threading.Thread(target=preload_export_modules, name='export-preload', daemon=True).start()
+
+    app.extensions['lifecycle'] = {'drain': order_events.close, 'shutdown': shutdown_worker}
+    return app
+
 if __name__ == '__main__':
+    # Servidor de desarrollo; en producción usar gunicorn (ver gunicorn.conf.py)
     with app.app_context():
         init_db()
-    app.run(debug=True, host='0.0.0.0')
-
+    start_legacy_migration()
+    app.run(debug=os.getenv('FLASK_DEBUG', 'False').lower() == 'true', host='0.0.0.0')
@@ -0,0 +1,729 @@
+"""
+Banco de pruebas de carga de la API de órdenes.
+
+Siembra una base con datos sintéticos (10k / 100k / 1M filas de accesorios),
+arranca el servidor de producción (gunicorn.conf.py) y lanza una carga mixta
+reproducible: alta de órdenes, sondeo del listado (con ETag y feed de
+cambios), búsqueda, cierre y exportación. Informa latencias p50/p95/p99,
+throughput y RSS máximo de los procesos del servidor, y compara dos
+ejecuciones para detectar regresiones.
+
+    python benchmark.py run --backend sqlite --size 100k -o base.json
+    python benchmark.py run --backend postgres --database-url postgresql://localhost/orders_bench --size 10k
+    python benchmark.py compare base.json new.json --threshold 10
+    python benchmark.py run --workload entry=80,close=20 --clients 32 --env GROUP_COMMIT=true
+    python benchmark.py startup --backend sqlite
+    python benchmark.py encode --orders 10000
+
+La base sembrada se guarda en --workdir y se copia en cada ejecución (SQLite),
+así todas parten del mismo estado. Con Postgres la base indicada en
+--database-url se VACÍA antes de sembrar: usar solo una base local de pruebas.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+ACCESSORIES_PER_ORDER = 2
+SEED_DAYS = 90
+SEED = 20240601
+CELDAS = ['Celda 10', 'Celda 11', 'Celda 15', 'Celda 16']
+ACCESSORY_TYPES = ['Tornillo', 'Tuerca', 'Arandela', 'Soporte', 'Cable', 'Conector']
+
+# Operación -> peso en la mezcla de carga
+WORKLOAD = {'entry': 30, 'poll': 40, 'search': 15, 'close': 10, 'export': 5}
+
+# Rutas de cada backend
+ENDPOINTS = {
+    'sqlite': {
+        'wsgi': 'app',
+        'add': ('POST', '/api/add_order'),
+        'list': '/api/get_orders',
+        'changes': '/api/get_order_changes',
+        'search': ('/api/search_orders', 'q'),
+        'close': lambda order_id: ('POST', '/api/close_order', {'order_id': order_id}),
+        'export': '/api/export_excel',
+    },
+    'postgres': {
+        'wsgi': 'main',
+        'add': ('POST', '/api/add_order'),
+        'list': '/api/orders',
+        'changes': '/api/orders/changes',
+        'search': ('/api/orders/search', 'q'),
+        'close': lambda order_id: ('PUT', f'/api/orders/{order_id}/close', {'accessories_added': True}),
+        'export': '/api/export/excel',
+    },
+}
+
+
+def parse_size(value):
+    if value.lower() not in SIZES:
+        raise argparse.ArgumentTypeError(f'Tamaño inválido. Opciones válidas: {", ".join(SIZES)}')
+    return SIZES[value.lower()]
+
+
+# --- Datos sintéticos ---------------------------------------------------------
+
+def synthetic_manifest(accessory_rows):
+    """Manifiesto reproducible con `accessory_rows` filas de accesorios"""
+    from order_import import Manifest
+
+    rng = random.Random(SEED)
+    now = int(time.time())
+    orders = []
+    accessories = []
+    for index in range(accessory_rows // ACCESSORIES_PER_ORDER):
+        number = f'B{index:07d}'
+        closed = rng.random() < 0.8
+        order_date = now - rng.randrange(SEED_DAYS * 86400)
+        orders.append((number, rng.random() < 0.1, False, rng.choice(CELDAS), order_date, closed, closed))
+        for accessory_type in rng.sample(ACCESSORY_TYPES, ACCESSORIES_PER_ORDER):
+            accessories.append((number, accessory_type, rng.randint(1, 20)))
+    rows = {order[0]: index + 2 for index, order in enumerate(orders)}
+    return Manifest(orders, accessories, rows, [])
+
+
+def seed_sqlite(workdir, accessory_rows):
+    """Crea (o reutiliza) la base sembrada y devuelve una copia para esta ejecución"""
+    seeded = os.path.join(workdir, f'seed_sqlite_{accessory_rows}.db')
+    if not os.path.exists(seeded):
+        print(f'Sembrando SQLite con {accessory_rows} filas de accesorios...')
+        os.environ['SQLITE_DATABASE'] = seeded + '.tmp'
+        sys.path.insert(0, BACKEND_DIR)
+        import app
+
+        started = time.perf_counter()
+        with app.app.app_context():
+            app.init_db()
+            app.import_manifest(synthetic_manifest(accessory_rows))
+            db = app.get_db()
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            db.close()
+            app.db_local.conn = None
+        os.replace(seeded + '.tmp', seeded)
+        print(f'Siembra completada en {time.perf_counter() - started:.1f}s')
+
+    database = os.path.join(workdir, 'run.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+    shutil.copyfile(seeded, database)
+    return {'SQLITE_DATABASE': database}
+
+
+def seed_postgres(database_url, accessory_rows):
+    """Vacía la base de pruebas y la siembra (siempre, para partir del mismo estado)"""
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+
+    print(f'Sembrando Postgres con {accessory_rows} filas de accesorios...')
+    os.environ['DATABASE_URL'] = database_url
+    sys.path.insert(0, os.path.join(BACKEND_DIR, 'src'))
+    import main
+
+    started = time.perf_counter()
+    with main.app.app_context():
+        main.init_db()
+    db = psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    try:
+        cursor = db.cursor()
+        cursor.execute('''
+            TRUNCATE orders, order_accessories, orders_archive, order_accessories_archive,
+                     order_stats_hourly, accessory_stats_hourly RESTART IDENTITY CASCADE
+        ''')
+        db.commit()
+        main.import_manifest(db, synthetic_manifest(accessory_rows))
+        db.autocommit = True
+        cursor.execute("VACUUM ANALYZE orders")
+        cursor.execute("VACUUM ANALYZE order_accessories")
+    finally:
+        db.close()
+    print(f'Siembra completada en {time.perf_counter() - started:.1f}s')
+    return {'DATABASE_URL': database_url, 'ORDERS_BACKEND': 'postgres'}
+
+
+# --- Servidor -----------------------------------------------------------------
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def read_tail(path, size=8192):
+    with open(path, 'rb') as log:
+        log.seek(max(0, os.path.getsize(path) - size))
+        return log.read().decode(errors='replace')
+
+
+def start_server(env, port, log_path, timeout=60):
+    """Arranca gunicorn con gunicorn.conf.py y espera a que responda.
+
+    La salida de error del servidor (log de gunicorn, trazas de errores 500,
+    consultas lentas) va a `log_path`: en un pipe sin leer, al llenarse el
+    búfer los hilos del servidor se bloquearían al escribir.
+    """
+    env = dict(os.environ, **env, PORT=str(port), GUNICORN_BIND=f'127.0.0.1:{port}')
+    with open(log_path, 'wb') as log:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BACKEND_DIR, 'gunicorn.conf.py')],
+            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'El servidor terminó al arrancar:\n{read_tail(log_path)}')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('El servidor no respondió a tiempo')
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def process_tree(pid):
+    """pid y sus descendientes directos (workers de gunicorn), leídos de /proc"""
+    pids = [pid]
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            pids.append(int(entry))
+    return pids
+
+
+def peak_rss_kb(pid):
+    """Suma de VmHWM (RSS máximo) del proceso y sus workers; None fuera de Linux"""
+    total = 0
+    for process in process_tree(pid):
+        try:
+            with open(f'/proc/{process}/status') as status:
+                for line in status:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1])
+        except OSError:
+            return None
+    return total or None
+
+
+# --- Carga --------------------------------------------------------------------
+
+class Client:
+    """Cliente HTTP con keep-alive; un hilo de carga por cliente"""
+
+    def __init__(self, port, backend, index, created, seeded_orders):
+        self.port = port
+        self.endpoints = ENDPOINTS[backend]
+        self.rng = random.Random(SEED + index)
+        self.index = index
+        self.created = created
+        self.seeded_orders = seeded_orders
+        self.etags = {}
+        self.change_version = 0
+        self.count = 0
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+            raise
+        return response, data
+
+    def entry(self):
+        self.count += 1
+        method, path = self.endpoints['add']
+        accessories = [
+            {'accessory_type': accessory_type, 'type': accessory_type, 'quantity': self.rng.randint(1, 20)}
+            for accessory_type in self.rng.sample(ACCESSORY_TYPES, ACCESSORIES_PER_ORDER)
+        ]
+        response, data = self.request(method, path, {
+            'order_number': f'N{self.index:03d}-{self.count:07d}-{self.rng.randrange(10 ** 6)}',
+            'accessories': accessories,
+            'extra_accessory': False,
+            'selected': False,
+            'celda': self.rng.choice(CELDAS),
+        })
+        if response.status == 201:
+            self.created.append(json.loads(data)['order_id'])
+        return response.status < 400
+
+    def poll(self):
+        # Tablero: primera página de abiertas (con ETag) y luego el feed de cambios
+        path = self.endpoints['list'] + '?' + urlencode({'status': 'open', 'celda': self.rng.choice(CELDAS), 'limit': 100})
+        headers = {'If-None-Match': self.etags[path]} if path in self.etags else {}
+        response, _ = self.request('GET', path, headers=headers)
+        if response.getheader('ETag'):
+            self.etags[path] = response.getheader('ETag')
+        ok = response.status in (200, 304)
+
+        changes = self.endpoints['changes'] + '?' + urlencode({'since': self.change_version, 'limit': 500})
+        response, _ = self.request('GET', changes)
+        self.change_version = int(response.getheader('X-Change-Version') or self.change_version)
+        return ok and response.status == 200
+
+    def search(self):
+        path, param = self.endpoints['search']
+        term = f'B{self.rng.randrange(max(1, self.seeded_orders)):07d}'[:6]
+        response, _ = self.request('GET', path + '?' + urlencode({param: term, 'limit': 50}))
+        return response.status == 200
+
+    def close(self):
+        try:
+            order_id = self.created.popleft()
+        except IndexError:
+            order_id = self.rng.randint(1, max(1, self.seeded_orders))
+        method, path, body = self.endpoints['close'](order_id)
+        response, _ = self.request(method, path, body)
+        return response.status in (200, 404)
+
+    def export(self):
+        # Exportación del día actual (acotada aunque la base sea grande)
+        path = self.endpoints['export'] + '?' + urlencode({'date': datetime.now().strftime('%Y-%m-%d')})
+        response, _ = self.request('GET', path)
+        return response.status in (200, 404)
+
+
+def parse_workload(value):
+    """'entry=80,close=20' -> {'entry': 80, 'close': 20}"""
+    workload = {}
+    for item in value.split(','):
+        operation, _, weight = item.partition('=')
+        if operation not in WORKLOAD or not weight.isdigit():
+            raise argparse.ArgumentTypeError(f'Carga inválida: {item} (operaciones: {", ".join(WORKLOAD)})')
+        workload[operation] = int(weight)
+    return workload
+
+
+def parse_env(value):
+    name, separator, setting = value.partition('=')
+    if not separator or not name:
+        raise argparse.ArgumentTypeError(f'Variable inválida: {value} (formato NOMBRE=valor)')
+    return name, setting
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'errors': errors,
+        'throughput': len(values) / elapsed if elapsed else 0.0,
+        'mean_ms': sum(values) / len(values) * 1000 if values else None,
+        'p50_ms': percentile(values, 0.50) * 1000 if values else None,
+        'p95_ms': percentile(values, 0.95) * 1000 if values else None,
+        'p99_ms': percentile(values, 0.99) * 1000 if values else None,
+    }
+
+
+def warm_up(port, backend, seeded_orders, rounds=3):
+    """Unas vueltas sin medir: primeras conexiones, cachés y módulos perezosos"""
+    client = Client(port, backend, 999, deque(), seeded_orders)
+    for _ in range(rounds):
+        for operation in WORKLOAD:
+            try:
+                getattr(client, operation)()
+            except (OSError, http.client.HTTPException):
+                pass
+
+
+def drive(port, backend, clients, requests_per_client, seeded_orders, workload=WORKLOAD):
+    """Ejecuta la carga; cada cliente sigue su propia secuencia (semilla fija)"""
+    created = deque()
+    operations = list(workload)
+    weights = [workload[operation] for operation in operations]
+    latencies = {operation: [] for operation in operations}
+    errors = {operation: 0 for operation in operations}
+    lock = threading.Lock()
+
+    def run_client(index):
+        client = Client(port, backend, index, created, seeded_orders)
+        local = {operation: [] for operation in operations}
+        local_errors = {operation: 0 for operation in operations}
+        for _ in range(requests_per_client):
+            operation = client.rng.choices(operations, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = getattr(client, operation)()
+            except (OSError, http.client.HTTPException):
+                ok = False
+            local[operation].append(time.perf_counter() - started)
+            if not ok:
+                local_errors[operation] += 1
+        with lock:
+            for operation in operations:
+                latencies[operation].extend(local[operation])
+                errors[operation] += local_errors[operation]
+
+    threads = [threading.Thread(target=run_client, args=(index,)) for index in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = {operation: summarize(latencies[operation], errors[operation], elapsed) for operation in operations}
+    all_latencies = [value for operation in operations for value in latencies[operation]]
+    results['total'] = summarize(all_latencies, sum(errors.values()), elapsed)
+    return results, elapsed
+
+
+# --- Arranque -----------------------------------------------------------------
+
+# Se ejecuta en un proceso nuevo: mide importar el módulo y create_app()
+STARTUP_SCRIPT = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+{module}.create_app()
+ready = time.perf_counter()
+print(json.dumps({{
+    'import_s': imported - started,
+    'create_app_s': ready - imported,
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'heavy_modules': sorted(name for name in {heavy!r} if name in sys.modules),
+}}))
+'''
+
+# Dependencias que solo necesitan las exportaciones e importaciones
+HEAVY_MODULES = ('pandas', 'openpyxl', 'reportlab', 'pypdf')
+
+
+def parse_importtime(output, top=15):
+    """Imports de `python -X importtime` hasta el segundo nivel (el módulo y lo que
+    importa directamente), ordenados por tiempo acumulado"""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # El nivel de anidamiento es la sangría del nombre: ' ' + 2 espacios por nivel
+        if len(name) - len(name.lstrip()) <= 3:
+            imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def measure_startup(backend, env):
+    directory = BACKEND_DIR if backend == 'sqlite' else os.path.join(BACKEND_DIR, 'src')
+    script = STARTUP_SCRIPT.format(module=ENDPOINTS[backend]['wsgi'], heavy=HEAVY_MODULES)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        cwd=directory, env=dict(os.environ, **env), capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f'Fallo al arrancar:\n{completed.stderr[-2000:]}')
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['imports_ms'] = parse_importtime(completed.stderr)
+    return result
+
+
+def command_startup(args):
+    if args.backend == 'postgres':
+        if not args.database_url:
+            raise SystemExit('--database-url es obligatorio con --backend postgres')
+        env = {'DATABASE_URL': args.database_url}
+    else:
+        os.makedirs(args.workdir, exist_ok=True)
+        env = {'SQLITE_DATABASE': os.path.join(args.workdir, 'startup.db')}
+    env['EXPORT_PRELOAD'] = 'false'
+
+    result = measure_startup(args.backend, env)
+    print(f"{args.backend}: import {result['import_s'] * 1000:.0f} ms | create_app "
+          f"{result['create_app_s'] * 1000:.0f} ms | RSS máx {result['rss_kb']} KB")
+    print(f"Dependencias de exportación cargadas: {', '.join(result['heavy_modules']) or 'ninguna'}")
+    print(f"\n{'ms acumulados':>14}  módulo")
+    for milliseconds, name in result['imports_ms']:
+        print(f'{milliseconds:>14.1f}  {name}')
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+
+
+# --- Serialización -------------------------------------------------------------
+
+# Misma forma de fila que /api/get_orders (accesorios como texto JSON)
+ENCODE_QUERY = '''
+    SELECT o.id, o.order_number,
+           (SELECT json_group_array(json_object('accessory_type', oa.accessory_type, 'quantity', oa.quantity))
+            FROM order_accessories oa WHERE oa.order_id = o.id) AS accessories,
+           o.extra_accessory, o.celda,
+           datetime(o.order_date, 'unixepoch', 'localtime') AS order_date,
+           o.order_date AS order_ts, o.is_closed, o.accessories_added, o.change_version
+    FROM orders o ORDER BY o.order_date DESC, o.id DESC LIMIT ?
+'''
+
+
+def timed(function, repeat):
+    """Mediana en ms de `repeat` ejecuciones y el tamaño del último resultado"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[len(timings) // 2], len(result)
+
+
+def command_encode(args):
+    import sqlite3
+
+    import response_encoder
+    from response_encoder import ResponseEncoder
+
+    os.makedirs(args.workdir, exist_ok=True)
+    env = seed_sqlite(args.workdir, max(args.orders * ACCESSORIES_PER_ORDER, SIZES['10k']))
+    db = sqlite3.connect(env['SQLITE_DATABASE'])
+    db.row_factory = sqlite3.Row
+    rows = db.execute(ENCODE_QUERY, (args.orders,)).fetchall()
+    db.close()
+
+    def legacy():
+        # Lo que hacía get_orders: dict(row) + json.loads + jsonify (json estándar, sort_keys)
+        formatted = []
+        for row in rows:
+            order = dict(row)
+            order['accessories'] = json.loads(order['accessories'])
+            del order['order_ts']
+            formatted.append(order)
+        return json.dumps(formatted, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+    fast = ResponseEncoder(compress_level=args.level)
+    stdlib = ResponseEncoder(compress_level=args.level, use_orjson=False)
+    shape = {'drop': ('order_ts',), 'json_columns': ('accessories',)}
+
+    def encoder_json(encoder):
+        return lambda: encoder.dumps_json(list(encoder.records(rows, raw_json=True, **shape)))
+
+    cases = [
+        ('dict + jsonify (antes)', legacy),
+        ('encoder json estándar', encoder_json(stdlib)),
+        (f'encoder {fast.json_backend}', encoder_json(fast)),
+        (f'encoder {fast.json_backend} + gzip', lambda: fast.compress(encoder_json(fast)(), 'gzip')),
+    ]
+    if response_encoder.brotli is not None:
+        cases.append((f'encoder {fast.json_backend} + br', lambda: fast.compress(encoder_json(fast)(), 'br')))
+    if response_encoder.msgpack is not None:
+        cases.append(('encoder msgpack', lambda: response_encoder.msgpack.packb(list(fast.records(rows, **shape)))))
+
+    print(f'{len(rows)} órdenes, mediana de {args.repeat} ejecuciones')
+    print(f"{'variante':<32}{'ms':>10}{'bytes':>12}{'vs antes':>10}")
+    baseline = None
+    results = {}
+    for name, function in cases:
+        milliseconds, size = timed(function, args.repeat)
+        baseline = baseline or milliseconds
+        results[name] = {'ms': milliseconds, 'bytes': size}
+        print(f'{name:<32}{milliseconds:>10.1f}{size:>12}{baseline / milliseconds:>9.1f}x')
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'orders': len(rows), 'results': results}, output, indent=2)
+
+
+# --- Informe y comparación ----------------------------------------------------
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result):
+    meta = result['meta']
+    print(f"\n{meta['backend']} | {meta['accessory_rows']} filas | {meta['clients']} clientes | "
+          f"{result['elapsed_s']:.1f}s | RSS máx {result['peak_rss_kb'] or '-'} KB")
+    if meta.get('env'):
+        print(' '.join(f'{name}={value}' for name, value in meta['env'].items()))
+    print(f"{'operación':<10}{'n':>8}{'err':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for operation, stats in result['operations'].items():
+        print(f"{operation:<10}{stats['count']:>8}{stats['errors']:>6}{stats['throughput']:>10.1f}"
+              f"{stats['p50_ms'] or 0:>10.2f}{stats['p95_ms'] or 0:>10.2f}{stats['p99_ms'] or 0:>10.2f}")
+
+
+# Métrica -> True si un valor mayor es mejor
+COMPARED_METRICS = {'throughput': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False}
+
+
+def compare(base, new, threshold):
+    """Imprime el cambio por operación y métrica; devuelve las regresiones > threshold %"""
+    regressions = []
+    print(f"{'operación':<10}{'métrica':<12}{'base':>12}{'nuevo':>12}{'cambio':>10}")
+    for operation, stats in new['operations'].items():
+        base_stats = base['operations'].get(operation)
+        if base_stats is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, after = base_stats.get(metric), stats.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = -change if higher_is_better else change
+            flag = ' REGRESIÓN' if worse > threshold else ''
+            if flag:
+                regressions.append((operation, metric, change))
+            print(f"{operation:<10}{metric:<12}{before:>12.2f}{after:>12.2f}{change:>+9.1f}%{flag}")
+
+    before, after = base.get('peak_rss_kb'), new.get('peak_rss_kb')
+    if before and after:
+        change = (after - before) / before * 100
+        flag = ' REGRESIÓN' if change > threshold else ''
+        if flag:
+            regressions.append(('server', 'peak_rss_kb', change))
+        print(f"{'server':<10}{'rss_kb':<12}{before:>12}{after:>12}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+# --- CLI ----------------------------------------------------------------------
+
+def command_run(args):
+    os.makedirs(args.workdir, exist_ok=True)
+    if args.backend == 'postgres':
+        if not args.database_url:
+            raise SystemExit('--database-url es obligatorio con --backend postgres (la base se vacía)')
+        env = seed_postgres(args.database_url, args.size)
+    else:
+        env = seed_sqlite(args.workdir, args.size)
+
+    env.update(args.env)
+    workload = args.workload or WORKLOAD
+    port = free_port()
+    log_path = os.path.join(args.workdir, 'server.log')
+    server = start_server(env, port, log_path)
+    try:
+        warm_up(port, args.backend, args.size // ACCESSORIES_PER_ORDER)
+        results, elapsed = drive(
+            port, args.backend, args.clients, args.requests, args.size // ACCESSORIES_PER_ORDER, workload
+        )
+        rss = peak_rss_kb(server.pid)
+    finally:
+        stop_server(server)
+
+    result = {
+        'meta': {
+            'backend': args.backend,
+            'accessory_rows': args.size,
+            'clients': args.clients,
+            'requests_per_client': args.requests,
+            'workload': workload,
+            'env': dict(args.env),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        },
+        'elapsed_s': elapsed,
+        'peak_rss_kb': rss,
+        'server_log': log_path,
+        'operations': results,
+    }
+    print_report(result)
+    print(f'\nLog del servidor: {log_path}')
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2)
+        print(f'\nResultados guardados en {args.output}')
+
+
+def command_compare(args):
+    with open(args.base) as base_file, open(args.new) as new_file:
+        base, new = json.load(base_file), json.load(new_file)
+    if (base['meta']['backend'], base['meta']['accessory_rows']) != (new['meta']['backend'], new['meta']['accessory_rows']):
+        print('Advertencia: las ejecuciones usan distinto backend o tamaño')
+    regressions = compare(base, new, args.threshold)
+    if regressions:
+        print(f'\n{len(regressions)} regresiones por encima de {args.threshold}%')
+        sys.exit(1)
+    print('\nSin regresiones')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Banco de pruebas de carga de la API de órdenes')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Sembrar, arrancar el servidor y medir')
+    run.add_argument('--backend', choices=sorted(ENDPOINTS), default='sqlite')
+    run.add_argument('--size', type=parse_size, default=SIZES['10k'], help='Filas de accesorios: 10k, 100k o 1m')
+    run.add_argument('--clients', type=int, default=8)
+    run.add_argument('--requests', type=int, default=500, help='Peticiones por cliente')
+    run.add_argument('--database-url', help='Postgres local de pruebas (se vacía antes de sembrar)')
+    run.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'orders_bench'))
+    run.add_argument('--workload', type=parse_workload, help='Mezcla de carga, p. ej. entry=80,close=20')
+    run.add_argument('--env', type=parse_env, action='append', default=[], help='Variable del servidor NOMBRE=valor (repetible)')
+    run.add_argument('-o', '--output', help='Guardar los resultados en JSON')
+    run.set_defaults(handler=command_run)
+
+    diff = commands.add_parser('compare', help='Comparar dos resultados JSON')
+    diff.add_argument('base')
+    diff.add_argument('new')
+    diff.add_argument('--threshold', type=float, default=10.0, help='Regresión mínima a informar (%%)')
+    diff.set_defaults(handler=command_compare)
+
+    startup = commands.add_parser('startup', help='Tiempo de arranque, memoria e imports más costosos')
+    startup.add_argument('--backend', choices=sorted(ENDPOINTS), default='sqlite')
+    startup.add_argument('--database-url', help='Postgres de pruebas')
+    startup.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'orders_bench'))
+    startup.add_argument('-o', '--output', help='Guardar el informe en JSON')
+    startup.set_defaults(handler=command_startup)
+
+    encode = commands.add_parser('encode', help='Costo de serializar un listado grande (formatos y compresión)')
+    encode.add_argument('--orders', type=int, default=10_000)
+    encode.add_argument('--repeat', type=int, default=7)
+    encode.add_argument('--level', type=int, default=6, help='Nivel de compresión')
+    encode.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'orders_bench'))
+    encode.add_argument('-o', '--output', help='Guardar el informe en JSON')
+    encode.set_defaults(handler=command_encode)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
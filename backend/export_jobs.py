@@ -0,0 +1,186 @@
+"""
+Cola de trabajos de exportación en segundo plano.
+
+Las exportaciones pesadas (Excel/PDF) se ejecutan en un pool de hilos acotado
+y escriben el archivo en disco; el cliente consulta el estado del trabajo y
+descarga el archivo cuando termina. Las solicitudes idénticas (mismo formato y
+mismos filtros) comparten el mismo trabajo mientras esté en curso o su archivo
+siga vigente, y los archivos terminados se eliminan al expirar su TTL.
+
+Con varios procesos (workers de gunicorn) que comparten `directory`, el estado
+de cada trabajo se guarda también como <id>.json, así cualquier worker puede
+informar el estado y servir la descarga de un trabajo de otro.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+ERROR = 'error'
+
+
+class ExportQueueFull(Exception):
+    """Se alcanzó el número máximo de trabajos pendientes"""
+
+
+class ExportJob:
+    """Estado de un trabajo de exportación"""
+
+    def __init__(self, key, filename, mimetype):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.filename = filename
+        self.mimetype = mimetype
+        self.status = PENDING
+        self.progress = 0
+        self.error = None
+        self.path = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @classmethod
+    def from_file(cls, path):
+        """Reconstruye un trabajo desde su archivo de estado (o None si no existe)"""
+        try:
+            with open(path) as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return None
+        job = cls(None, state['filename'], state['mimetype'])
+        job.id = state['job_id']
+        job.status = state['status']
+        job.progress = state['rows_written']
+        job.error = state['error']
+        job.path = state['path']
+        job.created_at = state['created_at']
+        job.finished_at = state['finished_at']
+        return job
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'rows_written': self.progress,
+            'filename': self.filename,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class ExportJobManager:
+    """Pool acotado de trabajos de exportación con deduplicación y TTL.
+
+    `render(path, job)` escribe el archivo en `path` y puede ir actualizando
+    `job.progress`. `context` es una fábrica de context managers (por ejemplo
+    `app.app_context`) con la que se envuelve cada ejecución.
+    """
+
+    def __init__(self, max_workers=2, max_pending=20, ttl=300, directory=None, context=None):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        # Solo se borra al apagar el directorio propio, no uno compartido
+        self._owns_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix='export_jobs_')
+        os.makedirs(self.directory, exist_ok=True)
+        self._context = context or nullcontext
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._by_key = {}
+
+    def submit(self, key, filename, mimetype, render):
+        """Encola un trabajo, o devuelve el existente para la misma clave"""
+        with self._lock:
+            self._evict_expired()
+
+            existing = self._jobs.get(self._by_key.get(key))
+            if existing is not None and existing.status != ERROR:
+                return existing
+
+            pending = sum(1 for job in self._jobs.values() if job.status in (PENDING, RUNNING))
+            if pending >= self.max_pending:
+                raise ExportQueueFull('Demasiadas exportaciones en curso, intente más tarde')
+
+            job = ExportJob(key, filename, mimetype)
+            self._jobs[job.id] = job
+            self._by_key[key] = job.id
+
+        self._save_state(job)
+        self._executor.submit(self._run, job, render)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict_expired()
+            job = self._jobs.get(job_id)
+        if job is None and all(char in '0123456789abcdef' for char in job_id):
+            # Trabajo de otro worker (solo lectura: su dueño lo expira)
+            job = ExportJob.from_file(self._state_path(job_id))
+            if job is not None and job.finished_at is not None and time.time() - job.finished_at > self.ttl:
+                job = None
+        return job
+
+    def _state_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _save_state(self, job):
+        state = dict(job.to_dict(), mimetype=job.mimetype, path=job.path)
+        temp_path = self._state_path(job.id) + '.tmp'
+        with open(temp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self._state_path(job.id))
+
+    def _run(self, job, render):
+        job.status = RUNNING
+        self._save_state(job)
+        path = os.path.join(self.directory, f'{job.id}_{job.filename}')
+        try:
+            with self._context():
+                render(path, job)
+            job.path = path
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = ERROR
+            if os.path.exists(path):
+                os.remove(path)
+        finally:
+            job.finished_at = time.time()
+            self._save_state(job)
+
+    def _evict_expired(self):
+        now = time.time()
+        for job in list(self._jobs.values()):
+            if job.finished_at is not None and now - job.finished_at > self.ttl:
+                del self._jobs[job.id]
+                if self._by_key.get(job.key) == job.id:
+                    del self._by_key[job.key]
+                self._remove_files(job)
+
+    def _remove_files(self, job):
+        for path in (job.path, self._state_path(job.id)):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            return
+        with self._lock:
+            for job in self._jobs.values():
+                self._remove_files(job)
+
+
+def job_key(kind, args, fields):
+    """Clave de deduplicación: formato + filtros normalizados"""
+    return (kind,) + tuple((field, args.get(field, '')) for field in sorted(fields))
@@ -0,0 +1,176 @@
+"""
+Escrituras agrupadas (group commit) para SQLite.
+
+Con muchas altas y cierres simultáneos (escáneres en varias celdas), cada
+petición toma el lock de escritura de SQLite, escribe el WAL y confirma por su
+cuenta. Con el escritor agrupado las peticiones encolan su operación y un solo
+hilo las ejecuta juntas:
+
+- Toma la primera operación de la cola y las que lleguen hasta `max_batch`
+  operaciones o `max_delay` segundos (con 0, solo las que ya esperan: bajo
+  carga, las que llegan durante un commit forman el siguiente lote).
+- Un BEGIN IMMEDIATE por lote y un SAVEPOINT por operación: una operación que
+  falla (p. ej. número de orden repetido) se deshace sola y recibe su
+  excepción; las demás del lote se confirman.
+- Cada petición recibe su resultado después del COMMIT del lote, nunca antes.
+  La durabilidad del COMMIT la fija `synchronous` de la conexión del escritor:
+  FULL sincroniza el WAL en disco en cada lote (sobrevive a un corte de
+  energía); NORMAL no sincroniza hasta el checkpoint (sobrevive a la caída del
+  proceso, no a la del sistema).
+
+Las operaciones son funciones `operation(cursor)` que se ejecutan en el hilo
+del escritor; su valor de retorno es el resultado de `submit()`. Todas las
+escrituras de la aplicación deben pasar por el escritor: una transacción
+propia en otra conexión compite con el lote por el lock de escritura.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+
+class WriterClosed(Exception):
+    """El escritor ya no acepta operaciones (apagado del worker)"""
+
+
+class GroupCommitWriter:
+    """Hilo escritor con su propia conexión; `connect()` se llama dentro del hilo"""
+
+    def __init__(self, connect, max_batch=64, max_delay=0.0):
+        self._connect = connect
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._stats = {
+            'batches_total': 0,
+            'operations_total': 0,
+            'failed_operations_total': 0,
+            'failed_batches_total': 0,
+            'batch_size_max': 0,
+            'commit_seconds_total': 0.0,
+        }
+
+    def start(self):
+        """Arranca el hilo si aún no corre (idempotente; tras el fork del worker)"""
+        with self._lock:
+            if self._closed:
+                raise WriterClosed('El escritor está cerrado')
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def submit(self, operation):
+        """Encola la operación y espera al commit de su lote; devuelve su resultado o relanza su excepción"""
+        self.start()
+        future = Future()
+        self._queue.put((operation, future))
+        return future.result()
+
+    def close(self, timeout=10.0):
+        """Deja de aceptar operaciones, confirma las encoladas y termina el hilo"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        self._conn = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                self._commit(self._collect(item))
+        finally:
+            if self._conn is not None:
+                self._conn.close()
+            # Lo encolado después del cierre no se ejecuta
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    item[1].set_exception(WriterClosed('El escritor está cerrado'))
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = self._connect()
+            # Transacciones explícitas: sin el BEGIN implícito del módulo sqlite3
+            self._conn.isolation_level = None
+        return self._conn
+
+    def _commit(self, batch):
+        results = []
+        conn = cursor = None
+        try:
+            conn = self._connection()
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            for operation, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                cursor.execute("SAVEPOINT operation")
+                try:
+                    results.append((future, operation(cursor), None))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO operation")
+                    results.append((future, None, e))
+                cursor.execute("RELEASE operation")
+            started = time.perf_counter()
+            cursor.execute("COMMIT")
+            commit_seconds = time.perf_counter() - started
+        except Exception as e:
+            # Sin COMMIT no se confirmó nada: todas las operaciones del lote fallan
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            for _, future in batch:
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            with self._lock:
+                self._stats['failed_batches_total'] += 1
+            return
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        with self._lock:
+            self._stats['batches_total'] += 1
+            self._stats['operations_total'] += len(results)
+            self._stats['failed_operations_total'] += sum(1 for _, _, error in results if error is not None)
+            self._stats['batch_size_max'] = max(self._stats['batch_size_max'], len(results))
+            self._stats['commit_seconds_total'] += commit_seconds
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['batch_size_mean'] = stats['operations_total'] / stats['batches_total'] if stats['batches_total'] else 0.0
+        return stats
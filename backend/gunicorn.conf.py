@@ -0,0 +1,100 @@
+"""
+Configuración de producción de gunicorn para los dos backends.
+
+    cd backend && gunicorn                               # app.py (SQLite)
+    cd backend && ORDERS_BACKEND=postgres gunicorn       # src/main.py (Supabase)
+
+Workers gthread: cada flujo SSE ocupa un hilo mientras dure la conexión. Los
+hilos del worker son los de las peticiones (GUNICORN_THREADS) más
+ORDER_EVENTS_MAX_SUBSCRIBERS reservados para los tableros; el broker responde
+503 por encima de ese número, así los flujos nunca ocupan los hilos de las
+altas y los listados. Un hilo inactivo esperando eventos cuesta poco (su pila).
+
+- SQLite: un solo worker con varios hilos. SQLite admite un único escritor y
+  el caché de respuestas, los eventos SSE y los trabajos de exportación viven
+  en memoria del proceso, así que más workers no escalan las escrituras y
+  dejarían esos estados desincronizados.
+- Postgres: varios workers; cada uno tiene su pool de conexiones y su
+  conexión LISTEN, que reparte eventos e invalidaciones de caché entre
+  workers. Conexiones totales ~ workers * (DB_POOL_MAX_SIZE + 1); los flujos SSE
+  no usan el pool.
+
+Apagado ordenado: con SIGTERM el worker deja de aceptar conexiones, cierra
+los flujos SSE (los clientes se reconectan a otro worker), espera las
+peticiones en curso hasta graceful_timeout y libera sus recursos.
+"""
+import os
+import shutil
+import signal
+import tempfile
+
+BACKEND = os.getenv('ORDERS_BACKEND', 'sqlite')
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+if BACKEND == 'postgres':
+    chdir = os.path.join(BACKEND_DIR, 'src')
+    wsgi_app = 'main:create_app()'
+    workers = int(os.getenv('WEB_CONCURRENCY', '4'))
+    request_threads = int(os.getenv('GUNICORN_THREADS', os.getenv('DB_POOL_MAX_SIZE', '10')))
+    event_streams = int(os.getenv('ORDER_EVENTS_MAX_SUBSCRIBERS', '64'))
+elif BACKEND == 'sqlite':
+    chdir = BACKEND_DIR
+    wsgi_app = 'app:create_app()'
+    workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+    request_threads = int(os.getenv('GUNICORN_THREADS', '16'))
+    event_streams = int(os.getenv('ORDER_EVENTS_MAX_SUBSCRIBERS', '256'))
+else:
+    raise ValueError(f'ORDERS_BACKEND inválido: {BACKEND} (opciones válidas: sqlite, postgres)')
+
+# Los workers heredan el límite: la app lo aplica en EventBroker
+os.environ['ORDER_EVENTS_MAX_SUBSCRIBERS'] = str(event_streams)
+threads = request_threads + event_streams
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+worker_class = 'gthread'
+# Las exportaciones síncronas (PDF) pueden tardar; con gthread el timeout solo
+# vigila que el bucle del worker siga vivo
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+
+def on_starting(server):
+    # Directorio de exportaciones compartido por los workers del servidor
+    if not os.getenv('EXPORT_JOB_DIR'):
+        os.environ['EXPORT_JOB_DIR'] = tempfile.mkdtemp(prefix='export_jobs_')
+        server._export_job_dir = os.environ['EXPORT_JOB_DIR']
+
+
+def on_exit(server):
+    export_job_dir = getattr(server, '_export_job_dir', None)
+    if export_job_dir:
+        shutil.rmtree(export_job_dir, ignore_errors=True)
+
+
+def lifecycle(worker):
+    """Hooks 'drain' / 'shutdown' que registra create_app en app.extensions"""
+    app = getattr(worker, 'wsgi', None)
+    return app.extensions.get('lifecycle', {}) if app is not None else {}
+
+
+def post_worker_init(worker):
+    # Antes de esperar las peticiones en curso se cierran los flujos SSE, que
+    # de otro modo mantendrían vivo el worker hasta graceful_timeout
+    handle_exit = worker.handle_exit
+    drain = lifecycle(worker).get('drain')
+
+    def drain_and_exit(sig, frame):
+        if drain is not None:
+            drain()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, drain_and_exit)
+
+
+def worker_exit(server, worker):
+    shutdown = lifecycle(worker).get('shutdown')
+    if shutdown is not None:
+        shutdown()
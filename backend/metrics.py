@@ -0,0 +1,486 @@
+"""
+Instrumentación de peticiones y consultas con exposición en formato Prometheus.
+
+Registra, sin dependencias externas:
+
+- Latencia por endpoint (regla de la ruta, método y estado) y su desglose por
+  fase dentro de la petición: espera de conexión (db_acquire), SQL, encode
+  (serialización de la respuesta), export (renderizado de exportaciones) y
+  python (el resto).
+- Duración y filas por sentencia SQL (texto normalizado), con cursores
+  instrumentados para sqlite3 y psycopg2. La duración incluye execute y los
+  fetch*; las filas leídas iterando el cursor (exportaciones) cuentan como
+  tiempo de la exportación. Las sentencias lanzadas con Connection.execute de
+  sqlite3 se miden solo durante execute.
+- Tiempo de espera de conexión, de renderizado de exportaciones y de
+  serialización de respuestas.
+- Log de consultas lentas: las sentencias que superan `slow_query_seconds` se
+  registran en el logger 'orders.slow_query' con su plan (EXPLAIN QUERY PLAN
+  en SQLite, EXPLAIN en Postgres; nunca ANALYZE, que volvería a ejecutarla).
+  Cada sentencia se explica como mucho una vez por `explain_interval` segundos.
+
+Los valores viven en memoria del proceso: con varios workers de gunicorn cada
+scrape de /metrics refleja el worker que lo atendió.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import request
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Sentencias a las que se les pide el plan (EXPLAIN no admite BEGIN, PRAGMA...)
+EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete')
+MAX_STATEMENT_LENGTH = 200
+OTHER_STATEMENT = 'other'
+
+slow_query_logger = logging.getLogger('orders.slow_query')
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{escape_label(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Histograma con etiquetas (acumulativo, como los de Prometheus)"""
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        with self._lock:
+            series = {labels: (list(counts), count, total) for labels, (counts, count, total) in self._series.items()}
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, count, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labels, label_values, [('le', format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = format_labels(self.labels, label_values, [('le', '+Inf')])
+            lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Counter:
+    """Contador con etiquetas"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            series = dict(self._series)
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(series.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, label_values)} {format_value(value)}')
+        return lines
+
+
+class Instrumentation:
+    """Métricas de un proceso: peticiones, SQL, conexiones, exportaciones y serialización"""
+
+    def __init__(self, backend, slow_query_seconds=0.5, explain_interval=60.0, max_statements=500,
+                 enabled=True, prefix='orders'):
+        self.backend = backend
+        self.enabled = enabled
+        self.slow_query_seconds = slow_query_seconds
+        self.explain_interval = explain_interval
+        self.max_statements = max_statements
+        self._statements = set()
+        self._explained_at = {}
+        self._slow_queries = deque(maxlen=100)
+        self._slow_lock = threading.Lock()
+        self._local = threading.local()
+        self._gauges = []
+
+        self.request_duration = Histogram(
+            f'{prefix}_http_request_duration_seconds', 'Duración de las peticiones HTTP',
+            ('method', 'endpoint', 'status')
+        )
+        self.request_phase = Histogram(
+            f'{prefix}_http_request_phase_seconds', 'Tiempo por fase dentro de cada petición',
+            ('endpoint', 'phase')
+        )
+        self.sql_duration = Histogram(
+            f'{prefix}_sql_duration_seconds', 'Duración de cada sentencia SQL (execute + fetch)',
+            ('backend', 'statement')
+        )
+        self.sql_rows = Histogram(
+            f'{prefix}_sql_rows', 'Filas leídas o modificadas por sentencia SQL',
+            ('backend', 'statement'), buckets=ROW_BUCKETS
+        )
+        self.db_acquire = Histogram(
+            f'{prefix}_db_acquire_seconds', 'Espera para obtener una conexión a la base de datos', ('backend',)
+        )
+        self.export_render = Histogram(
+            f'{prefix}_export_render_seconds', 'Tiempo de renderizado de exportaciones', ('format',)
+        )
+        self.response_encode = Histogram(
+            f'{prefix}_response_encode_seconds', 'Tiempo de serialización de las respuestas de listados',
+            ('mimetype', 'encoding')
+        )
+        self.slow_queries_total = Counter(
+            f'{prefix}_slow_queries_total', 'Sentencias SQL por encima del umbral de consulta lenta', ('backend',)
+        )
+        self._metrics = [
+            self.request_duration, self.request_phase, self.sql_duration, self.sql_rows,
+            self.db_acquire, self.export_render, self.response_encode, self.slow_queries_total,
+        ]
+
+    # --- Peticiones ---------------------------------------------------------------
+
+    def init_app(self, app):
+        """Registra los hooks que miden cada petición"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        self._local.started = time.perf_counter()
+        self._local.phases = {}
+
+    def _after_request(self, response):
+        started = getattr(self._local, 'started', None)
+        if not self.enabled or started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        phases = self._local.phases
+        self._local.started = None
+        self._local.phases = None
+
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        self.request_duration.observe(elapsed, request.method, endpoint, str(response.status_code))
+        for phase, seconds in phases.items():
+            self.request_phase.observe(seconds, endpoint, phase)
+        self.request_phase.observe(max(0.0, elapsed - sum(phases.values())), endpoint, 'python')
+        return response
+
+    def add_phase(self, phase, seconds):
+        """Suma tiempo a una fase de la petición en curso (si la hay en este hilo)"""
+        phases = getattr(self._local, 'phases', None)
+        if phases is not None:
+            phases[phase] = phases.get(phase, 0.0) + seconds
+
+    # --- Conexiones, exportaciones y serialización --------------------------------
+
+    def observe_acquire(self, seconds):
+        if self.enabled:
+            self.db_acquire.observe(seconds, self.backend)
+            self.add_phase('db_acquire', seconds)
+
+    def observe_encode(self, seconds, mimetype, encoding):
+        if self.enabled:
+            self.response_encode.observe(seconds, mimetype, encoding or 'identity')
+            self.add_phase('encode', seconds)
+
+    @contextmanager
+    def export_timer(self, export_format):
+        """Mide un renderizado completo; en la petición, la fase 'export' no
+        incluye las sentencias SQL ejecutadas durante el renderizado (fase 'sql')"""
+        phases = getattr(self._local, 'phases', None) or {}
+        sql_before = phases.get('sql', 0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if self.enabled:
+                self.export_render.observe(elapsed, export_format)
+                self.add_phase('export', elapsed - (phases.get('sql', 0.0) - sql_before))
+
+    def timed_iter(self, iterable, export_format):
+        """Mide el tiempo dentro del generador de una exportación en streaming
+        (sin contar la espera por el cliente) y lo registra al terminar"""
+        elapsed = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - started
+                    return
+                elapsed += time.perf_counter() - started
+                yield chunk
+        finally:
+            if self.enabled:
+                self.export_render.observe(elapsed, export_format)
+
+    # --- SQL ----------------------------------------------------------------------
+
+    def statement_label(self, sql):
+        """Texto normalizado de la sentencia; acotado para no crear series sin límite"""
+        label = ' '.join(sql.split())[:MAX_STATEMENT_LENGTH]
+        if label in self._statements:
+            return label
+        if len(self._statements) >= self.max_statements:
+            return OTHER_STATEMENT
+        self._statements.add(label)
+        return label
+
+    def observe_statement(self, cursor, sql, params, seconds, rows):
+        if not self.enabled:
+            return
+        label = self.statement_label(sql)
+        self.sql_duration.observe(seconds, self.backend, label)
+        if rows is not None and rows >= 0:
+            self.sql_rows.observe(rows, self.backend, label)
+        self.add_phase('sql', seconds)
+        if seconds >= self.slow_query_seconds:
+            self.slow_query(cursor, sql, params, seconds, rows, label)
+
+    def slow_query(self, cursor, sql, params, seconds, rows, label):
+        self.slow_queries_total.inc(1, self.backend)
+        now = time.monotonic()
+        with self._slow_lock:
+            explain = (
+                sql.lstrip()[:6].lower().startswith(EXPLAINABLE)
+                and now - self._explained_at.get(label, float('-inf')) >= self.explain_interval
+            )
+            if explain:
+                self._explained_at[label] = now
+
+        plan = None
+        if explain:
+            try:
+                plan = cursor.explain(sql, params)
+            except Exception as e:
+                plan = f'(EXPLAIN falló: {e})'
+
+        entry = {
+            'at': time.time(),
+            'backend': self.backend,
+            'seconds': round(seconds, 6),
+            'rows': rows,
+            'statement': ' '.join(sql.split()),
+            'plan': plan,
+        }
+        with self._slow_lock:
+            self._slow_queries.append(entry)
+        slow_query_logger.warning(
+            'Consulta lenta (%.3fs, %s filas): %s%s', seconds, rows, entry['statement'],
+            f'\n{plan}' if plan else ''
+        )
+
+    def slow_queries(self):
+        with self._slow_lock:
+            return list(self._slow_queries)
+
+    def sqlite_connection_class(self):
+        """Clase para sqlite3.connect(factory=...): sus cursores se miden"""
+        import sqlite3
+
+        instrumentation = self
+
+        def explain(connection, sql, params):
+            # Cursor sin instrumentar sobre la misma conexión
+            plan = sqlite3.Cursor(connection).execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+            return '\n'.join(f'{row[0]}|{row[1]}| {row[3]}' for row in plan)
+
+        class Cursor(TimedCursor, sqlite3.Cursor):
+            _instrumentation = instrumentation
+
+            def explain(self, sql, params):
+                return explain(self.connection, sql, params)
+
+        class Connection(sqlite3.Connection):
+            def cursor(self, factory=Cursor):
+                return super().cursor(factory)
+
+            # Connection.execute de sqlite3 no pasa por cursor(). Quien lo usa
+            # rara vez cierra el cursor que devuelve, así que la sentencia se
+            # registra aquí mismo (solo execute, sin los fetch*) y se devuelve
+            # un cursor sin instrumentar.
+            def execute(self, sql, *args):
+                return self._timed(sqlite3.Cursor.execute, sql, args, args[0] if args else ())
+
+            def executemany(self, sql, *args):
+                # Sin parámetros: no se pide plan para executemany
+                return self._timed(sqlite3.Cursor.executemany, sql, args, ())
+
+            def _timed(self, method, sql, args, params):
+                cursor = sqlite3.Cursor(self)
+                started = time.perf_counter()
+                try:
+                    return method(cursor, sql, *args)
+                finally:
+                    seconds = time.perf_counter() - started
+                    rows = cursor.rowcount if cursor.rowcount >= 0 else None
+                    instrumentation.observe_statement(self, sql, params, seconds, rows)
+
+            def explain(self, sql, params):
+                return explain(self, sql, params)
+
+        return Connection
+
+    def psycopg2_cursor_class(self, base):
+        """Subclase de `base` (p. ej. RealDictCursor) para cursor_factory"""
+        import psycopg2.extensions
+
+        instrumentation = self
+
+        class Cursor(TimedCursor, base):
+            _instrumentation = instrumentation
+
+            def explain(self, sql, params):
+                connection = self.connection
+                plain = connection.cursor(cursor_factory=psycopg2.extensions.cursor)
+                # Un EXPLAIN fallido no debe abortar la transacción de la petición
+                in_transaction = connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                if in_transaction:
+                    plain.execute('SAVEPOINT slow_query_explain')
+                try:
+                    plain.execute(f'EXPLAIN {sql}', params)
+                    plan = '\n'.join(row[0] for row in plain.fetchall())
+                except Exception:
+                    if in_transaction:
+                        plain.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                    raise
+                finally:
+                    if in_transaction and connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+                        plain.execute('RELEASE SAVEPOINT slow_query_explain')
+                    plain.close()
+                return plan
+
+        return Cursor
+
+    # --- Exposición ---------------------------------------------------------------
+
+    def add_gauges(self, prefix, collect):
+        """`collect()` devuelve un dict {nombre: número}; cada clave se expone como gauge"""
+        self._gauges.append((prefix, collect))
+
+    def render(self):
+        """Texto en formato de exposición de Prometheus (text/plain; version=0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, collect in self._gauges:
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for name, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f'# TYPE {prefix}_{name} gauge')
+                lines.append(f'{prefix}_{name} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class TimedCursor:
+    """Mixin de cursor DB-API: mide cada sentencia desde execute hasta el último fetch.
+
+    La sentencia se registra al leer todas sus filas, al ejecutar la
+    siguiente o al cerrar el cursor.
+    """
+
+    _instrumentation = None
+    _pending = None   # [sql, params, segundos, filas leídas o None]
+
+    def execute(self, sql, *args, **kwargs):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *args, **kwargs)
+        finally:
+            params = args[0] if args else kwargs.get('parameters', kwargs.get('vars'))
+            self._pending = [sql, params, time.perf_counter() - started, None]
+
+    def executemany(self, sql, *args, **kwargs):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, *args, **kwargs)
+        finally:
+            # Sin parámetros: no se pide plan para executemany
+            self._pending = [sql, None, time.perf_counter() - started, None]
+            self._finish()
+
+    def _fetched(self, started, rows, done):
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - started
+            pending[3] = (pending[3] or 0) + rows
+            if done:
+                self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        self._fetched(started, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def _finish(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        sql, params, seconds, rows = pending
+        if rows is None:
+            rows = self.rowcount if self.rowcount >= 0 else None
+        if params is None:
+            params = ()
+        self._instrumentation.observe_statement(self, sql, params, seconds, rows)
@@ -0,0 +1,143 @@
+"""
+Índice en memoria de las órdenes abiertas (opcional).
+
+Los operadores trabajan casi siempre con las órdenes abiertas de sus celdas.
+Con el índice activo, el listado de abiertas (status=open, con o sin celda y
+con paginación por cursor) y la búsqueda por número de orden se responden
+desde memoria, sin consultar la base de datos.
+
+- Registros compactos con __slots__ que se comportan como filas del cursor
+  (keys() e índice), así ResponseEncoder los serializa igual que una consulta.
+- Por número de orden (dict) y por celda: lista ordenada por (order_date, id)
+  con bisect para la paginación por cursor.
+- Se calienta al arrancar (init_db) y se mantiene al día con el feed de
+  cambios (change_version): tras cada escritura del proceso y, con varios
+  workers, con cada notificación de otro worker. Cada sincronización aplica
+  las órdenes con change_version mayor que la última vista; las cerradas se
+  quitan y las abiertas se insertan o reemplazan, así repetir un cambio no
+  altera el resultado.
+
+La base de datos se consulta mediante funciones que entrega cada backend:
+`fetch_open()` -> (filas abiertas, versión) y `fetch_changes(since)` ->
+(filas cambiadas, versión). Las filas deben incluir las columnas del índice,
+la columna de orden (`sort_column`) e is_closed.
+"""
+import threading
+from bisect import bisect_left
+
+
+class OpenOrder:
+    """Orden abierta; `columns` (columnas de salida) lo fija cada índice"""
+
+    __slots__ = (
+        'id', 'order_number', 'accessories', 'extra_accessory', 'selected', 'celda',
+        'order_date', 'is_closed', 'accessories_added', 'change_version', 'sort_key',
+    )
+    columns = ()
+
+    def __init__(self, row, sort_column):
+        for name in self.columns:
+            setattr(self, name, row[name])
+        self.sort_key = (row[sort_column], row['id'])
+
+    def keys(self):
+        return self.columns
+
+    def __getitem__(self, key):
+        return getattr(self, self.columns[key] if isinstance(key, int) else key)
+
+
+class OpenOrderIndex:
+    """Órdenes abiertas por número y por celda, seguro entre hilos"""
+
+    def __init__(self, columns, sort_column):
+        self.record_class = type('OpenOrder', (OpenOrder,), {'__slots__': (), 'columns': tuple(columns)})
+        self.sort_column = sort_column
+        self.version = 0
+        self.ready = False
+        self._lock = threading.Lock()
+        # Serializa warm/sync: las versiones se aplican en orden
+        self._sync_lock = threading.Lock()
+        self._by_id = {}
+        self._by_number = {}
+        self._by_celda = {}    # celda -> registros ordenados por sort_key
+        self._keys = {}        # celda -> sort_keys (paralela, para bisect)
+
+    def warm(self, fetch_open):
+        """Carga todas las órdenes abiertas (reemplaza el contenido actual)"""
+        with self._sync_lock:
+            rows, version = fetch_open()
+            records = sorted((self.record_class(row, self.sort_column) for row in rows), key=lambda record: record.sort_key)
+            by_celda = {}
+            for record in records:
+                by_celda.setdefault(record.celda, []).append(record)
+            with self._lock:
+                self._by_id = {record.id: record for record in records}
+                self._by_number = {record.order_number: record for record in records}
+                self._by_celda = by_celda
+                self._keys = {celda: [record.sort_key for record in bucket] for celda, bucket in by_celda.items()}
+                self.version = version
+                self.ready = True
+
+    def sync(self, fetch_changes):
+        """Aplica los cambios posteriores a la última versión vista"""
+        with self._sync_lock:
+            if not self.ready:
+                return
+            rows, version = fetch_changes(self.version)
+            with self._lock:
+                for row in rows:
+                    self._remove(row['id'])
+                    if not row['is_closed']:
+                        self._insert(self.record_class(row, self.sort_column))
+                self.version = max(self.version, version)
+
+    def _insert(self, record):
+        bucket = self._by_celda.setdefault(record.celda, [])
+        keys = self._keys.setdefault(record.celda, [])
+        position = bisect_left(keys, record.sort_key)
+        keys.insert(position, record.sort_key)
+        bucket.insert(position, record)
+        self._by_id[record.id] = record
+        self._by_number[record.order_number] = record
+
+    def _remove(self, order_id):
+        record = self._by_id.pop(order_id, None)
+        if record is None:
+            return
+        if self._by_number.get(record.order_number) is record:
+            del self._by_number[record.order_number]
+        keys = self._keys[record.celda]
+        position = bisect_left(keys, record.sort_key)
+        del keys[position]
+        del self._by_celda[record.celda][position]
+
+    def get(self, order_number):
+        return self._by_number.get(order_number)
+
+    def page(self, celda=None, position=None, limit=100):
+        """Hasta `limit` órdenes abiertas, más recientes primero, anteriores a `position`.
+
+        Devuelve (registros, total de abiertas en el filtro, versión del índice).
+        """
+        with self._lock:
+            celdas = [celda] if celda else list(self._by_celda)
+            candidates = []
+            total = 0
+            for name in celdas:
+                keys = self._keys.get(name, [])
+                total += len(keys)
+                end = bisect_left(keys, tuple(position)) if position else len(keys)
+                candidates.extend(self._by_celda[name][max(0, end - limit):end] if keys else [])
+            version = self.version
+        candidates.sort(key=lambda record: record.sort_key, reverse=True)
+        return candidates[:limit], total, version
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'ready': self.ready,
+                'orders': len(self._by_id),
+                'version': self.version,
+                'celdas': {celda: len(bucket) for celda, bucket in self._by_celda.items()},
+            }
@@ -0,0 +1,166 @@
+"""
+Eventos de órdenes en tiempo real (Server-Sent Events).
+
+Los tableros de órdenes abiertas se suscriben a un flujo SSE en lugar de
+consultar el listado periódicamente. EventBroker reparte cada evento
+(order_created / order_closed) a las colas de los suscriptores de este
+proceso, filtrando por celda; las conexiones inactivas solo reciben un
+comentario de keepalive cada `heartbeat` segundos y no tocan la base de datos.
+
+Cada flujo abierto ocupa un hilo del worker (gthread) mientras dure la
+conexión. `max_subscribers` limita los flujos por proceso: gunicorn.conf.py
+reserva ese número de hilos para SSE además de los de las peticiones, y al
+llegar al límite la ruta responde 503 en lugar de dejar sin hilos a las altas
+y los listados.
+"""
+import json
+import queue
+import threading
+
+from flask import Response, jsonify
+
+ORDER_CREATED = 'order_created'
+ORDER_CLOSED = 'order_closed'
+
+# Órdenes cerradas movidas al archivo (ya no aparecen en los listados por defecto)
+ORDERS_ARCHIVED = 'orders_archived'
+
+# Evento que pide al cliente resincronizar con el feed de cambios
+RESYNC = 'resync'
+
+
+class TooManySubscribers(Exception):
+    """Se alcanzó max_subscribers en este proceso"""
+
+
+class Subscription:
+    """Cola de eventos de un cliente SSE"""
+
+    def __init__(self, celda=None, max_queue=100):
+        self.celda = celda
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False
+        self.closed = False
+
+    def wants(self, event):
+        # Los eventos sin celda (p. ej. resync) van a todos los suscriptores
+        return self.celda is None or event.get('celda') in (None, self.celda)
+
+
+class EventBroker:
+    """Reparte eventos entre los suscriptores de este proceso (seguro entre hilos)"""
+
+    def __init__(self, max_queue=100, max_subscribers=None):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._closed = False
+
+    def subscribe(self, celda=None):
+        subscription = Subscription(celda, self.max_queue)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f'Límite de {self.max_subscribers} flujos de eventos alcanzado')
+            subscription.closed = self._closed
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event):
+        """Encola el evento para cada suscriptor interesado; nunca bloquea"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if not subscription.wants(event):
+                continue
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # Cliente demasiado lento: se descartan sus eventos y se le pide resincronizar
+                subscription.overflowed = True
+
+    def close(self):
+        """Termina todos los flujos (apagado del worker); los clientes se reconectan a otro"""
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.closed = True
+            try:
+                # Despierta al generador que espera en queue.get
+                subscription.queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+def format_sse(event_type, data, event_id=None):
+    """Serializa un evento en formato text/event-stream"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def stream_events(broker, subscription, heartbeat=15.0, retry_ms=3000):
+    """Generador SSE para una suscripción ya creada; la da de baja al cerrarse la conexión.
+
+    La suscripción se crea antes de la respuesta (broker.subscribe) para poder
+    responder 503 al alcanzar el límite; event_stream_response hace las dos cosas.
+    El id de cada evento es el change_version de la orden, así que tras una
+    reconexión el cliente puede recuperar lo perdido con el feed de cambios
+    usando Last-Event-ID como 'since'.
+    """
+    try:
+        yield f'retry: {retry_ms}\n\n'
+        while not subscription.closed:
+            try:
+                event = subscription.queue.get(timeout=heartbeat)
+            except queue.Empty:
+                event = None
+
+            if subscription.closed:
+                return
+
+            if subscription.overflowed:
+                subscription.overflowed = False
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                yield format_sse(RESYNC, {})
+                continue
+
+            if event is None:
+                yield ': keepalive\n\n'
+                continue
+
+            yield format_sse(event['type'], event, event.get('change_version'))
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def event_stream_response(broker, celda=None, heartbeat=15.0, retry_after=5):
+    """Respuesta Flask del flujo SSE, o 503 con Retry-After si no quedan plazas"""
+    try:
+        subscription = broker.subscribe(celda)
+    except TooManySubscribers as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(retry_after)
+        return response
+
+    response = Response(stream_events(broker, subscription, heartbeat=heartbeat), mimetype='text/event-stream')
+    # Si el cliente se va antes de la primera lectura el generador nunca
+    # arranca (ni corre su finally): la baja se hace también al cerrar
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
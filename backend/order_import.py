@@ -0,0 +1,219 @@
+"""
+Importación masiva de órdenes desde manifiestos CSV/XLSX.
+
+Se aceptan los dos formatos que generan las exportaciones a Excel:
+
+- app.py: una fila por orden ('Número de Orden', 'Accesorios' como
+  "tipo (xN),tipo (xM)", 'Accesorio Extra' Sí/No, 'Celda', 'Fecha de Orden',
+  'Estado').
+- main.py: una fila por accesorio (order_number, extra_accessory, selected,
+  celda, order_date, is_closed, accessories_added, accessory_type, quantity).
+
+Ambos se normalizan al formato de una fila por accesorio y se validan con
+operaciones vectorizadas de pandas. Una orden con alguna fila inválida se
+rechaza completa y cada error indica la fila del archivo (1 = encabezado).
+
+pandas se importa al leer el primer manifiesto, no al importar el módulo:
+Manifest, batches y ManifestError no lo necesitan.
+"""
+import io
+from datetime import datetime
+
+SUMMARY_COLUMNS = ['Número de Orden', 'Accesorios', 'Accesorio Extra', 'Celda', 'Fecha de Orden', 'Estado']
+FLAT_COLUMNS = [
+    'order_number', 'extra_accessory', 'selected', 'celda', 'order_date',
+    'is_closed', 'accessories_added', 'accessory_type', 'quantity'
+]
+
+ORDER_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+TRUE_VALUES = {'true', '1', 't', 'sí', 'si', 'yes', 'y', 'verdadero'}
+FALSE_VALUES = {'false', '0', 'f', 'no', 'n', '', 'falso'}
+
+# 'Estado' del formato de app.py -> (is_closed, accessories_added)
+STATUS_VALUES = {
+    'abierta': (False, False),
+    'cerrada - agregados': (True, True),
+    'cerrada - no agregados': (True, False),
+}
+
+
+class ManifestError(ValueError):
+    """El archivo no se puede leer o no tiene un formato reconocido"""
+
+
+class Manifest:
+    """Resultado de leer un manifiesto.
+
+    `orders`: tuplas (order_number, extra_accessory, selected, celda,
+    order_date en epoch, is_closed, accessories_added), una por orden válida.
+    `accessories`: tuplas (order_number, accessory_type, quantity).
+    `rows`: order_number -> primera fila del archivo (para informar errores
+    de escritura). `errors`: dicts {row, order_number, error}.
+    """
+
+    def __init__(self, orders, accessories, rows, errors):
+        self.orders = orders
+        self.accessories = accessories
+        self.rows = rows
+        self.errors = errors
+
+
+def read_manifest(stream, filename, valid_celdas=None):
+    frame = _read_frame(stream, filename)
+    frame.columns = [str(column).strip() for column in frame.columns]
+    # Fila del archivo: el encabezado es la fila 1
+    frame['row'] = frame.index + 2
+
+    if set(FLAT_COLUMNS) <= set(frame.columns):
+        flat = frame[FLAT_COLUMNS + ['row']]
+    elif set(SUMMARY_COLUMNS) <= set(frame.columns):
+        flat = _flatten_summary(frame)
+    else:
+        raise ManifestError(
+            'Columnas no reconocidas. Se espera el formato de exportación: '
+            + ', '.join(SUMMARY_COLUMNS) + ' o ' + ', '.join(FLAT_COLUMNS)
+        )
+
+    return _validate(flat.reset_index(drop=True), valid_celdas)
+
+
+def preload():
+    """Importa pandas por adelantado (workers dedicados a importar)"""
+    import pandas  # noqa: F401
+
+
+def _read_frame(stream, filename):
+    import pandas as pd
+
+    name = (filename or '').lower()
+    data = stream.read()
+    try:
+        if name.endswith('.xlsx'):
+            return pd.read_excel(io.BytesIO(data), dtype=str, keep_default_na=False, engine='openpyxl')
+        if name.endswith('.csv'):
+            return pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    except Exception as e:
+        raise ManifestError(f'No se pudo leer el archivo: {e}')
+    raise ManifestError('Formato no soportado. Formatos válidos: .csv, .xlsx')
+
+
+def _flatten_summary(frame):
+    """Formato de app.py -> una fila por accesorio"""
+    import pandas as pd
+
+    status = frame['Estado'].str.strip().str.lower()
+    flat = pd.DataFrame({
+        'order_number': frame['Número de Orden'],
+        'extra_accessory': frame['Accesorio Extra'],
+        'selected': 'false',
+        'celda': frame['Celda'],
+        'order_date': frame['Fecha de Orden'],
+        'is_closed': status.map(lambda value: STATUS_VALUES.get(value, (None, None))[0]),
+        'accessories_added': status.map(lambda value: STATUS_VALUES.get(value, (None, None))[1]),
+        'accessories': frame['Accesorios'].str.split(','),
+        'row': frame['row'],
+    })
+    flat['status_invalid'] = ~status.isin(list(STATUS_VALUES))
+
+    flat = flat.explode('accessories', ignore_index=True)
+    parts = flat['accessories'].fillna('').str.strip().str.extract(r'^(.*\S)\s*\(x(-?\d+)\)$')
+    flat['accessory_invalid'] = flat['accessories'].fillna('').str.strip().ne('') & parts[0].isna()
+    flat['accessory_type'] = parts[0].fillna('')
+    flat['quantity'] = parts[1].fillna('')
+    for column in ('is_closed', 'accessories_added'):
+        flat[column] = flat[column].map({True: 'true', False: 'false'}).fillna('')
+    return flat.drop(columns=['accessories'])
+
+
+def _parse_bool(series, column, problems):
+    normalized = series.astype(str).str.strip().str.lower()
+    invalid = ~normalized.isin(TRUE_VALUES | FALSE_VALUES)
+    problems.append((invalid, f'Valor inválido en {column}'))
+    return normalized.isin(TRUE_VALUES)
+
+
+def _validate(flat, valid_celdas):
+    import pandas as pd
+
+    problems = []
+    for column in ('order_number', 'celda', 'order_date', 'accessory_type', 'quantity'):
+        flat[column] = flat[column].astype(str).str.strip()
+
+    problems.append((flat['order_number'].eq(''), 'Número de orden vacío'))
+    if 'status_invalid' in flat:
+        problems.append((flat['status_invalid'], 'Estado inválido'))
+        problems.append((flat['accessory_invalid'], 'Accesorio inválido (formato: "tipo (xN)")'))
+
+    extra = _parse_bool(flat['extra_accessory'], 'extra_accessory', problems)
+    selected = _parse_bool(flat['selected'], 'selected', problems)
+    closed = _parse_bool(flat['is_closed'], 'is_closed', problems)
+    added = _parse_bool(flat['accessories_added'], 'accessories_added', problems)
+
+    if valid_celdas is not None:
+        problems.append((~flat['celda'].isin(valid_celdas), 'Celda inválida'))
+
+    parsed_dates = pd.to_datetime(flat['order_date'], format=ORDER_DATE_FORMAT, errors='coerce')
+    problems.append((flat['order_date'].ne('') & parsed_dates.isna(), 'Fecha inválida (formato: YYYY-MM-DD HH:MM:SS)'))
+
+    quantity = pd.to_numeric(flat['quantity'], errors='coerce')
+    has_accessory = flat['accessory_type'].ne('') | flat['quantity'].ne('')
+    problems.append((has_accessory & flat['accessory_type'].eq(''), 'Tipo de accesorio vacío'))
+    problems.append((
+        has_accessory & (quantity.isna() | (quantity <= 0) | (quantity % 1 != 0)),
+        'Cantidad inválida (entero positivo)'
+    ))
+
+    errors = []
+    invalid_rows = pd.Series(False, index=flat.index)
+    for mask, message in problems:
+        mask = mask.fillna(True).astype(bool)
+        invalid_rows |= mask
+        for row, order_number in zip(flat.loc[mask, 'row'], flat.loc[mask, 'order_number']):
+            errors.append({'row': int(row), 'order_number': order_number, 'error': message})
+
+    # Una orden con cualquier fila inválida se rechaza completa
+    rejected = set(flat.loc[invalid_rows, 'order_number'])
+    valid = ~flat['order_number'].isin(rejected)
+
+    flat = flat.assign(
+        extra_accessory=extra, selected=selected, is_closed=closed, accessories_added=added,
+        quantity=quantity
+    )[valid]
+
+    # Las fechas vacías toman la hora actual; el texto se interpreta en hora local
+    now = int(datetime.now().timestamp())
+    epochs = {
+        value: int(datetime.strptime(value, ORDER_DATE_FORMAT).timestamp())
+        for value in flat['order_date'].unique() if value
+    }
+    flat = flat.assign(order_date=flat['order_date'].map(epochs).fillna(now).astype('int64'))
+
+    # Los datos de la orden se toman de su primera fila
+    firsts = flat.drop_duplicates('order_number')
+    orders = list(zip(
+        firsts['order_number'], firsts['extra_accessory'].map(bool), firsts['selected'].map(bool),
+        firsts['celda'], firsts['order_date'].map(int),
+        firsts['is_closed'].map(bool), firsts['accessories_added'].map(bool)
+    ))
+    rows = dict(zip(firsts['order_number'], firsts['row'].map(int)))
+
+    with_accessories = flat[flat['accessory_type'].ne('')]
+    accessories = list(zip(
+        with_accessories['order_number'], with_accessories['accessory_type'],
+        with_accessories['quantity'].map(int)
+    ))
+
+    errors.sort(key=lambda error: error['row'])
+    return Manifest(orders, accessories, rows, errors)
+
+
+def batches(manifest, size):
+    """Divide el manifiesto en lotes de `size` órdenes con sus accesorios"""
+    by_order = {}
+    for accessory in manifest.accessories:
+        by_order.setdefault(accessory[0], []).append(accessory)
+    for start in range(0, len(manifest.orders), size):
+        orders = manifest.orders[start:start + size]
+        accessories = [accessory for order in orders for accessory in by_order.get(order[0], [])]
+        yield orders, accessories
@@ -0,0 +1,174 @@
+"""
+Reportes PDF incrementales con caché por día.
+
+El reporte se divide en secciones de un día. Cada sección se renderiza por
+separado (tablas troceadas con encabezado repetido, así reportlab nunca
+maqueta la tabla completa de una vez) y las secciones de días pasados se
+guardan en caché en disco, indexadas por los filtros y una huella de los
+datos del día. Al volver a exportar un rango, solo se renderizan los días
+sin caché o cuyos datos cambiaron (normalmente solo el día de hoy); después
+las secciones se concatenan con pypdf.
+
+reportlab y pypdf se importan al renderizar el primer reporte: los workers
+que nunca exportan no pagan su tiempo de carga ni su memoria. SectionCache
+no los necesita.
+"""
+import hashlib
+import io
+import os
+import tempfile
+from datetime import date
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+# Filas por tabla: cada trozo se maqueta y divide entre páginas por separado
+ROWS_PER_TABLE = 200
+
+# Tamaño carta en puntos (reportlab.lib.pagesizes.letter)
+LETTER = (612.0, 792.0)
+
+
+@lru_cache(maxsize=None)
+def table_style():
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ])
+
+
+def preload():
+    """Importa reportlab y pypdf por adelantado (workers dedicados a exportar)"""
+    import pypdf  # noqa: F401
+
+    table_style()
+
+
+class SectionCache:
+    """Caché en disco de secciones PDF ya renderizadas (compartida entre procesos)"""
+
+    def __init__(self, directory=None, max_entries=1000):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'pdf_section_cache')
+        self.max_entries = max_entries
+        os.makedirs(self.directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.pdf')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as cached:
+                data = cached.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        path = self._path(key)
+        partial = f'{path}.{os.getpid()}.tmp'
+        with open(partial, 'wb') as output:
+            output.write(data)
+        os.replace(partial, path)
+        self._evict()
+
+    def _evict(self):
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.pdf')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: os.path.getmtime(entry))
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry)
+            except FileNotFoundError:
+                pass
+
+
+def render_section(title, subtitle, header, col_widths, rows, wrap_columns=(), pagesize=LETTER):
+    """Renderiza una sección (un día) y devuelve los bytes del PDF.
+
+    Las filas se consumen de forma incremental en tablas de ROWS_PER_TABLE
+    filas con encabezado repetido en cada página. Las columnas de
+    `wrap_columns` se envuelven en Paragraph para que el texto largo haga salto de línea.
+    """
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Table
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=pagesize, title=title)
+    styles = getSampleStyleSheet()
+    cell_style = styles['BodyText'].clone('ReportCell', fontSize=8, leading=9)
+
+    elements = [Paragraph(title, styles['Title'])]
+    if subtitle:
+        elements.append(Paragraph(subtitle, styles['Heading2']))
+
+    def table(chunk):
+        return Table([header] + chunk, colWidths=col_widths, repeatRows=1, style=table_style())
+
+    chunk = []
+    tables = 0
+    for row in rows:
+        if wrap_columns:
+            row = [
+                Paragraph(escape(str(value)), cell_style) if index in wrap_columns else value
+                for index, value in enumerate(row)
+            ]
+        chunk.append(row)
+        if len(chunk) >= ROWS_PER_TABLE:
+            elements.append(table(chunk))
+            tables += 1
+            chunk = []
+    if chunk or not tables:
+        elements.append(table(chunk))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+def build_report(target, title, header, col_widths, sections, cache=None, cache_scope=(), wrap_columns=()):
+    """Construye el reporte completo en `target` (ruta o archivo).
+
+    `sections` es un iterable de (día, huella, rows_factory); rows_factory()
+    devuelve las filas del día y solo se invoca si la sección no está en caché.
+    Solo se cachean los días anteriores a hoy. `cache_scope` distingue
+    reportes con filtros distintos. Devuelve el número de secciones renderizadas.
+    """
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    today = date.today()
+    rendered = 0
+
+    for day, fingerprint, rows_factory in sections:
+        key = (cache_scope, title, tuple(header), str(day), fingerprint)
+        cacheable = cache is not None and day is not None and day < today
+        data = cache.get(key) if cacheable else None
+
+        if data is None:
+            data = render_section(title, str(day) if day else '', header, col_widths, rows_factory(), wrap_columns)
+            rendered += 1
+            if cacheable:
+                cache.put(key, data)
+
+        writer.append(io.BytesIO(data))
+
+    if not writer.pages:
+        writer.append(io.BytesIO(render_section(title, '', header, col_widths, [])))
+
+    writer.write(target)
+    return rendered
@@ -0,0 +1,149 @@
+"""
+Caché de respuestas de lectura con ETag e invalidación por escritura.
+
+Las respuestas de los listados se guardan ya serializadas, indexadas por ruta y
+parámetros normalizados. Cada escritura (alta o cierre de orden) incrementa la
+generación del caché, lo que invalida todas las entradas anteriores de una vez.
+Las respuestas llevan un ETag fuerte (hash del cuerpo) y Cache-Control:
+no-cache, así que un sondeo sin cambios responde 304 sin consultar la base de
+datos ni serializar JSON.
+
+El almacenamiento es intercambiable: MemoryBackend (LRU + TTL en el proceso) o
+cualquier objeto con get/set/incr/clear, p. ej. RedisBackend para compartir el
+caché entre procesos.
+"""
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, current_app
+
+
+class MemoryBackend:
+    """Almacén LRU con TTL por entrada, seguro entre hilos"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            # Las entradas de generaciones anteriores ya no se pueden leer
+            self._entries.clear()
+            return self._counters[key]
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Almacén compartido entre procesos sobre Redis (dependencia opcional)"""
+
+    def __init__(self, url, prefix='orders_cache:'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self._redis.get(self.prefix + key)
+        return pickle.loads(data) if data is not None else None
+
+    def set(self, key, value, ttl):
+        self._redis.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(ttl)))
+
+    def incr(self, key):
+        return self._redis.incr(self.prefix + key)
+
+    def counter(self, key):
+        return int(self._redis.get(self.prefix + key) or 0)
+
+    def clear(self):
+        self.incr('generation')
+
+
+class ResponseCache:
+    """Caché de respuestas Flask con ETag; `cached` decora las vistas de lectura.
+
+    `enabled` es un callable opcional: si devuelve False se omite el caché
+    (por ejemplo, mientras no se reciben invalidaciones de otros procesos).
+    `variant` es un callable opcional que identifica la representación
+    negociada (formato y compresión); forma parte de la clave.
+    """
+
+    def __init__(self, backend=None, ttl=60, enabled=None, variant=None):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self._enabled = enabled or (lambda: True)
+        self._variant = variant or (lambda: '')
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self.backend.incr('generation')
+
+    def key(self):
+        """Ruta + parámetros normalizados (orden de parámetros irrelevante) + variante"""
+        args = sorted((name, value) for name, values in request.args.lists() for value in values)
+        return f'{request.path}?{args!r}#{self._variant()}'
+
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self._enabled():
+                return view(*args, **kwargs)
+
+            # La generación se lee antes de consultar: si una escritura llega
+            # mientras tanto, la respuesta queda guardada bajo una generación vieja
+            generation = self.backend.counter('generation')
+            key = f'{generation}:{self.key()}'
+
+            entry = self.backend.get(key)
+            if entry is not None:
+                self.hits += 1
+                body, status, headers = entry
+                response = current_app.response_class(body, status=status, headers=headers)
+            else:
+                self.misses += 1
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+                response.headers['Cache-Control'] = 'no-cache'
+                self.backend.set(key, (response.get_data(), response.status_code, list(response.headers)), self.ttl)
+
+            # 304 si If-None-Match coincide con el ETag
+            return response.make_conditional(request)
+        return wrapper
+
+    def metrics(self):
+        return {'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
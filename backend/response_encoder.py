@@ -0,0 +1,162 @@
+"""
+Serialización de los listados: JSON rápido, MessagePack opcional y compresión.
+
+Los listados se serializan directamente desde las filas del cursor
+(sqlite3.Row o RealDictRow): las columnas se resuelven una vez por respuesta
+y cada fila produce solo el objeto de salida, sin dict(row) + copias + jsonify.
+Las columnas que la base ya entrega como texto JSON (los accesorios de
+json_group_array) se incrustan sin decodificarlas cuando el backend lo
+permite (orjson.Fragment, orjson >= 3.9).
+
+- JSON: orjson si está instalado; si no, json de la biblioteca estándar.
+- MessagePack: con `Accept: application/msgpack` y el paquete msgpack instalado.
+- Compresión: br (paquete brotli) o gzip según Accept-Encoding, solo para
+  cuerpos de al menos `compress_min_size` bytes.
+
+`variant()` identifica la representación que recibirá la petición actual;
+ResponseCache la incluye en la clave para no servir un cuerpo comprimido o en
+MessagePack a un cliente que no lo pidió.
+"""
+import gzip
+import json
+import time
+
+from flask import request, current_app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+class ResponseEncoder:
+    """Construye respuestas de listados a partir de filas del cursor"""
+
+    def __init__(self, compress_min_size=1024, compress_level=6, use_orjson=True, observe=None):
+        self.compress_min_size = compress_min_size
+        self.compress_level = compress_level
+        # observe(segundos, mimetype, content-encoding) tras cada serialización
+        self._observe = observe
+        self.use_orjson = use_orjson and orjson is not None
+        self.fragments = self.use_orjson and hasattr(orjson, 'Fragment')
+
+    @property
+    def json_backend(self):
+        return 'orjson' if self.use_orjson else 'json'
+
+    def dumps_json(self, value):
+        if self.use_orjson:
+            return orjson.dumps(value)
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+    def loads_json(self, data):
+        return orjson.loads(data) if self.use_orjson else json.loads(data)
+
+    def records(self, rows, drop=(), json_columns=(), convert=None, raw_json=False):
+        """Genera un dict por fila con las columnas finales de la respuesta.
+
+        `drop`: columnas internas que no se envían. `json_columns`: columnas con
+        texto JSON; con raw_json=True y orjson.Fragment se incrustan tal cual,
+        si no se decodifican. `convert`: {columna: función} para formatear valores.
+        """
+        convert = convert or {}
+        fields = None
+        for row in rows:
+            if fields is None:
+                # Índices y transformaciones resueltos una vez por respuesta
+                # (RealDictRow se lee por nombre; sqlite3.Row, más rápido por índice)
+                by_name = isinstance(row, dict)
+                fields = []
+                for index, name in enumerate(row.keys()):
+                    if name in drop:
+                        continue
+                    if name in json_columns:
+                        transform = orjson.Fragment if raw_json and self.fragments else self.loads_json
+                    else:
+                        transform = convert.get(name)
+                    fields.append((name, name if by_name else index, transform))
+            record = {}
+            for name, key, transform in fields:
+                value = row[key]
+                record[name] = transform(value) if transform is not None and value is not None else value
+            yield record
+
+    def negotiate(self):
+        """(mimetype, content-encoding) para la petición actual"""
+        accept = request.accept_mimetypes
+        mimetype = JSON_MIMETYPE
+        if msgpack is not None:
+            # MessagePack solo si el cliente lo prefiere explícitamente a JSON
+            for candidate in MSGPACK_MIMETYPES:
+                if accept.quality(candidate) > accept.quality(JSON_MIMETYPE):
+                    mimetype = candidate
+                    break
+
+        encodings = request.accept_encodings
+        encoding = None
+        if brotli is not None and encodings['br']:
+            encoding = 'br'
+        elif encodings['gzip']:
+            encoding = 'gzip'
+        return mimetype, encoding
+
+    def variant(self):
+        mimetype, encoding = self.negotiate()
+        return f'{mimetype};{encoding or "identity"}'
+
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=min(self.compress_level, 11))
+        return gzip.compress(body, compresslevel=self.compress_level, mtime=0)
+
+    def encode(self, rows, drop=(), json_columns=(), convert=None):
+        """Devuelve (cuerpo, mimetype, content-encoding) para la petición actual"""
+        started = time.perf_counter()
+        mimetype, encoding = self.negotiate()
+        if mimetype == JSON_MIMETYPE:
+            body = self.dumps_json(list(self.records(rows, drop, json_columns, convert, raw_json=True)))
+        else:
+            body = msgpack.packb(list(self.records(rows, drop, json_columns, convert)), default=str)
+
+        if encoding is None or len(body) < self.compress_min_size:
+            encoding = None
+        else:
+            body = self.compress(body, encoding)
+        if self._observe is not None:
+            self._observe(time.perf_counter() - started, mimetype, encoding)
+        return body, mimetype, encoding
+
+    def rows_response(self, rows, drop=(), json_columns=(), convert=None, status=200):
+        """Respuesta Flask con las filas serializadas (y comprimidas si conviene)"""
+        body, mimetype, encoding = self.encode(rows, drop, json_columns, convert)
+        response = current_app.response_class(body, status=status, mimetype=mimetype)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.update(('Accept', 'Accept-Encoding'))
+        return response
+
+    def row_response(self, row, drop=(), json_columns=(), convert=None, status=200):
+        """Respuesta con una sola fila serializada como objeto"""
+        record = next(self.records([row], drop, json_columns, convert, raw_json=True))
+        return current_app.response_class(self.dumps_json(record), status=status, mimetype=JSON_MIMETYPE)
+
+    def metrics(self):
+        return {
+            'json': self.json_backend,
+            'msgpack': msgpack is not None,
+            'compression': ['br', 'gzip'] if brotli is not None else ['gzip'],
+            'compress_min_size': self.compress_min_size,
+        }
@@ -0,0 +1,195 @@
+"""
+Pool de conexiones a la base de datos para main.py.
+
+Reutiliza conexiones entre peticiones para no pagar el handshake TLS y la
+autenticación contra Supabase en cada llamada. Admite tamaño mínimo/máximo,
+tiempo máximo de espera al pedir una conexión, verificación de salud al
+entregarla y vida máxima por conexión. `connect` es cualquier función que
+devuelva una conexión DB-API, así el pool funciona igual contra un Postgres
+local de pruebas.
+"""
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """No se obtuvo una conexión libre dentro de acquire_timeout"""
+
+
+class ConnectionPool:
+    """Pool de conexiones seguro entre hilos"""
+
+    def __init__(self, connect, min_size=1, max_size=10, acquire_timeout=5.0,
+                 max_lifetime=1800.0, check_after_idle=30.0):
+        if min_size > max_size:
+            raise ValueError('min_size no puede ser mayor que max_size')
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+        self.check_after_idle = check_after_idle
+
+        self._cond = threading.Condition()
+        self._idle = deque()      # (conexión, creada_en, liberada_en)
+        self._created_at = {}     # id(conexión) -> creada_en
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._stats = {
+            'acquired_total': 0,
+            'created_total': 0,
+            'closed_total': 0,
+            'timeouts_total': 0,
+            'failed_checks_total': 0,
+            'acquire_wait_seconds_total': 0.0,
+            'acquire_wait_seconds_max': 0.0,
+        }
+
+    def warm(self):
+        """Abre conexiones hasta min_size (por ejemplo al arrancar el worker)"""
+        connections = []
+        try:
+            while True:
+                with self._cond:
+                    if self._size >= self.min_size:
+                        break
+                connections.append(self.acquire())
+        finally:
+            for conn in connections:
+                self.release(conn)
+
+    def acquire(self):
+        """Entrega una conexión sana; espera hasta acquire_timeout si el pool está lleno"""
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+
+        while True:
+            conn = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout('El pool está cerrado')
+
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts_total'] += 1
+                        raise PoolTimeout(
+                            f'No hay conexiones libres tras {self.acquire_timeout:.1f}s '
+                            f'(máximo {self.max_size})'
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                if self._idle:
+                    conn, created_at, released_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created_at[id(conn)] = time.monotonic()
+                    self._stats['created_total'] += 1
+            else:
+                now = time.monotonic()
+                if self._expired(created_at, now) or not self._healthy(conn, released_at, now):
+                    self._discard(conn)
+                    continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._stats['acquired_total'] += 1
+                self._stats['acquire_wait_seconds_total'] += waited
+                self._stats['acquire_wait_seconds_max'] = max(self._stats['acquire_wait_seconds_max'], waited)
+            return conn
+
+    def release(self, conn, discard=False):
+        """Devuelve la conexión al pool (deshaciendo cualquier transacción abierta)"""
+        if not discard:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+
+        with self._cond:
+            created_at = self._created_at.get(id(conn), 0)
+            if not discard and (self._closed or self._expired(created_at, time.monotonic())):
+                discard = True
+            if not discard:
+                self._idle.append((conn, created_at, time.monotonic()))
+                self._cond.notify()
+                return
+
+        self._discard(conn)
+
+    def metrics(self):
+        with self._cond:
+            idle = len(self._idle)
+            return dict(
+                self._stats,
+                size=self._size,
+                idle=idle,
+                in_use=self._size - idle,
+                waiting=self._waiting,
+                min_size=self.min_size,
+                max_size=self.max_size,
+            )
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    def _expired(self, created_at, now):
+        return self.max_lifetime is not None and now - created_at > self.max_lifetime
+
+    def _healthy(self, conn, released_at, now):
+        if getattr(conn, 'closed', False):
+            self._failed_check()
+            return False
+        if now - released_at < self.check_after_idle:
+            return True
+        # La consulta de prueba va fuera del lock: no bloquea a los demás hilos
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            self._failed_check()
+            return False
+
+    def _failed_check(self):
+        with self._cond:
+            self._stats['failed_checks_total'] += 1
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created_at.pop(id(conn), None)
+            self._size -= 1
+            self._stats['closed_total'] += 1
+            self._cond.notify()
@@ -2,22 +2,40 @@
 Backend Flask modificado para usar Supabase con variables de entorno
 Versión mejorada que usa python-dotenv para cargar variables de entorno
 """
-from flask import Flask, request, jsonify, render_template, g, send_from_directory
+from flask import Flask, request, jsonify, render_template, g, send_from_directory, send_file, Response, stream_with_context
 from flask_cors import CORS
-from datetime import datetime
-import pandas as pd
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from datetime import datetime, timedelta, timezone
+import io
 import os
+import sys
+import threading
+import time
+import json
+import base64
 import psycopg2
+import psycopg2.extensions
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 
+# Módulos compartidos con app.py (en backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from xlsx_stream import stream_xlsx, XLSX_MIMETYPE
+from export_jobs import ExportJobManager, ExportQueueFull, job_key, DONE
+from pdf_report import SectionCache, build_report
+from order_events import EventBroker, event_stream_response, ORDERS_ARCHIVED
+from order_import import read_manifest, batches, ManifestError
+from response_cache import ResponseCache, MemoryBackend, RedisBackend
+from response_encoder import ResponseEncoder
+from open_orders import OpenOrderIndex
+from metrics import Instrumentation
+from db_pool import ConnectionPool
+from pg_listener import NotificationListener
+
 # Cargar variables de entorno desde archivo .env
 load_dotenv()
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
-CORS(app)  # Habilitar CORS para todas las rutas
+CORS(app, expose_headers=['X-Next-Cursor', 'X-Total-Count', 'X-Change-Version', 'X-Has-More'])  # Habilitar CORS para todas las rutas
 
 # Configuración desde variables de entorno
 SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://ujibmyclnhouogevzxcl.supabase.co')
@@ -29,11 +47,434 @@ if not DATABASE_URL:
     print("Por favor, configura tu archivo .env con la URL de conexión a Supabase")
     exit(1)
 
+# Paginación por cursor (order_date, id) para el listado de órdenes
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(order_date, order_id):
+    """Codifica la posición (order_date, id) como un token opaco"""
+    raw = json.dumps([order_date.isoformat(), order_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Decodifica un token de cursor; lanza ValueError si no es válido"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        order_date, order_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(order_date), int(order_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+def parse_since(args):
+    """Lee 'since' (última versión de cambios vista por el cliente)"""
+    try:
+        since = int(args.get('since', 0))
+    except ValueError:
+        raise ValueError('El parámetro since debe ser un entero')
+    if since < 0:
+        raise ValueError('El parámetro since no puede ser negativo')
+    return since
+
+def parse_page_size(args):
+    """Lee 'limit' de la query string y lo acota a MAX_PAGE_SIZE"""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('El parámetro limit debe ser un entero')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def escape_like(value):
+    """Escapa los comodines de LIKE para buscar el texto literal"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def parse_datetime_param(value):
+    """Interpreta una fecha ISO (YYYY-MM-DD o YYYY-MM-DDTHH:MM[:SS][±HH:MM]) como timestamptz"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Fecha inválida: {value}')
+    # Las fechas sin zona horaria se interpretan en la hora local del servidor
+    return parsed.astimezone()
+
+def parse_date_range(args):
+    """Convierte date / from / to en un rango semiabierto [inicio, fin).
+
+    date acepta un día (YYYY-MM-DD) o un mes (YYYY-MM); from y to aceptan
+    fechas u horas ISO y tienen prioridad sobre date.
+    """
+    start = end = None
+    date_filter = args.get('date', '')
+
+    if date_filter:
+        try:
+            if len(date_filter) == 7:
+                month = datetime.strptime(date_filter, '%Y-%m')
+                next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+                start, end = month, next_month
+            else:
+                day = datetime.strptime(date_filter, '%Y-%m-%d')
+                start, end = day, day + timedelta(days=1)
+        except ValueError:
+            raise ValueError('Fecha inválida. Formatos válidos: YYYY-MM-DD, YYYY-MM')
+        start, end = start.astimezone(), end.astimezone()
+
+    if args.get('from'):
+        start = parse_datetime_param(args['from'])
+    if args.get('to'):
+        end = parse_datetime_param(args['to'])
+
+    return start, end
+
+def format_order_date(order_date):
+    """Formato de salida de order_date (hora local del servidor, como antes)"""
+    return order_date.astimezone().strftime('%Y-%m-%d %H:%M:%S')
+
+def include_archived(args):
+    """archived=1: la consulta incluye también las órdenes archivadas"""
+    return str(args.get('archived', '')).lower() in ('1', 'true')
+
+def order_tables(args):
+    """(órdenes, accesorios) a consultar: las tablas activas o las vistas que suman el archivo"""
+    if include_archived(args):
+        return 'orders_all', 'order_accessories_all'
+    return 'orders', 'order_accessories'
+
+def build_order_filters(args):
+    """Construye los filtros (sobre la tabla orders) compartidos por listado y exportaciones"""
+    query = args.get('q', '')
+    _, accessories_table = order_tables(args)
+    start, end = parse_date_range(args)
+    celda = args.get('celda', '')
+    status = args.get('status', '')
+
+    clauses = []
+    params = []
+
+    if query:
+        # ILIKE '%q%' se resuelve con los índices GIN pg_trgm creados en init_db
+        clauses.append(
+            "(o.order_number ILIKE %s OR o.celda ILIKE %s OR EXISTS ("
+            f"SELECT 1 FROM {accessories_table} oa WHERE oa.order_id = o.id AND oa.accessory_type ILIKE %s))"
+        )
+        pattern = f'%{escape_like(query)}%'
+        params.extend([pattern, pattern, pattern])
+
+    # Rango semiabierto sobre timestamptz: usa el índice (order_date, id)
+    if start is not None:
+        clauses.append("o.order_date >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append("o.order_date < %s")
+        params.append(end)
+
+    if celda:
+        clauses.append("o.celda = %s")
+        params.append(celda)
+
+    if status == 'open':
+        clauses.append("o.is_closed = FALSE")
+    elif status == 'closed':
+        clauses.append("o.is_closed = TRUE")
+    elif status:
+        raise ValueError("Estado inválido. Opciones válidas: open, closed")
+
+    return clauses, params
+
+def estimate_count(cursor, clauses, params, orders_table='orders'):
+    """Estima el número de órdenes con el planificador en lugar de un COUNT(*) completo"""
+    sql = f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {orders_table} o WHERE TRUE"
+    for clause in clauses:
+        sql += f" AND {clause}"
+    cursor.execute(sql, params)
+    plan = cursor.fetchone()['QUERY PLAN']
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def current_change_version(cursor):
+    cursor.execute("SELECT version FROM order_change_counter WHERE id")
+    row = cursor.fetchone()
+    return row['version'] if row else 0
+
+def list_orders(args):
+    """Devuelve una página de órdenes y los metadatos de paginación"""
+    clauses, params = build_order_filters(args)
+    orders_table, accessories_table = order_tables(args)
+    limit = parse_page_size(args)
+    cursor_token = args.get('cursor', '')
+    position = decode_cursor(cursor_token) if cursor_token else None
+
+    db = get_db()
+    if db is None:
+        return None, None, None, None
+
+    cursor = db.cursor()
+    # Versión de cambios leída antes de la página (el 'since' inicial del cliente)
+    change_version = current_change_version(cursor)
+    order_clauses = list(clauses)
+    order_params = list(params)
+
+    # Con sort=relevance se ordena por similitud trigram (sin cursor)
+    search_term = args.get('q', '')
+    relevance = args.get('sort') == 'relevance' and bool(search_term)
+    order_sql = "o.order_date DESC, o.id DESC"
+    if relevance:
+        order_sql = "GREATEST(word_similarity(%s, o.order_number), word_similarity(%s, o.celda)) DESC, o.id DESC"
+    elif position:
+        # Keyset pagination: continuar después de la última orden vista
+        order_clauses.append("(o.order_date, o.id) < (%s, %s)")
+        order_params.extend(position)
+
+    # Paginar primero sobre orders (índice por order_date, id) y agregar
+    # accesorios solo para las filas de la página
+    sql = '''
+        WITH page AS (
+            SELECT o.*, ROW_NUMBER() OVER (ORDER BY {order_sql}) AS page_position
+            FROM {orders_table} o
+            WHERE TRUE {filters}
+            ORDER BY {order_sql}
+            LIMIT %s
+        )
+        SELECT o.*, 
+               COALESCE(
+                   json_agg(
+                       json_build_object(
+                           'type', oa.accessory_type,
+                           'quantity', oa.quantity
+                       ) ORDER BY oa.id
+                   ) FILTER (WHERE oa.id IS NOT NULL), 
+                   '[]'::json
+               )::text as accessories
+        FROM page o
+        LEFT JOIN {accessories_table} oa ON o.id = oa.order_id
+        GROUP BY o.id, o.order_number, o.extra_accessory, o.selected, o.celda,
+                 o.order_date, o.is_closed, o.accessories_added, o.change_version, o.page_position
+        ORDER BY o.page_position
+    '''.format(
+        orders_table=orders_table,
+        accessories_table=accessories_table,
+        filters=''.join(f" AND {clause}" for clause in order_clauses),
+        order_sql=order_sql
+    )
+    if relevance:
+        # order_sql aparece en ROW_NUMBER (antes de los filtros) y en ORDER BY (después)
+        order_params = [search_term, search_term] + order_params + [search_term, search_term]
+    order_params.append(limit + 1)
+
+    cursor.execute(sql, order_params)
+    orders = cursor.fetchall()
+
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        if not relevance:
+            next_cursor = encode_cursor(orders[-1]['order_date'], orders[-1]['id'])
+
+    total = None
+    if args.get('count') == '1':
+        total = estimate_count(cursor, clauses, params, orders_table)
+
+    cursor.close()
+    return orders, next_cursor, total, change_version
+
+# Columnas de las filas de órdenes que se transforman al serializar: los
+# accesorios llegan como texto JSON (::text, sin decodificarlos en psycopg2)
+ORDER_ROW_FORMAT = {
+    'json_columns': ('accessories',),
+    'convert': {'order_date': format_order_date},
+}
+
+def paginated_response(orders, next_cursor, total, change_version):
+    """Serializa las filas de la página con las cabeceras de paginación"""
+    response = response_encoder.rows_response(orders, drop=('page_position',), **ORDER_ROW_FORMAT)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if total is not None:
+        response.headers['X-Total-Count'] = str(total)
+    response.headers['X-Change-Version'] = str(change_version)
+    return response, 200
+
+# Métricas de peticiones, SQL, pool y exportaciones (/metrics) y log de
+# consultas lentas con su plan (SLOW_QUERY_SECONDS)
+instrumentation = Instrumentation(
+    'postgres',
+    slow_query_seconds=float(os.getenv('SLOW_QUERY_SECONDS', '0.5')),
+    enabled=os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+)
+instrumentation.init_app(app)
+
+# Cursores que registran duración y filas de cada sentencia
+InstrumentedDictCursor = instrumentation.psycopg2_cursor_class(RealDictCursor)
+
+# Pool de conexiones: evita el handshake TLS + autenticación en cada petición
+db_pool = ConnectionPool(
+    lambda: psycopg2.connect(DATABASE_URL, cursor_factory=InstrumentedDictCursor),
+    min_size=int(os.getenv('DB_POOL_MIN_SIZE', '1')),
+    max_size=int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+    acquire_timeout=float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '5')),
+    max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+    check_after_idle=float(os.getenv('DB_POOL_CHECK_AFTER_IDLE', '30'))
+)
+
+# Eventos en tiempo real: una conexión LISTEN por worker reparte a todos sus
+# clientes SSE. Cada flujo ocupa un hilo: más de ORDER_EVENTS_MAX_SUBSCRIBERS
+# por worker responden 503
+ORDER_EVENTS_CHANNEL = 'order_events'
+ORDER_EVENTS_HEARTBEAT = float(os.getenv('ORDER_EVENTS_HEARTBEAT', '15'))
+order_events = EventBroker(
+    max_queue=int(os.getenv('ORDER_EVENTS_MAX_QUEUE', '100')),
+    max_subscribers=int(os.getenv('ORDER_EVENTS_MAX_SUBSCRIBERS', '64'))
+)
+
+# Serialización de los listados (orjson / MessagePack) con compresión gzip/br
+# a partir de RESPONSE_COMPRESS_MIN_SIZE bytes
+response_encoder = ResponseEncoder(
+    compress_min_size=int(os.getenv('RESPONSE_COMPRESS_MIN_SIZE', '1024')),
+    compress_level=int(os.getenv('RESPONSE_COMPRESS_LEVEL', '6')),
+    observe=instrumentation.observe_encode
+)
+
+# Caché de respuestas de los listados con ETag (una entrada por representación
+# negociada). Con RESPONSE_CACHE_REDIS_URL se comparte entre workers; en
+# memoria, cada worker se invalida con las notificaciones de LISTEN y el caché
+# se omite mientras el listener no esté conectado
+RESPONSE_CACHE_REDIS_URL = os.getenv('RESPONSE_CACHE_REDIS_URL')
+response_cache = ResponseCache(
+    RedisBackend(RESPONSE_CACHE_REDIS_URL) if RESPONSE_CACHE_REDIS_URL
+    else MemoryBackend(max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '256'))),
+    ttl=int(os.getenv('RESPONSE_CACHE_TTL', '60')),
+    enabled=lambda: bool(RESPONSE_CACHE_REDIS_URL) or order_listener.connected,
+    variant=response_encoder.variant
+)
+
+# Índice en memoria de las órdenes abiertas (OPEN_ORDER_INDEX=true). El
+# listado de abiertas sin búsqueda ni fechas y la consulta por número se
+# sirven desde memoria. Cada worker lo mantiene con el feed de cambios: tras
+# sus propias escrituras y con las notificaciones de LISTEN de los demás; como
+# el caché en memoria, no se usa mientras el listener no esté conectado
+OPEN_ORDER_INDEX = os.getenv('OPEN_ORDER_INDEX', 'false').lower() == 'true'
+OPEN_ORDER_COLUMNS = (
+    'id', 'order_number', 'extra_accessory', 'selected', 'celda', 'order_date',
+    'is_closed', 'accessories_added', 'change_version', 'accessories'
+)
+# Parámetros que el índice no resuelve: con cualquiera de ellos se consulta la base
+OPEN_ORDER_UNINDEXED_FIELDS = ['q', 'date', 'from', 'to', 'archived', 'sort']
+open_orders = OpenOrderIndex(OPEN_ORDER_COLUMNS, sort_column='order_date') if OPEN_ORDER_INDEX else None
+
+# Misma forma de fila que list_orders (accesorios como texto JSON)
+ORDER_ROW_SELECT = '''
+    SELECT o.id, o.order_number, o.extra_accessory, o.selected, o.celda, o.order_date,
+           o.is_closed, o.accessories_added, o.change_version,
+           COALESCE((
+               SELECT json_agg(json_build_object('type', oa.accessory_type, 'quantity', oa.quantity) ORDER BY oa.id)
+               FROM {accessories_table} oa
+               WHERE oa.order_id = o.id
+           ), '[]'::json)::text AS accessories
+    FROM {orders_table} o
+'''
+OPEN_ORDER_SELECT = ORDER_ROW_SELECT.format(orders_table='orders', accessories_table='order_accessories')
+
+def fetch_open_orders(db):
+    cursor = db.cursor()
+    try:
+        # La versión se lee antes: lo que cambie mientras tanto se repite en la siguiente sincronización
+        version = current_change_version(cursor)
+        cursor.execute(OPEN_ORDER_SELECT + " WHERE o.is_closed = FALSE")
+        return cursor.fetchall(), version
+    finally:
+        cursor.close()
+
+def fetch_open_order_changes(db, since):
+    cursor = db.cursor()
+    try:
+        version = current_change_version(cursor)
+        cursor.execute(
+            OPEN_ORDER_SELECT + " WHERE o.change_version > %s AND o.change_version <= %s ORDER BY o.change_version",
+            (since, version)
+        )
+        return cursor.fetchall(), version
+    finally:
+        cursor.close()
+
+def sync_open_orders(db=None):
+    """Aplica al índice los cambios ya confirmados (llamar tras el commit).
+
+    Sin `db` (hilo del listener) usa una conexión del pool. Si el índice no
+    llegó a cargarse al arrancar, lo carga completo. Un fallo no afecta a la
+    escritura: la siguiente sincronización se pone al día.
+    """
+    if open_orders is None:
+        return
+    conn = db
+    try:
+        if conn is None:
+            conn = db_pool.acquire()
+        if open_orders.ready:
+            open_orders.sync(lambda since: fetch_open_order_changes(conn, since))
+        else:
+            open_orders.warm(lambda: fetch_open_orders(conn))
+    except Exception as e:
+        print(f"No se pudo sincronizar el índice de órdenes abiertas: {e}")
+    finally:
+        if db is None and conn is not None:
+            db_pool.release(conn)
+
+def on_order_event(event):
+    """Notificación de LISTEN: invalida el caché y pone al día el índice"""
+    response_cache.invalidate()
+    if open_orders is None:
+        return
+    # Una sincronización trae todos los cambios confirmados hasta ese momento:
+    # las notificaciones ya cubiertas (p. ej. el resto de un cierre masivo) no consultan la base
+    change_version = event.get('change_version')
+    if change_version is None or change_version > open_orders.version:
+        sync_open_orders()
+
+def open_orders_current():
+    """El índice está cargado y al día (recibe las notificaciones de los demás workers)"""
+    return open_orders is not None and open_orders.ready and order_listener.connected
+
+def open_orders_servable(args):
+    """El listado pedido son solo órdenes abiertas que el índice puede resolver"""
+    return (
+        open_orders_current() and args.get('status') == 'open'
+        and not any(args.get(field) for field in OPEN_ORDER_UNINDEXED_FIELDS)
+    )
+
+def open_orders_page(args):
+    """Misma respuesta que list_orders (status=open) servida desde el índice"""
+    limit = parse_page_size(args)
+    cursor_token = args.get('cursor', '')
+    position = decode_cursor(cursor_token) if cursor_token else None
+    records, total, version = open_orders.page(args.get('celda') or None, position, limit + 1)
+
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(*records[-1].sort_key)
+    return paginated_response(records, next_cursor, total if args.get('count') == '1' else None, version)
+
+order_listener = NotificationListener(
+    lambda: psycopg2.connect(DATABASE_URL),
+    ORDER_EVENTS_CHANNEL,
+    order_events,
+    on_event=on_order_event,
+    # Lo confirmado antes de escuchar no llega por LISTEN (arranque y reconexiones)
+    on_connect=sync_open_orders
+)
+
+@app.before_request
+def start_order_listener():
+    """Arranca el listener en el worker (idempotente; tras el fork de gunicorn)"""
+    order_listener.start()
+
 def get_db():
-    """Obtiene una conexión a la base de datos"""
+    """Obtiene una conexión del pool (una por contexto de aplicación)"""
     if 'db' not in g:
+        started = time.perf_counter()
         try:
-            g.db = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+            g.db = db_pool.acquire()
+            instrumentation.observe_acquire(time.perf_counter() - started)
         except Exception as e:
             print(f"Error conectando a Supabase: {e}")
             return None
@@ -41,10 +482,10 @@ def get_db():
 
 @app.teardown_appcontext
 def close_db(error):
-    """Cierra la conexión a la base de datos"""
+    """Devuelve la conexión al pool"""
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        db_pool.release(db)
 
 def init_db():
     """Inicializa las tablas de la base de datos (opcional, ya las creaste en Supabase)"""
@@ -72,7 +513,8 @@ def init_db():
                     order_number TEXT NOT NULL UNIQUE,
                     extra_accessory BOOLEAN NOT NULL,
                     selected BOOLEAN NOT NULL,
-                    order_date TEXT NOT NULL,
+                    celda TEXT,
+                    order_date TIMESTAMPTZ NOT NULL DEFAULT NOW(),
                     is_closed BOOLEAN DEFAULT FALSE,
                     accessories_added BOOLEAN DEFAULT FALSE
                 )
@@ -92,6 +534,40 @@ def init_db():
             print("Tablas creadas exitosamente")
         else:
             print("Las tablas ya existen")
+
+        # order_date pasa de TEXT a TIMESTAMPTZ (el texto se interpreta en la zona de la sesión)
+        cursor.execute("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = 'orders' AND column_name = 'order_date'
+        """)
+        column = cursor.fetchone()
+        if column and column['data_type'] == 'text':
+            cursor.execute("ALTER TABLE orders ALTER COLUMN order_date TYPE TIMESTAMPTZ USING order_date::timestamptz")
+            print("Columna order_date migrada a TIMESTAMPTZ")
+
+        # Columna celda e índices para el listado paginado y los filtros
+        cursor.execute("ALTER TABLE orders ADD COLUMN IF NOT EXISTS celda TEXT")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_date_id ON orders (order_date DESC, id DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_celda_date ON orders (celda, order_date DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_accessories_order_id ON order_accessories (order_id)")
+        db.commit()
+
+        init_change_feed(cursor)
+        init_order_events(cursor)
+        init_archive(cursor)
+        init_stats(cursor)
+        db.commit()
+
+        # Índices trigram (pg_trgm + GIN) para búsquedas por subcadena con ILIKE
+        try:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_order_number_trgm ON orders USING gin (order_number gin_trgm_ops)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_celda_trgm ON orders USING gin (celda gin_trgm_ops)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_accessories_type_trgm ON order_accessories USING gin (accessory_type gin_trgm_ops)")
+            db.commit()
+        except psycopg2.Error as e:
+            db.rollback()
+            print(f"Advertencia: no se pudieron crear los índices pg_trgm ({e}); la búsqueda usará escaneo secuencial")
         
         return True
     except Exception as e:
@@ -101,11 +577,305 @@ def init_db():
     finally:
         cursor.close()
 
+def init_change_feed(cursor):
+    """Versión de cambios monótona por orden para /api/orders/changes.
+
+    Un trigger asigna a cada alta o modificación de una orden la siguiente
+    versión de 'order_change_counter'. El bloqueo de la fila del contador se
+    mantiene hasta el COMMIT, así que las versiones se confirman en orden y un
+    cliente nunca ve la versión N+1 sin ver antes la N (con una secuencia
+    podría ocurrir).
+    """
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'orders' AND column_name = 'change_version'
+    """)
+    if cursor.fetchone() is None:
+        cursor.execute("ALTER TABLE orders ADD COLUMN change_version BIGINT NOT NULL DEFAULT 0")
+        # Las órdenes existentes reciben una versión única (su id)
+        cursor.execute("UPDATE orders SET change_version = id")
+        print("Columna change_version creada")
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_change_version ON orders (change_version)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_change_counter (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            version BIGINT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO order_change_counter (id, version)
+        SELECT TRUE, COALESCE(MAX(change_version), 0) FROM orders
+        ON CONFLICT (id) DO NOTHING
+    ''')
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION orders_next_change_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE order_change_counter SET version = version + 1 WHERE id
+            RETURNING version INTO NEW.change_version;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute("DROP TRIGGER IF EXISTS orders_change_version ON orders")
+    cursor.execute('''
+        CREATE TRIGGER orders_change_version
+        BEFORE INSERT OR UPDATE OF order_number, extra_accessory, selected, celda, order_date, is_closed, accessories_added
+        ON orders FOR EACH ROW EXECUTE FUNCTION orders_next_change_version()
+    ''')
+
+def init_order_events(cursor):
+    """Trigger que publica order_created / order_closed con pg_notify.
+
+    La notificación se entrega al confirmar la transacción y cubre cualquier
+    escritura sobre orders (esta API u otros clientes de Supabase).
+    """
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION orders_notify_event() RETURNS trigger AS $$
+        DECLARE
+            event_type TEXT;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                event_type := 'order_created';
+            ELSIF NEW.is_closed AND NOT COALESCE(OLD.is_closed, FALSE) THEN
+                event_type := 'order_closed';
+            ELSE
+                RETURN NULL;
+            END IF;
+            PERFORM pg_notify('{channel}', json_build_object(
+                'type', event_type,
+                'id', NEW.id,
+                'order_number', NEW.order_number,
+                'celda', NEW.celda,
+                'change_version', NEW.change_version
+            )::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    '''.format(channel=ORDER_EVENTS_CHANNEL))
+    cursor.execute("DROP TRIGGER IF EXISTS orders_notify_event ON orders")
+    cursor.execute('''
+        CREATE TRIGGER orders_notify_event
+        AFTER INSERT OR UPDATE OF is_closed ON orders
+        FOR EACH ROW EXECUTE FUNCTION orders_notify_event()
+    ''')
+
+def init_archive(cursor):
+    """Tablas de archivo de las órdenes cerradas antiguas, particionadas por mes de order_date.
+
+    Las particiones se crean al archivar (ensure_archive_partitions) y un mes
+    completo se puede desprender o borrar sin tocar el resto. Las vistas
+    orders_all / order_accessories_all unen las tablas activas con el archivo
+    para las consultas con archived=1. Un número de orden archivado sigue
+    ocupado: el trigger descarta el alta y ON CONFLICT la informa como existente.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders_archive (
+            id INTEGER NOT NULL,
+            order_number TEXT NOT NULL,
+            extra_accessory BOOLEAN NOT NULL,
+            selected BOOLEAN NOT NULL,
+            celda TEXT,
+            order_date TIMESTAMPTZ NOT NULL,
+            is_closed BOOLEAN DEFAULT FALSE,
+            accessories_added BOOLEAN DEFAULT FALSE,
+            change_version BIGINT NOT NULL DEFAULT 0,
+            archived_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            PRIMARY KEY (order_date, id)
+        ) PARTITION BY RANGE (order_date)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_accessories_archive (
+            id INTEGER NOT NULL,
+            order_id INTEGER NOT NULL,
+            order_date TIMESTAMPTZ NOT NULL,
+            accessory_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (order_date, id)
+        ) PARTITION BY RANGE (order_date)
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_archive_order_number ON orders_archive (order_number)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_archive_celda_date ON orders_archive (celda, order_date DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_order_accessories_archive_order_id ON order_accessories_archive (order_id)")
+
+    cursor.execute('''
+        CREATE OR REPLACE VIEW orders_all AS
+        SELECT id, order_number, extra_accessory, selected, celda, order_date,
+               is_closed, accessories_added, change_version
+        FROM orders
+        UNION ALL
+        SELECT id, order_number, extra_accessory, selected, celda, order_date,
+               is_closed, accessories_added, change_version
+        FROM orders_archive
+    ''')
+    cursor.execute('''
+        CREATE OR REPLACE VIEW order_accessories_all AS
+        SELECT id, order_id, accessory_type, quantity FROM order_accessories
+        UNION ALL
+        SELECT id, order_id, accessory_type, quantity FROM order_accessories_archive
+    ''')
+
+    # Los triggers BEFORE se ejecutan por nombre: este va antes de orders_change_version
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION orders_skip_archived_number() RETURNS trigger AS $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM orders_archive WHERE order_number = NEW.order_number) THEN
+                RETURN NULL;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute("DROP TRIGGER IF EXISTS orders_archived_number ON orders")
+    cursor.execute('''
+        CREATE TRIGGER orders_archived_number
+        BEFORE INSERT ON orders
+        FOR EACH ROW EXECUTE FUNCTION orders_skip_archived_number()
+    ''')
+
+def ensure_archive_partitions(cursor, start, end):
+    """Crea las particiones mensuales (meses UTC) de archivo que cubren [start, end)"""
+    month = start.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    while month < end:
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        for table in ('orders_archive', 'order_accessories_archive'):
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {table}_{month:%Y%m} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+                (month, next_month)
+            )
+        month = next_month
+
+def init_stats(cursor):
+    """Tablas de resumen por hora para /api/stats, mantenidas por triggers.
+
+    Los contadores se actualizan en la misma transacción que la escritura, así
+    que las estadísticas se leen en O(buckets). El bucket es la hora de
+    order_date; las órdenes archivadas o borradas siguen contando.
+    """
+    cursor.execute("SELECT to_regclass('public.order_stats_hourly') IS NULL AS missing")
+    missing = cursor.fetchone()['missing']
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_stats_hourly (
+            bucket TIMESTAMPTZ NOT NULL,
+            celda TEXT NOT NULL,
+            orders BIGINT NOT NULL DEFAULT 0,
+            closed BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, celda)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS accessory_stats_hourly (
+            bucket TIMESTAMPTZ NOT NULL,
+            celda TEXT NOT NULL,
+            accessory_type TEXT NOT NULL,
+            quantity BIGINT NOT NULL DEFAULT 0,
+            closed_quantity BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, celda, accessory_type)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION orders_update_stats() RETURNS trigger AS $$
+        DECLARE
+            direction INTEGER;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO order_stats_hourly (bucket, celda, orders, closed)
+                VALUES (date_trunc('hour', NEW.order_date), COALESCE(NEW.celda, ''), 1,
+                        CASE WHEN NEW.is_closed THEN 1 ELSE 0 END)
+                ON CONFLICT (bucket, celda) DO UPDATE SET
+                    orders = order_stats_hourly.orders + 1,
+                    closed = order_stats_hourly.closed + EXCLUDED.closed;
+                RETURN NULL;
+            END IF;
+
+            IF COALESCE(NEW.is_closed, FALSE) = COALESCE(OLD.is_closed, FALSE) THEN
+                RETURN NULL;
+            END IF;
+            direction := CASE WHEN NEW.is_closed THEN 1 ELSE -1 END;
+
+            UPDATE order_stats_hourly SET closed = closed + direction
+            WHERE bucket = date_trunc('hour', NEW.order_date) AND celda = COALESCE(NEW.celda, '');
+
+            UPDATE accessory_stats_hourly s SET closed_quantity = s.closed_quantity + direction * a.quantity
+            FROM (
+                SELECT accessory_type, SUM(quantity) AS quantity
+                FROM order_accessories WHERE order_id = NEW.id
+                GROUP BY accessory_type
+            ) a
+            WHERE s.bucket = date_trunc('hour', NEW.order_date) AND s.celda = COALESCE(NEW.celda, '')
+              AND s.accessory_type = a.accessory_type;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute("DROP TRIGGER IF EXISTS orders_update_stats ON orders")
+    cursor.execute('''
+        CREATE TRIGGER orders_update_stats
+        AFTER INSERT OR UPDATE OF is_closed ON orders
+        FOR EACH ROW EXECUTE FUNCTION orders_update_stats()
+    ''')
+
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION order_accessories_update_stats() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO accessory_stats_hourly (bucket, celda, accessory_type, quantity, closed_quantity)
+            SELECT date_trunc('hour', o.order_date), COALESCE(o.celda, ''), NEW.accessory_type, NEW.quantity,
+                   CASE WHEN o.is_closed THEN NEW.quantity ELSE 0 END
+            FROM orders o WHERE o.id = NEW.order_id
+            ON CONFLICT (bucket, celda, accessory_type) DO UPDATE SET
+                quantity = accessory_stats_hourly.quantity + EXCLUDED.quantity,
+                closed_quantity = accessory_stats_hourly.closed_quantity + EXCLUDED.closed_quantity;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    cursor.execute("DROP TRIGGER IF EXISTS order_accessories_update_stats ON order_accessories")
+    cursor.execute('''
+        CREATE TRIGGER order_accessories_update_stats
+        AFTER INSERT ON order_accessories
+        FOR EACH ROW EXECUTE FUNCTION order_accessories_update_stats()
+    ''')
+
+    if missing:
+        # Rellenar los resúmenes con las órdenes existentes (activas y archivadas)
+        cursor.execute('''
+            INSERT INTO order_stats_hourly (bucket, celda, orders, closed)
+            SELECT date_trunc('hour', order_date), COALESCE(celda, ''), COUNT(*),
+                   COUNT(*) FILTER (WHERE is_closed)
+            FROM orders_all
+            GROUP BY 1, 2
+        ''')
+        cursor.execute('''
+            INSERT INTO accessory_stats_hourly (bucket, celda, accessory_type, quantity, closed_quantity)
+            SELECT date_trunc('hour', o.order_date), COALESCE(o.celda, ''), oa.accessory_type,
+                   SUM(oa.quantity), COALESCE(SUM(oa.quantity) FILTER (WHERE o.is_closed), 0)
+            FROM order_accessories_all oa
+            JOIN orders_all o ON o.id = oa.order_id
+            GROUP BY 1, 2, 3
+        ''')
+        print("Tablas de estadísticas creadas")
+
 @app.route('/')
 def index():
     """Ruta principal - sirve el frontend"""
     return send_from_directory(app.static_folder, 'index.html')
 
+INSERT_ORDER_SQL = '''
+    WITH new_order AS (
+        INSERT INTO orders (order_number, extra_accessory, selected, celda, order_date)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (order_number) DO NOTHING
+        RETURNING id
+    ), new_accessories AS (
+        INSERT INTO order_accessories (order_id, accessory_type, quantity)
+        SELECT new_order.id, accessory.accessory_type, accessory.quantity
+        FROM new_order, unnest(%s::text[], %s::int[]) AS accessory (accessory_type, quantity)
+    )
+    SELECT id FROM new_order
+'''
+
 @app.route('/api/add_order', methods=['POST'])
 def add_order():
     """Agregar una nueva orden"""
@@ -114,8 +884,9 @@ def add_order():
         order_number = data.get('order_number')
         extra_accessory = data.get('extra_accessory', False)
         selected = data.get('selected', False)
+        celda = data.get('celda')
         accessories = data.get('accessories', [])
-        order_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        order_date = datetime.now(timezone.utc)
         
         if not order_number:
             return jsonify({'error': 'Número de orden es requerido'}), 400
@@ -124,30 +895,32 @@ def add_order():
         if db is None:
             return jsonify({'error': 'Error de conexión a la base de datos'}), 500
         
+        accessories = [
+            accessory for accessory in accessories
+            if accessory.get('type') and accessory.get('quantity')
+        ]
+
+        # Una sola sentencia (un viaje de red): la orden con ON CONFLICT en lugar
+        # del SELECT previo y todos los accesorios con unnest. En autocommit la
+        # sentencia es atómica por sí misma y no hacen falta BEGIN/COMMIT aparte.
         cursor = db.cursor()
-        
-        # Verificar si la orden ya existe
-        cursor.execute("SELECT id FROM orders WHERE order_number = %s", (order_number,))
-        if cursor.fetchone():
+        db.autocommit = True
+        try:
+            cursor.execute(INSERT_ORDER_SQL, (
+                order_number, extra_accessory, selected, celda, order_date,
+                [accessory['type'] for accessory in accessories],
+                [int(accessory['quantity']) for accessory in accessories]
+            ))
+            inserted = cursor.fetchone()
+        finally:
+            cursor.close()
+            db.autocommit = False
+
+        if inserted is None:
             return jsonify({'error': 'El número de orden ya existe'}), 400
-        
-        # Insertar orden
-        cursor.execute(
-            "INSERT INTO orders (order_number, extra_accessory, selected, order_date) VALUES (%s, %s, %s, %s) RETURNING id",
-            (order_number, extra_accessory, selected, order_date)
-        )
-        order_id = cursor.fetchone()['id']
-        
-        # Insertar accesorios
-        for accessory in accessories:
-            if accessory.get('type') and accessory.get('quantity'):
-                cursor.execute(
-                    "INSERT INTO order_accessories (order_id, accessory_type, quantity) VALUES (%s, %s, %s)",
-                    (order_id, accessory['type'], accessory['quantity'])
-                )
-        
-        db.commit()
-        cursor.close()
+        order_id = inserted['id']
+        response_cache.invalidate()
+        sync_open_orders(db)
         
         return jsonify({'message': 'Orden agregada exitosamente', 'order_id': order_id}), 201
         
@@ -157,47 +930,123 @@ def add_order():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/orders', methods=['GET'])
+@response_cache.cached
 def get_orders():
-    """Obtener todas las órdenes"""
+    """Obtener órdenes paginadas (parámetros: limit, cursor, count, celda, status, date, archived)"""
     try:
+        # Órdenes abiertas desde el índice en memoria, sin consultar la base
+        if open_orders_servable(request.args):
+            return open_orders_page(request.args)
+        orders, next_cursor, total, change_version = list_orders(request.args)
+        if orders is None:
+            return jsonify({'error': 'Error de conexión a la base de datos'}), 500
+        return paginated_response(orders, next_cursor, total, change_version)
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/orders/changes', methods=['GET'])
+def get_order_changes():
+    """Órdenes creadas o modificadas (incluidos cierres) después de la versión 'since'.
+
+    Parámetros: since, limit y celda. X-Change-Version trae el 'since' de la
+    siguiente llamada y X-Has-More indica si quedan cambios por leer.
+    """
+    try:
+        since = parse_since(request.args)
+        limit = parse_page_size(request.args)
+
         db = get_db()
         if db is None:
             return jsonify({'error': 'Error de conexión a la base de datos'}), 500
-        
+
         cursor = db.cursor()
-        
-        # Obtener órdenes con sus accesorios
+        # Todo cambio con versión <= current ya está confirmado: si no hay más
+        # filas, el cliente puede avanzar hasta current sin perder ninguno
+        current = current_change_version(cursor)
+
+        params = [since, current]
+        celda_filter = ''
+        if request.args.get('celda'):
+            celda_filter = " AND o.celda = %s"
+            params.append(request.args['celda'])
+        params.append(limit + 1)
+
         cursor.execute('''
-            SELECT o.*, 
+            WITH changed AS (
+                SELECT o.*
+                FROM orders o
+                WHERE o.change_version > %s AND o.change_version <= %s{celda_filter}
+                ORDER BY o.change_version
+                LIMIT %s
+            )
+            SELECT o.*,
                    COALESCE(
                        json_agg(
                            json_build_object(
                                'type', oa.accessory_type,
                                'quantity', oa.quantity
-                           )
-                       ) FILTER (WHERE oa.id IS NOT NULL), 
+                           ) ORDER BY oa.id
+                       ) FILTER (WHERE oa.id IS NOT NULL),
                        '[]'::json
-                   ) as accessories
-            FROM orders o
+                   )::text as accessories
+            FROM changed o
             LEFT JOIN order_accessories oa ON o.id = oa.order_id
-            GROUP BY o.id
-            ORDER BY o.order_date DESC
-        ''')
-        
+            GROUP BY o.id, o.order_number, o.extra_accessory, o.selected, o.celda,
+                     o.order_date, o.is_closed, o.accessories_added, o.change_version
+            ORDER BY o.change_version
+        '''.format(celda_filter=celda_filter), params)
         orders = cursor.fetchall()
         cursor.close()
-        
-        # Convertir a lista de diccionarios
-        orders_list = []
-        for order in orders:
-            order_dict = dict(order)
-            orders_list.append(order_dict)
-        
-        return jsonify(orders_list), 200
-        
+
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        version = orders[-1]['change_version'] if has_more else max(since, current)
+
+        response = response_encoder.rows_response(orders, **ORDER_ROW_FORMAT)
+        response.headers['X-Change-Version'] = str(version)
+        response.headers['X-Has-More'] = '1' if has_more else '0'
+        return response, 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/orders/events', methods=['GET'])
+def order_events_stream():
+    """Flujo SSE con order_created / order_closed (parámetro opcional: celda).
+
+    No usa el pool: la conexión HTTP queda abierta sin ocupar conexiones a la
+    base de datos. Tras un evento 'resync' o una reconexión, el cliente debe
+    ponerse al día con /api/orders/changes.
+    """
+    return event_stream_response(order_events, request.args.get('celda') or None, heartbeat=ORDER_EVENTS_HEARTBEAT)
+
+@app.route('/api/orders/by-number/<order_number>', methods=['GET'])
+def get_order_by_number(order_number):
+    """Una orden por número: las abiertas desde el índice, el resto (cerradas o archivadas) desde la base"""
+    order = open_orders.get(order_number) if open_orders_current() else None
+    if order is None:
+        db = get_db()
+        if db is None:
+            return jsonify({'error': 'Error de conexión a la base de datos'}), 500
+        cursor = db.cursor()
+        try:
+            cursor.execute(
+                ORDER_ROW_SELECT.format(orders_table='orders_all', accessories_table='order_accessories_all')
+                + " WHERE o.order_number = %s",
+                (order_number,)
+            )
+            order = cursor.fetchone()
+        finally:
+            cursor.close()
+    if order is None:
+        return jsonify({'error': 'Orden no encontrada'}), 404
+    return response_encoder.row_response(order, **ORDER_ROW_FORMAT)
+
 @app.route('/api/orders/<int:order_id>/close', methods=['PUT'])
 def close_order(order_id):
     """Cerrar una orden"""
@@ -221,6 +1070,8 @@ def close_order(order_id):
         
         db.commit()
         cursor.close()
+        response_cache.invalidate()
+        sync_open_orders(db)
         
         return jsonify({'message': 'Orden cerrada exitosamente'}), 200
         
@@ -230,161 +1081,668 @@ def close_order(order_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/orders/search', methods=['GET'])
+@response_cache.cached
 def search_orders():
-    """Buscar órdenes por número o fecha"""
+    """Buscar órdenes por número o fecha (misma paginación que /api/orders)"""
     try:
-        query = request.args.get('q', '')
-        date_filter = request.args.get('date', '')
+        orders, next_cursor, total, change_version = list_orders(request.args)
+        if orders is None:
+            return jsonify({'error': 'Error de conexión a la base de datos'}), 500
+        return paginated_response(orders, next_cursor, total, change_version)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Archivo de órdenes cerradas antiguas. Los listados, búsquedas y exportaciones
+# leen solo las tablas activas salvo que se pida archived=1
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = 5000
+
+# Un lote completo en una sola sentencia: las filas salen de las tablas activas
+# y entran en la partición del archivo que corresponde a su order_date
+ARCHIVE_ORDERS_SQL = '''
+    WITH moved AS (
+        DELETE FROM orders
+        WHERE id IN (
+            SELECT id FROM orders
+            WHERE is_closed AND order_date < %s
+            ORDER BY order_date, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING *
+    ), moved_accessories AS (
+        DELETE FROM order_accessories oa
+        USING moved
+        WHERE oa.order_id = moved.id
+        RETURNING oa.id, oa.order_id, moved.order_date, oa.accessory_type, oa.quantity
+    ), archived_accessories AS (
+        INSERT INTO order_accessories_archive (id, order_id, order_date, accessory_type, quantity)
+        SELECT id, order_id, order_date, accessory_type, quantity FROM moved_accessories
+    ), archived AS (
+        INSERT INTO orders_archive (id, order_number, extra_accessory, selected, celda, order_date,
+                                    is_closed, accessories_added, change_version)
+        SELECT id, order_number, extra_accessory, selected, celda, order_date,
+               is_closed, accessories_added, change_version
+        FROM moved
+        RETURNING id
+    )
+    SELECT COUNT(*) AS archived FROM archived
+'''
+
+def archive_closed_orders(db, older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """Mueve al archivo las órdenes cerradas con order_date de hace más de `older_than_days` días.
+
+    Cada lote es una transacción corta; las tablas de estadísticas no cambian
+    (las órdenes archivadas siguen contando). Al confirmar se notifica a los
+    workers para que invaliden su caché. Devuelve el número de órdenes archivadas.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    archived = 0
+    cursor = db.cursor()
+    try:
+        while True:
+            cursor.execute("SELECT MIN(order_date) AS oldest FROM orders WHERE is_closed AND order_date < %s", (cutoff,))
+            oldest = cursor.fetchone()['oldest']
+            if oldest is None:
+                db.commit()
+                break
+            ensure_archive_partitions(cursor, oldest, cutoff)
+
+            cursor.execute(ARCHIVE_ORDERS_SQL, (cutoff, batch_size))
+            count = cursor.fetchone()['archived']
+            if count:
+                cursor.execute(
+                    "SELECT pg_notify(%s, %s)",
+                    (ORDER_EVENTS_CHANNEL, json.dumps({'type': ORDERS_ARCHIVED, 'archived': count}))
+                )
+            db.commit()
+            archived += count
+            if count < batch_size:
+                break
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return archived
+
+@app.route('/api/orders/archive', methods=['POST'])
+def archive_orders():
+    """Archivar las órdenes cerradas antiguas (older_than_days, por defecto ARCHIVE_AFTER_DAYS).
+
+    Pensado para ejecutarse periódicamente (cron); las órdenes archivadas se
+    consultan con archived=1 en /api/orders, /api/orders/search y exportaciones.
+    """
+    data = request.get_json(silent=True) or {}
+    older_than_days = data.get('older_than_days', ARCHIVE_AFTER_DAYS)
+    if not isinstance(older_than_days, int) or isinstance(older_than_days, bool) or older_than_days < 0:
+        return jsonify({'error': 'older_than_days debe ser un entero no negativo'}), 400
+
+    try:
         db = get_db()
         if db is None:
             return jsonify({'error': 'Error de conexión a la base de datos'}), 500
-        
-        cursor = db.cursor()
-        
-        sql = '''
-            SELECT o.*, 
-                   COALESCE(
-                       json_agg(
-                           json_build_object(
-                               'type', oa.accessory_type,
-                               'quantity', oa.quantity
-                           )
-                       ) FILTER (WHERE oa.id IS NOT NULL), 
-                       '[]'::json
-                   ) as accessories
-            FROM orders o
-            LEFT JOIN order_accessories oa ON o.id = oa.order_id
-            WHERE 1=1
-        '''
+        archived = archive_closed_orders(db, older_than_days)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    if archived:
+        response_cache.invalidate()
+
+    return jsonify({
+        'message': 'Archivo completado',
+        'archived': archived,
+        'older_than_days': older_than_days
+    }), 200
+
+# Estadísticas desde las tablas de resumen por hora (O(buckets)). Los días se
+# agrupan en Python con la hora local del servidor, igual que order_date
+STATS_BUCKET_FORMATS = {'day': '%Y-%m-%d', 'hour': '%Y-%m-%d %H:00'}
+
+@app.route('/api/stats', methods=['GET'])
+@response_cache.cached
+def get_stats():
+    """Órdenes abiertas/cerradas y cantidades de accesorios por celda y día u hora.
+
+    Parámetros: granularity (day/hour), date, from, to y celda.
+    """
+    try:
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in STATS_BUCKET_FORMATS:
+            raise ValueError('Granularidad inválida. Opciones válidas: day, hour')
+        start, end = parse_date_range(request.args)
+
+        clauses = []
         params = []
-        
-        if query:
-            sql += " AND o.order_number ILIKE %s"
-            params.append(f'%{query}%')
-        
-        if date_filter:
-            sql += " AND DATE(o.order_date) = %s"
-            params.append(date_filter)
-        
-        sql += " GROUP BY o.id ORDER BY o.order_date DESC"
-        
-        cursor.execute(sql, params)
-        orders = cursor.fetchall()
+        if start is not None:
+            clauses.append("bucket >= date_trunc('hour', %s::timestamptz)")
+            params.append(start)
+        if end is not None:
+            clauses.append("bucket < %s")
+            params.append(end)
+        if request.args.get('celda'):
+            clauses.append("celda = %s")
+            params.append(request.args['celda'])
+        where = ''.join(f" AND {clause}" for clause in clauses)
+
+        db = get_db()
+        if db is None:
+            return jsonify({'error': 'Error de conexión a la base de datos'}), 500
+
+        cursor = db.cursor()
+        cursor.execute(f"SELECT bucket, celda, orders, closed FROM order_stats_hourly WHERE TRUE {where}", params)
+        order_rows = cursor.fetchall()
+        cursor.execute(f'''
+            SELECT bucket, celda, accessory_type, quantity, closed_quantity
+            FROM accessory_stats_hourly WHERE TRUE {where}
+        ''', params)
+        accessory_rows = cursor.fetchall()
         cursor.close()
-        
-        # Convertir a lista de diccionarios
-        orders_list = []
-        for order in orders:
-            order_dict = dict(order)
-            orders_list.append(order_dict)
-        
-        return jsonify(orders_list), 200
-        
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/export/excel', methods=['GET'])
-def export_excel():
-    """Exportar órdenes a Excel"""
+    bucket_format = STATS_BUCKET_FORMATS[granularity]
+    orders = {}
+    for row in order_rows:
+        key = (row['bucket'].astimezone().strftime(bucket_format), row['celda'])
+        totals = orders.setdefault(key, [0, 0])
+        totals[0] += row['orders']
+        totals[1] += row['closed']
+    accessories = {}
+    for row in accessory_rows:
+        key = (row['bucket'].astimezone().strftime(bucket_format), row['celda'], row['accessory_type'])
+        totals = accessories.setdefault(key, [0, 0])
+        totals[0] += row['quantity']
+        totals[1] += row['closed_quantity']
+
+    total = sum(count for count, _ in orders.values())
+    closed = sum(count for _, count in orders.values())
+    return jsonify({
+        'granularity': granularity,
+        'totals': {'orders': total, 'open': total - closed, 'closed': closed},
+        'orders': [
+            {'bucket': bucket, 'celda': celda, 'orders': count, 'open': count - closed_count, 'closed': closed_count}
+            for (bucket, celda), (count, closed_count) in sorted(orders.items())
+        ],
+        'accessories': [
+            {
+                'bucket': bucket, 'celda': celda, 'accessory_type': accessory_type,
+                'quantity': quantity, 'open_quantity': quantity - closed_quantity,
+                'closed_quantity': closed_quantity
+            }
+            for (bucket, celda, accessory_type), (quantity, closed_quantity) in sorted(accessories.items())
+        ]
+    }), 200
+
+# Cierre masivo (fin de turno)
+BULK_CLOSE_MAX_ITEMS = 10000
+BULK_CLOSE_FILTER_FIELDS = ['celda', 'date', 'from', 'to']
+
+def bulk_close_target(data):
+    """Filtro (sobre 'o') con las órdenes a cerrar: order_ids, order_numbers o filter"""
+    if not isinstance(data, dict):
+        raise ValueError('El cuerpo debe ser un objeto JSON')
+    for field, column in (('order_ids', 'o.id'), ('order_numbers', 'o.order_number')):
+        if field not in data:
+            continue
+        values = data[field]
+        if not isinstance(values, list) or not values:
+            raise ValueError(f'{field} debe ser una lista no vacía')
+        if len(values) > BULK_CLOSE_MAX_ITEMS:
+            raise ValueError(f'Máximo {BULK_CLOSE_MAX_ITEMS} órdenes por solicitud')
+        if field == 'order_ids' and not all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+            raise ValueError('order_ids debe contener enteros')
+        # La lista viaja como un único arreglo: = ANY(%s)
+        return f"{column} = ANY(%s)", [values], field, values
+
+    if 'filter' in data:
+        if not isinstance(data['filter'], dict):
+            raise ValueError('filter debe ser un objeto')
+        filters = {field: value for field, value in data['filter'].items() if field in BULK_CLOSE_FILTER_FIELDS}
+        if not filters:
+            raise ValueError(f'El filtro requiere al menos uno de: {", ".join(BULK_CLOSE_FILTER_FIELDS)}')
+        if not all(isinstance(value, str) for value in filters.values()):
+            raise ValueError(f'Los valores del filtro ({", ".join(filters)}) deben ser texto')
+        clauses, params = build_order_filters(filters)
+        clauses.append("o.is_closed IS NOT TRUE")
+        return ' AND '.join(clauses), params, 'filter', None
+
+    raise ValueError('Se requiere order_ids, order_numbers o filter')
+
+def parse_accessories_added(data, default):
+    """accessories_added del cuerpo: debe ser booleano (no se escribe cualquier valor en la columna)"""
+    value = data.get('accessories_added', default)
+    if not isinstance(value, bool):
+        raise ValueError('accessories_added debe ser true o false')
+    return value
+
+@app.route('/api/orders/close', methods=['PUT'])
+def close_orders():
+    """Cierra varias órdenes en una sola sentencia y devuelve el resultado por orden.
+
+    Cuerpo: order_ids, order_numbers o filter ({celda, date, from, to}) y
+    accessories_added. Cada orden solicitada se informa como closed,
+    already_closed o not_found.
+    """
     try:
+        data = request.get_json(silent=True) or {}
+        target_sql, target_params, mode, requested = bulk_close_target(data)
+        accessories_added = parse_accessories_added(data, False)
+
         db = get_db()
         if db is None:
             return jsonify({'error': 'Error de conexión a la base de datos'}), 500
-        
+
         cursor = db.cursor()
         cursor.execute('''
-            SELECT o.order_number, o.extra_accessory, o.selected, 
-                   o.order_date, o.is_closed, o.accessories_added,
-                   oa.accessory_type, oa.quantity
-            FROM orders o
-            LEFT JOIN order_accessories oa ON o.id = oa.order_id
-            ORDER BY o.order_date DESC
-        ''')
-        
-        data = cursor.fetchall()
+            WITH target AS (
+                SELECT o.id, o.order_number, COALESCE(o.is_closed, FALSE) AS was_closed
+                FROM orders o
+                WHERE {target}
+                FOR UPDATE
+            ), closed AS (
+                UPDATE orders SET is_closed = TRUE, accessories_added = %s
+                FROM target
+                WHERE orders.id = target.id AND NOT target.was_closed
+                RETURNING orders.id
+            )
+            SELECT t.id, t.order_number, t.was_closed FROM target t
+            ORDER BY t.id
+        '''.format(target=target_sql), target_params + [accessories_added])
+        matched = cursor.fetchall()
+        db.commit()
         cursor.close()
-        
-        if not data:
-            return jsonify({'error': 'No hay datos para exportar'}), 404
-        
-        # Convertir a DataFrame
-        df = pd.DataFrame(data)
-        
-        # Guardar como Excel
-        filename = f'orders_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        filepath = os.path.join('/tmp', filename)
-        df.to_excel(filepath, index=False)
-        
-        return send_from_directory('/tmp', filename, as_attachment=True)
-        
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
+        if 'db' in locals() and db:
+            db.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/export/pdf', methods=['GET'])
-def export_pdf():
-    """Exportar órdenes a PDF"""
+    results = [
+        {'id': row['id'], 'order_number': row['order_number'], 'result': 'already_closed' if row['was_closed'] else 'closed'}
+        for row in matched
+    ]
+    if requested is not None:
+        key = 'id' if mode == 'order_ids' else 'order_number'
+        found = {result[key] for result in results}
+        results.extend(
+            {key: value, 'result': 'not_found'}
+            for value in dict.fromkeys(requested) if value not in found
+        )
+
+    closed = sum(1 for result in results if result['result'] == 'closed')
+    if closed:
+        response_cache.invalidate()
+        sync_open_orders(db)
+
+    return jsonify({
+        'message': 'Cierre masivo completado',
+        'closed': closed,
+        'already_closed': sum(1 for result in results if result['result'] == 'already_closed'),
+        'not_found': sum(1 for result in results if result['result'] == 'not_found'),
+        'results': results
+    }), 200
+
+# Importación masiva (CSV/XLSX con el formato de /api/export/excel)
+IMPORT_BATCH_SIZE = 5000
+IMPORT_MAX_ERRORS = 1000
+
+# Un lote completo (órdenes + accesorios) en una sola sentencia y un solo viaje
+IMPORT_ORDERS_SQL = '''
+    WITH new_orders AS (
+        INSERT INTO orders (order_number, extra_accessory, selected, celda, order_date, is_closed, accessories_added)
+        SELECT i.order_number, i.extra_accessory, i.selected, i.celda, to_timestamp(i.order_date),
+               i.is_closed, i.accessories_added
+        FROM unnest(%s::text[], %s::bool[], %s::bool[], %s::text[], %s::bigint[], %s::bool[], %s::bool[])
+             AS i (order_number, extra_accessory, selected, celda, order_date, is_closed, accessories_added)
+        ON CONFLICT (order_number) DO NOTHING
+        RETURNING id, order_number
+    ), new_accessories AS (
+        INSERT INTO order_accessories (order_id, accessory_type, quantity)
+        SELECT n.id, a.accessory_type, a.quantity
+        FROM new_orders n
+        JOIN unnest(%s::text[], %s::text[], %s::int[]) AS a (order_number, accessory_type, quantity)
+            ON a.order_number = n.order_number
+    )
+    SELECT order_number FROM new_orders
+'''
+
+def import_manifest(db, manifest):
+    """Escribe el manifiesto en transacciones de IMPORT_BATCH_SIZE órdenes.
+
+    Devuelve (importadas, errores); las órdenes que ya existen se informan como error.
+    """
+    imported = 0
+    errors = []
+    cursor = db.cursor()
     try:
+        for orders, accessories in batches(manifest, IMPORT_BATCH_SIZE):
+            order_columns = [list(column) for column in zip(*orders)]
+            accessory_columns = [list(column) for column in zip(*accessories)] or [[], [], []]
+            cursor.execute(IMPORT_ORDERS_SQL, order_columns + accessory_columns)
+            inserted = {row['order_number'] for row in cursor.fetchall()}
+            db.commit()
+
+            imported += len(inserted)
+            errors.extend(
+                {'row': manifest.rows[order[0]], 'order_number': order[0], 'error': 'El número de orden ya existe'}
+                for order in orders if order[0] not in inserted
+            )
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        cursor.close()
+    return imported, errors
+
+@app.route('/api/orders/import', methods=['POST'])
+def import_orders():
+    """Importa un manifiesto CSV/XLSX (campo 'file') y devuelve el resultado por fila"""
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'Archivo requerido (campo file)'}), 400
+
+    try:
+        manifest = read_manifest(upload.stream, upload.filename)
+
         db = get_db()
         if db is None:
             return jsonify({'error': 'Error de conexión a la base de datos'}), 500
-        
-        cursor = db.cursor()
-        cursor.execute('''
-            SELECT o.order_number, o.extra_accessory, o.selected, 
-                   o.order_date, o.is_closed, o.accessories_added
-            FROM orders o
-            ORDER BY o.order_date DESC
-        ''')
-        
-        orders = cursor.fetchall()
+        imported, write_errors = import_manifest(db, manifest)
+    except ManifestError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    if imported:
+        response_cache.invalidate()
+        sync_open_orders(db)
+
+    errors = sorted(manifest.errors + write_errors, key=lambda error: error['row'])
+    return jsonify({
+        'message': 'Importación completada',
+        'imported': imported,
+        'rejected': len({error['order_number'] for error in errors}),
+        'errors': errors[:IMPORT_MAX_ERRORS],
+        'errors_truncated': len(errors) > IMPORT_MAX_ERRORS
+    }), 200
+
+EXCEL_HEADER = [
+    'order_number', 'extra_accessory', 'selected', 'celda', 'order_date',
+    'is_closed', 'accessories_added', 'accessory_type', 'quantity'
+]
+EXPORT_FETCH_SIZE = 2000
+EXPORT_FILTER_FIELDS = ['q', 'date', 'from', 'to', 'celda', 'status', 'archived']
+
+# Cola de exportaciones en segundo plano (pool acotado, deduplicación y TTL)
+export_jobs = ExportJobManager(
+    max_workers=int(os.getenv('EXPORT_WORKERS', '2')),
+    max_pending=int(os.getenv('EXPORT_MAX_PENDING', '20')),
+    ttl=int(os.getenv('EXPORT_JOB_TTL', '300')),
+    directory=os.getenv('EXPORT_JOB_DIR'),
+    context=app.app_context
+)
+
+class NoExportData(Exception):
+    """La consulta de exportación no devolvió filas"""
+
+def open_excel_rows(args, job=None):
+    """Abre un cursor del lado del servidor y devuelve un generador de filas.
+
+    Lanza NoExportData si no hay filas. Debe llamarse dentro de un contexto de
+    aplicación (usa get_db).
+    """
+    clauses, params = build_order_filters(args)
+    orders_table, accessories_table = order_tables(args)
+
+    db = get_db()
+    if db is None:
+        raise ConnectionError('Error de conexión a la base de datos')
+
+    # Cursor del lado del servidor: las filas llegan en lotes de EXPORT_FETCH_SIZE
+    cursor = db.cursor(name='export_excel', cursor_factory=psycopg2.extensions.cursor)
+    cursor.itersize = EXPORT_FETCH_SIZE
+    cursor.execute('''
+        SELECT o.order_number, o.extra_accessory, o.selected, o.celda,
+               to_char(o.order_date, 'YYYY-MM-DD HH24:MI:SS') AS order_date,
+               o.is_closed, o.accessories_added,
+               oa.accessory_type, oa.quantity
+        FROM {orders_table} o
+        LEFT JOIN {accessories_table} oa ON o.id = oa.order_id
+        WHERE TRUE {filters}
+        ORDER BY o.order_date DESC, o.id DESC, oa.id
+    '''.format(
+        orders_table=orders_table,
+        accessories_table=accessories_table,
+        filters=''.join(f" AND {clause}" for clause in clauses)
+    ), params)
+    
+    first = cursor.fetchone()
+    if first is None:
         cursor.close()
+        db.rollback()
+        raise NoExportData('No hay datos para exportar')
+
+    def rows():
+        try:
+            yield first
+            for count, row in enumerate(cursor, start=2):
+                if job is not None and count % EXPORT_FETCH_SIZE == 0:
+                    job.progress = count
+                yield row
+        finally:
+            cursor.close()
+            db.rollback()
+
+    return rows()
+
+def write_excel(path, args, job=None):
+    with open(path, 'wb') as output, instrumentation.export_timer('excel'):
+        for chunk in stream_xlsx(EXCEL_HEADER, open_excel_rows(args, job), sheet_name='Ordenes'):
+            output.write(chunk)
+
+PDF_TITLE = "Reporte de Órdenes"
+PDF_HEADER = ["Número de Orden", "Accesorio Extra", "Seleccionado", "Celda", "Fecha", "Cerrado"]
+PDF_COL_WIDTHS = [120, 80, 80, 80, 100, 80]
+PDF_CACHE_SCOPE_FIELDS = ['q', 'celda', 'status', 'archived']
+
+# Caché en disco de las secciones (días) ya renderizadas del reporte PDF
+pdf_cache = SectionCache(os.getenv('PDF_CACHE_DIR'))
+
+def write_pdf(target, args, job=None):
+    """Genera el reporte PDF en `target` (ruta o archivo) con los filtros de /api/orders.
+
+    El reporte se arma por días: los días pasados cuya huella (conteos y ids)
+    no cambió se toman de pdf_cache y solo se renderizan los demás.
+    """
+    clauses, params = build_order_filters(args)
+    filters = ''.join(f" AND {clause}" for clause in clauses)
+    orders_table, _ = order_tables(args)
+
+    db = get_db()
+    if db is None:
+        raise ConnectionError('Error de conexión a la base de datos')
+    
+    # Huella por día (en la zona horaria de la sesión) para reutilizar secciones
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT o.order_date::date AS day, COUNT(*) AS orders,
+               COUNT(*) FILTER (WHERE o.is_closed) AS closed,
+               COUNT(*) FILTER (WHERE o.accessories_added) AS added,
+               MIN(o.id) AS min_id, MAX(o.id) AS max_id, SUM(o.id) AS sum_id
+        FROM {orders_table} o
+        WHERE TRUE {filters}
+        GROUP BY day
+        ORDER BY day DESC
+    '''.format(orders_table=orders_table, filters=filters), params)
+    days = cursor.fetchall()
+    cursor.close()
+    
+    if not days:
+        raise NoExportData('No hay datos para exportar')
+
+    def day_rows(day):
+        # Cursor del lado del servidor por día; se cierra al terminar la sección
+        day_cursor = db.cursor(name=f'export_pdf_{day:%Y%m%d}', cursor_factory=psycopg2.extensions.cursor)
+        day_cursor.itersize = EXPORT_FETCH_SIZE
+        try:
+            day_cursor.execute('''
+                SELECT o.order_number, o.extra_accessory, o.selected, o.celda,
+                       to_char(o.order_date, 'YYYY-MM-DD HH24:MI:SS'), o.is_closed
+                FROM {orders_table} o
+                WHERE o.order_date >= %s::date AND o.order_date < %s::date + 1 {filters}
+                ORDER BY o.order_date DESC, o.id DESC
+            '''.format(orders_table=orders_table, filters=filters), [day, day] + params)
+            for order_number, extra_accessory, selected, celda, order_date, is_closed in day_cursor:
+                if job is not None:
+                    job.progress += 1
+                yield [
+                    str(order_number),
+                    "Sí" if extra_accessory else "No",
+                    "Sí" if selected else "No",
+                    celda or '',
+                    order_date,
+                    "Sí" if is_closed else "No"
+                ]
+        finally:
+            day_cursor.close()
+
+    sections = [
+        (row['day'], (row['orders'], row['closed'], row['added'], row['min_id'], row['max_id'], row['sum_id']),
+         lambda day=row['day']: day_rows(day))
+        for row in days
+    ]
+
+    try:
+        with instrumentation.export_timer('pdf'):
+            build_report(
+                target, PDF_TITLE, PDF_HEADER, PDF_COL_WIDTHS, sections,
+                cache=pdf_cache,
+                cache_scope=job_key('pdf', args, PDF_CACHE_SCOPE_FIELDS)
+            )
+    finally:
+        db.rollback()
+
+@app.route('/api/export/excel', methods=['GET'])
+def export_excel():
+    """Exportar órdenes a Excel en streaming (acepta los filtros de /api/orders)"""
+    try:
+        rows = open_excel_rows(request.args)
+
+        filename = f'orders_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+        return Response(
+            stream_with_context(instrumentation.timed_iter(stream_xlsx(EXCEL_HEADER, rows, sheet_name='Ordenes'), 'excel')),
+            mimetype=XLSX_MIMETYPE,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
         
-        if not orders:
-            return jsonify({'error': 'No hay datos para exportar'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except NoExportData as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export/pdf', methods=['GET'])
+def export_pdf():
+    """Exportar órdenes a PDF (acepta los filtros de /api/orders)"""
+    try:
+        buffer = io.BytesIO()
+        write_pdf(buffer, request.args)
+        buffer.seek(0)
         
-        # Crear PDF
         filename = f'orders_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-        filepath = os.path.join('/tmp', filename)
-        
-        c = canvas.Canvas(filepath, pagesize=letter)
-        width, height = letter
-        
-        # Título
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(50, height - 50, "Reporte de Órdenes")
-        
-        # Encabezados
-        y = height - 100
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(50, y, "Número de Orden")
-        c.drawString(150, y, "Accesorio Extra")
-        c.drawString(250, y, "Seleccionado")
-        c.drawString(350, y, "Fecha")
-        c.drawString(450, y, "Cerrado")
-        
-        # Datos
-        c.setFont("Helvetica", 9)
-        y -= 20
-        for order in orders:
-            if y < 50:  # Nueva página si es necesario
-                c.showPage()
-                y = height - 50
-            
-            c.drawString(50, y, str(order['order_number']))
-            c.drawString(150, y, "Sí" if order['extra_accessory'] else "No")
-            c.drawString(250, y, "Sí" if order['selected'] else "No")
-            c.drawString(350, y, str(order['order_date'])[:10])
-            c.drawString(450, y, "Sí" if order['is_closed'] else "No")
-            y -= 15
-        
-        c.save()
-        
-        return send_from_directory('/tmp', filename, as_attachment=True)
+        return send_file(buffer, mimetype='application/pdf', as_attachment=True, download_name=filename)
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except NoExportData as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/export/jobs', methods=['POST'])
+def submit_export_job():
+    """Encolar una exportación (format: excel o pdf) con los filtros de /api/orders.
+
+    Devuelve 202 con el job_id; el estado se consulta en /api/export/jobs/<id>
+    y el archivo se descarga en /api/export/jobs/<id>/download.
+    """
+    data = request.json or {}
+    args = {field: str(data[field]) for field in EXPORT_FILTER_FIELDS if data.get(field)}
+    export_format = data.get('format', 'excel')
+
+    if export_format not in ('excel', 'pdf'):
+        return jsonify({'error': 'Formato inválido. Opciones válidas: excel, pdf'}), 400
+
+    try:
+        build_order_filters(args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if export_format == 'excel':
+        filename = f'orders_export_{timestamp}.xlsx'
+        mimetype = XLSX_MIMETYPE
+        render = lambda path, job: write_excel(path, args, job)
+    else:
+        filename = f'orders_export_{timestamp}.pdf'
+        mimetype = 'application/pdf'
+        render = lambda path, job: write_pdf(path, args, job)
+
+    try:
+        job = export_jobs.submit(job_key(export_format, args, EXPORT_FILTER_FIELDS), filename, mimetype, render)
+    except ExportQueueFull as e:
+        return jsonify({'error': str(e)}), 429
+
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/export/jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """Estado y progreso de una exportación"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Exportación no encontrada o expirada'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/api/export/jobs/<job_id>/download', methods=['GET'])
+def download_export_job(job_id):
+    """Descargar el archivo de una exportación terminada"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Exportación no encontrada o expirada'}), 404
+    if job.status != DONE:
+        return jsonify(job.to_dict()), 409
+    return send_file(job.path, mimetype=job.mimetype, as_attachment=True, download_name=job.filename)
+
+# Métricas en formato Prometheus (por worker) y últimas consultas lentas
+instrumentation.add_gauges('orders_db_pool', lambda: db_pool.metrics())
+instrumentation.add_gauges('orders_response_cache', lambda: response_cache.metrics())
+instrumentation.add_gauges('orders_pdf_cache', lambda: {'hits': pdf_cache.hits, 'misses': pdf_cache.misses})
+if open_orders is not None:
+    instrumentation.add_gauges('orders_open_index', lambda: open_orders.metrics())
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/slow_queries', methods=['GET'])
+def slow_queries():
+    return jsonify(instrumentation.slow_queries()), 200
+
+@app.route('/health/pool', methods=['GET'])
+def pool_metrics():
+    """Métricas del pool de conexiones"""
+    return jsonify(db_pool.metrics()), 200
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Verificar el estado de la aplicación y conexión a Supabase"""
@@ -402,12 +1760,70 @@ def health_check():
             'status': 'ok', 
             'message': 'Aplicación funcionando correctamente',
             'database': 'Supabase conectado',
-            'supabase_url': SUPABASE_URL
+            'supabase_url': SUPABASE_URL,
+            'pool': db_pool.metrics(),
+            'response_cache': response_cache.metrics(),
+            'response_encoder': response_encoder.metrics(),
+            'events': {
+                'subscribers': order_events.subscriber_count(),
+                'listener_connected': order_listener.connected
+            }
         }), 200
         
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# Fábrica para servidores WSGI (gunicorn -c gunicorn.conf.py con ORDERS_BACKEND=postgres)
+INIT_DB_LOCK_ID = 7310231
+
+def shutdown_worker():
+    """Libera los recursos del proceso al terminar el worker"""
+    order_listener.stop()
+    export_jobs.shutdown()
+    db_pool.close()
+
+# reportlab/pypdf (PDF) y pandas (importación) se cargan en el primer uso;
+# los workers que solo registran órdenes arrancan antes y ocupan menos memoria.
+# EXPORT_PRELOAD=true los carga al arrancar (p. ej. un gunicorn aparte que
+# solo atiende /api/export* e /api/import*)
+EXPORT_PRELOAD = os.getenv('EXPORT_PRELOAD', 'false').lower() == 'true'
+
+def preload_export_modules():
+    import order_import
+    import pdf_report
+
+    pdf_report.preload()
+    order_import.preload()
+
+def create_app():
+    """Inicializa la base y devuelve la app ('main:create_app()' en gunicorn).
+
+    init_db corre bajo un advisory lock de Postgres, así las migraciones se
+    ejecutan una sola vez aunque arranquen varios workers a la vez.
+    """
+    with app.app_context():
+        db = get_db()
+        if db is not None:
+            cursor = db.cursor()
+            cursor.execute("SELECT pg_advisory_lock(%s)", (INIT_DB_LOCK_ID,))
+            try:
+                if not init_db():
+                    print("Error inicializando base de datos")
+            finally:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (INIT_DB_LOCK_ID,))
+                db.commit()
+                cursor.close()
+            # Fuera del advisory lock: cada worker carga su índice en paralelo
+            sync_open_orders(db)
+    db_pool.warm()
+
+    # Un worker dedicado a exportar precarga reportlab/pandas en segundo plano
+    if EXPORT_PRELOAD:
+        threading.Thread(target=preload_export_modules, name='export-preload', daemon=True).start()
+
+    app.extensions['lifecycle'] = {'drain': order_events.close, 'shutdown': shutdown_worker}
+    return app
+
 if __name__ == '__main__':
     print("Inicializando aplicación...")
     print(f"Conectando a Supabase: {SUPABASE_URL}")
@@ -419,9 +1835,11 @@ if __name__ == '__main__':
             print("Base de datos inicializada correctamente")
         else:
             print("Error inicializando base de datos")
+        sync_open_orders(get_db())
+    db_pool.warm()
     
     # Ejecutar aplicación
     port = int(os.getenv('PORT', 5000))
-    debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     app.run(debug=debug, host='0.0.0.0', port=port)
 
@@ -0,0 +1,99 @@
+"""
+Escucha de notificaciones de Postgres (LISTEN/NOTIFY) para main.py.
+
+Cada proceso worker abre una única conexión dedicada, hace LISTEN sobre el
+canal y reenvía cada notificación (payload JSON) al EventBroker local. Así
+todos los workers de gunicorn reciben los eventos de cualquier otro worker
+(o de escrituras hechas directamente contra Supabase) y el coste en la base de
+datos es una conexión por worker, sin importar cuántos tableros estén abiertos.
+"""
+import json
+import select
+import threading
+
+from order_events import RESYNC
+
+
+class NotificationListener:
+    """Hilo en segundo plano que hace LISTEN y publica en un EventBroker.
+
+    `on_event(event)` se llama además con cada notificación (por ejemplo para
+    invalidar cachés locales). `on_connect()` se llama tras cada LISTEN, antes
+    de marcar el listener como conectado: lo que cambió antes de escuchar no
+    llega como notificación y debe leerse de la base.
+    """
+
+    def __init__(self, connect, channel, broker, on_event=None, on_connect=None, poll_timeout=5.0, reconnect_delay=2.0):
+        self._connect = connect
+        self.channel = channel
+        self.broker = broker
+        self.on_event = on_event
+        self.on_connect = on_connect
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self.connected = False
+
+    def start(self):
+        """Arranca el hilo si aún no corre (idempotente; llamar tras el fork del worker)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=f'listen-{self.channel}', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        reconnecting = False
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                cursor = conn.cursor()
+                cursor.execute(f'LISTEN "{self.channel}"')
+                cursor.close()
+                if self.on_connect is not None:
+                    self.on_connect()
+                self.connected = True
+                if reconnecting:
+                    # Pudieron perderse notificaciones mientras no había conexión
+                    self._publish({'type': RESYNC})
+
+                while not self._stopped.is_set():
+                    readable, _, _ = select.select([conn], [], [], self.poll_timeout)
+                    if not readable:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        self._dispatch(notification.payload)
+            except Exception as e:
+                print(f"Listener '{self.channel}' desconectado: {e}")
+            finally:
+                reconnecting = True
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stopped.wait(self.reconnect_delay)
+
+    def _dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            print(f"Notificación inválida en '{self.channel}': {payload!r}")
+            return
+        self._publish(event)
+
+    def _publish(self, event):
+        if self.on_event is not None:
+            self.on_event(event)
+        self.broker.publish(event)
@@ -0,0 +1,68 @@
+"""
+Configuración común de las pruebas (`python -m pytest` desde backend/).
+
+Los módulos del backend se importan igual que en gunicorn: los de backend/
+(app.py y compartidos) y los de backend/src/ (main.py, db_pool, pg_listener).
+
+Las pruebas que necesitan Postgres usan `TEST_DATABASE_URL` (una base de
+pruebas local) o, si está instalado, `testing.postgresql` para levantar un
+servidor temporal; sin ninguno de los dos se omiten.
+"""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (BACKEND_DIR, os.path.join(BACKEND_DIR, 'src')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture(scope='session')
+def postgres_url():
+    url = os.getenv('TEST_DATABASE_URL')
+    if url:
+        yield url
+        return
+    try:
+        import testing.postgresql
+    except ImportError:
+        pytest.skip('Se requiere TEST_DATABASE_URL o testing.postgresql')
+    with testing.postgresql.Postgresql() as postgresql:
+        yield postgresql.url()
+
+
+@pytest.fixture(scope='session')
+def sqlite_app(tmp_path_factory):
+    """app.py (SQLite) sobre una base temporal, con el índice de órdenes abiertas activo.
+
+    app.py lee la configuración del entorno al importarse, así que se importa
+    una sola vez por sesión; cada prueba usa sus propios números de orden.
+    """
+    os.environ['SQLITE_DATABASE'] = str(tmp_path_factory.mktemp('sqlite') / 'orders.db')
+    os.environ['OPEN_ORDER_INDEX'] = 'true'
+    import app
+
+    app.create_app()
+    app.app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(sqlite_app):
+    return sqlite_app.app.test_client()
+
+
+@pytest.fixture
+def add_order(client):
+    def add(order_number, celda='Celda 10', accessories=(('bolsa', 1),)):
+        response = client.post('/api/add_order', json={
+            'order_number': order_number,
+            'celda': celda,
+            'extra_accessory': False,
+            'accessories': [{'accessory_type': kind, 'quantity': quantity} for kind, quantity in accessories],
+        })
+        assert response.status_code == 201, response.get_json()
+        return response.get_json()['order_id']
+    return add
@@ -0,0 +1,104 @@
+import time
+
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeout
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+
+@pytest.fixture
+def make_pool(postgres_url):
+    pools = []
+
+    def make(**options):
+        pool = ConnectionPool(lambda: psycopg2.connect(postgres_url), **options)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def backend_pid(conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT pg_backend_pid()')
+    pid = cursor.fetchone()[0]
+    cursor.close()
+    conn.rollback()
+    return pid
+
+
+def test_acquire_timeout_when_pool_is_full(make_pool):
+    pool = make_pool(max_size=1, acquire_timeout=0.2)
+    conn = pool.acquire()
+
+    started = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.2
+    assert pool.metrics()['timeouts_total'] == 1
+
+    # La conexión liberada vuelve a estar disponible
+    pool.release(conn)
+    assert pool.acquire() is conn
+
+
+def test_health_check_replaces_dead_connection(make_pool, postgres_url):
+    pool = make_pool(max_size=1, check_after_idle=0)
+    conn = pool.acquire()
+    pid = backend_pid(conn)
+    pool.release(conn)
+
+    # El servidor cierra la conexión mientras está libre en el pool
+    admin = psycopg2.connect(postgres_url)
+    admin.autocommit = True
+    cursor = admin.cursor()
+    cursor.execute('SELECT pg_terminate_backend(%s)', (pid,))
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        cursor.execute('SELECT 1 FROM pg_stat_activity WHERE pid = %s', (pid,))
+        if cursor.fetchone() is None:
+            break
+        time.sleep(0.05)
+    admin.close()
+
+    replacement = pool.acquire()
+    assert backend_pid(replacement) != pid
+    metrics = pool.metrics()
+    assert metrics['failed_checks_total'] == 1
+    assert metrics['closed_total'] == 1
+    assert metrics['size'] == 1
+
+
+def test_max_lifetime_recycles_connection(make_pool):
+    pool = make_pool(max_size=1, max_lifetime=0.1)
+    conn = pool.acquire()
+    pid = backend_pid(conn)
+    pool.release(conn)
+
+    time.sleep(0.2)
+    recycled = pool.acquire()
+    assert backend_pid(recycled) != pid
+    metrics = pool.metrics()
+    assert metrics['created_total'] == 2
+    assert metrics['closed_total'] == 1
+
+
+def test_release_rolls_back_open_transaction(make_pool):
+    pool = make_pool(max_size=1)
+    conn = pool.acquire()
+    cursor = conn.cursor()
+    cursor.execute('CREATE TEMP TABLE pool_release (value INTEGER)')
+    conn.commit()
+    cursor.execute('INSERT INTO pool_release VALUES (1)')
+    cursor.close()
+    pool.release(conn)
+
+    conn = pool.acquire()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM pool_release')
+    assert cursor.fetchone()[0] == 0
+    cursor.close()
+    pool.release(conn)
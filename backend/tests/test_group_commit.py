@@ -0,0 +1,87 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from group_commit import GroupCommitWriter, WriterClosed
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'writer.db')
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("CREATE TABLE items (name TEXT NOT NULL UNIQUE)")
+    conn.close()
+    return path
+
+
+def names(path):
+    conn = sqlite3.connect(path)
+    try:
+        return sorted(row[0] for row in conn.execute("SELECT name FROM items"))
+    finally:
+        conn.close()
+
+
+def insert(*values):
+    def operation(cursor):
+        for value in values:
+            cursor.execute("INSERT INTO items (name) VALUES (?)", (value,))
+        return cursor.lastrowid
+    return operation
+
+
+def test_failed_operation_rolls_back_only_its_savepoint(database):
+    writer = GroupCommitWriter(lambda: sqlite3.connect(database, check_same_thread=False))
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocker(cursor):
+        started.set()
+        release.wait(5)
+        return 'first'
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        # Mientras el primer lote espera, las tres operaciones siguientes se encolan juntas
+        first = pool.submit(writer.submit, blocker)
+        assert started.wait(5)
+        ok_before = pool.submit(writer.submit, insert('a'))
+        failing = pool.submit(writer.submit, insert('b', 'b'))
+        ok_after = pool.submit(writer.submit, insert('c'))
+        while writer.metrics()['queue_depth'] < 3:
+            time.sleep(0.01)
+        release.set()
+
+        assert first.result(5) == 'first'
+        assert ok_before.result(5) and ok_after.result(5)
+        with pytest.raises(sqlite3.IntegrityError):
+            failing.result(5)
+
+    # El primer 'b' se insertó antes del error, pero su SAVEPOINT se deshizo
+    assert names(database) == ['a', 'c']
+    metrics = writer.metrics()
+    assert metrics['batches_total'] == 2
+    assert metrics['batch_size_max'] == 3
+    assert metrics['failed_operations_total'] == 1
+    assert metrics['failed_batches_total'] == 0
+    writer.close()
+
+
+def test_results_arrive_after_commit(database):
+    writer = GroupCommitWriter(lambda: sqlite3.connect(database, check_same_thread=False))
+    writer.submit(insert('x'))
+    # Otra conexión ya ve la fila: submit() volvió después del COMMIT
+    assert names(database) == ['x']
+    writer.close()
+
+
+def test_closed_writer_rejects_operations(database):
+    writer = GroupCommitWriter(lambda: sqlite3.connect(database, check_same_thread=False))
+    writer.submit(insert('y'))
+    writer.close()
+    with pytest.raises(WriterClosed):
+        writer.submit(insert('z'))
+    assert names(database) == ['y']
@@ -0,0 +1,35 @@
+import sqlite3
+
+from metrics import Instrumentation
+
+
+def connect(instrumentation):
+    return sqlite3.connect(':memory:', factory=instrumentation.sqlite_connection_class())
+
+
+def test_connection_execute_is_recorded_without_closing_the_cursor():
+    instrumentation = Instrumentation('sqlite')
+    conn = connect(instrumentation)
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("CREATE TABLE items (name TEXT)")
+    conn.executemany("INSERT INTO items (name) VALUES (?)", [('a',), ('b',)])
+
+    # Ningún cursor se cerró ni se leyó: las sentencias ya están registradas
+    rendered = instrumentation.render()
+    assert 'statement="PRAGMA temp_store = MEMORY"' in rendered
+    assert 'statement="CREATE TABLE items (name TEXT)"' in rendered
+    assert ('orders_sql_rows_sum{backend="sqlite",statement="INSERT INTO items (name) VALUES (?)"} 2'
+            in rendered)
+    conn.close()
+
+
+def test_slow_connection_execute_is_explained():
+    instrumentation = Instrumentation('sqlite', slow_query_seconds=0)
+    conn = connect(instrumentation)
+    conn.execute("CREATE TABLE items (name TEXT)")
+    assert conn.execute("SELECT name FROM items WHERE name = ?", ('a',)).fetchall() == []
+
+    select = [entry for entry in instrumentation.slow_queries() if entry['statement'].startswith('SELECT')]
+    assert len(select) == 1
+    assert 'SCAN items' in select[0]['plan']
+    conn.close()
@@ -0,0 +1,74 @@
+from open_orders import OpenOrderIndex
+
+COLUMNS = ('id', 'order_number', 'celda', 'order_date', 'is_closed', 'change_version')
+
+
+def row(order_id, celda, order_date, is_closed=False, change_version=0):
+    return {
+        'id': order_id, 'order_number': f'N-{order_id}', 'celda': celda,
+        'order_date': order_date, 'is_closed': is_closed, 'change_version': change_version,
+    }
+
+
+def ids(records):
+    return [record['id'] for record in records]
+
+
+def test_page_by_celda_with_cursor():
+    index = OpenOrderIndex(COLUMNS, sort_column='order_date')
+    index.warm(lambda: ([row(1, 'A', 10), row(2, 'B', 20), row(3, 'A', 30), row(4, 'A', 30)], 7))
+
+    records, total, version = index.page('A', limit=2)
+    assert ids(records) == [4, 3] and total == 3 and version == 7
+    records, _, _ = index.page('A', position=records[-1].sort_key, limit=2)
+    assert ids(records) == [1]
+    assert ids(index.page(limit=10)[0]) == [4, 3, 2, 1]
+    # Se comporta como una fila del cursor
+    assert list(index.get('N-2').keys()) == list(COLUMNS) and index.get('N-2')[2] == 'B'
+
+
+def test_sync_applies_changes_after_last_version():
+    index = OpenOrderIndex(COLUMNS, sort_column='order_date')
+    index.warm(lambda: ([row(1, 'A', 10), row(2, 'A', 20)], 2))
+    seen = []
+
+    def fetch_changes(since):
+        seen.append(since)
+        # Alta de 3, cierre de 1 y 2 cambia de celda
+        return [row(3, 'A', 30, change_version=3), row(1, 'A', 10, True, 4), row(2, 'B', 20, change_version=5)], 5
+
+    index.sync(fetch_changes)
+    assert seen == [2] and index.version == 5
+    assert ids(index.page('A')[0]) == [3]
+    assert ids(index.page('B')[0]) == [2]
+    assert index.get('N-1') is None
+
+    # Repetir los mismos cambios no altera el resultado
+    index.sync(lambda since: fetch_changes(since))
+    assert seen == [2, 5]
+    assert ids(index.page()[0]) == [3, 2]
+    assert index.metrics()['celdas'] == {'A': 1, 'B': 1}
+
+
+def test_index_follows_add_and_close(sqlite_app, client, add_order):
+    celda = 'Celda 15'
+    first = add_order('E-1', celda=celda)
+    second = add_order('E-2', celda=celda, accessories=(('tapa', 2),))
+
+    index = sqlite_app.open_orders
+    assert index.get('E-1')['id'] == first
+    assert index.version == sqlite_app.current_change_version(sqlite_app.get_db().cursor())
+
+    listing = client.get('/api/get_orders', query_string={'status': 'open', 'celda': celda})
+    assert [order['id'] for order in listing.get_json()] == [second, first]
+
+    response = client.post('/api/close_order', json={'order_id': first, 'accessories_added': True})
+    assert response.status_code == 200, response.get_json()
+    assert index.get('E-1') is None
+
+    from_index = client.get('/api/get_orders', query_string={'status': 'open', 'celda': celda})
+    # sort no lo resuelve el índice: misma consulta contra la base
+    from_db = client.get('/api/get_orders', query_string={'status': 'open', 'celda': celda, 'sort': 'date'})
+    assert [order['id'] for order in from_index.get_json()] == [second]
+    assert from_index.get_json() == from_db.get_json()
+    assert from_index.headers['X-Change-Version'] == from_db.headers['X-Change-Version']
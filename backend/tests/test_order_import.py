@@ -0,0 +1,100 @@
+import io
+
+import pytest
+
+from order_import import ManifestError, batches, read_manifest
+
+pytest.importorskip('pandas')
+
+CELDAS = ['Celda 10', 'Celda 11']
+SUMMARY_HEADER = 'Número de Orden,Accesorios,Accesorio Extra,Celda,Fecha de Orden,Estado\n'
+
+
+def csv_file(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+def test_summary_rows_are_validated_and_invalid_orders_rejected():
+    manifest = read_manifest(csv_file(
+        SUMMARY_HEADER
+        + 'A-1,"bolsa (x2),tapa (x1)",Sí,Celda 10,2024-05-01 08:30:00,Abierta\n'
+        + 'A-2,bolsa (x1),No,Celda 99,2024-05-01 08:30:00,Abierta\n'
+        + 'A-3,bolsa (x0),No,Celda 11,2024-05-01 08:30:00,Abierta\n'
+        + 'A-4,bolsa (x1),No,Celda 11,01/05/2024,Abierta\n'
+        + 'A-5,bolsa,No,Celda 11,2024-05-01 08:30:00,Cerrada - Agregados\n'
+        + 'A-6,tapa (x3),No,Celda 11,2024-05-01 09:00:00,Cerrada - No Agregados\n'
+    ), 'manifest.csv', valid_celdas=CELDAS)
+
+    assert [order[0] for order in manifest.orders] == ['A-1', 'A-6']
+    a1, a6 = manifest.orders
+    assert a1[1] is True and a1[3] == 'Celda 10' and a1[5:] == (False, False)
+    assert a6[5:] == (True, False)
+    assert manifest.accessories == [('A-1', 'bolsa', 2), ('A-1', 'tapa', 1), ('A-6', 'tapa', 3)]
+
+    assert [(error['row'], error['order_number'], error['error']) for error in manifest.errors] == [
+        (3, 'A-2', 'Celda inválida'),
+        (4, 'A-3', 'Cantidad inválida (entero positivo)'),
+        (5, 'A-4', 'Fecha inválida (formato: YYYY-MM-DD HH:MM:SS)'),
+        (6, 'A-5', 'Accesorio inválido (formato: "tipo (xN)")'),
+    ]
+
+
+def test_flat_order_with_one_invalid_row_is_rejected_whole():
+    manifest = read_manifest(csv_file(
+        'order_number,extra_accessory,selected,celda,order_date,is_closed,accessories_added,accessory_type,quantity\n'
+        'B-1,false,false,Celda 10,2024-05-01 08:30:00,false,false,bolsa,1\n'
+        'B-1,false,false,Celda 10,2024-05-01 08:30:00,false,false,tapa,-2\n'
+        'B-2,maybe,false,Celda 10,2024-05-01 08:30:00,false,false,bolsa,1\n'
+        'B-3,false,false,Celda 10,2024-05-01 08:30:00,false,false,bolsa,4\n'
+    ), 'manifest.csv', valid_celdas=CELDAS)
+
+    assert [order[0] for order in manifest.orders] == ['B-3']
+    assert manifest.accessories == [('B-3', 'bolsa', 4)]
+    assert {(error['row'], error['order_number']) for error in manifest.errors} == {(3, 'B-1'), (4, 'B-2')}
+
+
+def test_unknown_columns_and_formats_raise():
+    with pytest.raises(ManifestError):
+        read_manifest(csv_file('numero,cosa\n1,2\n'), 'manifest.csv')
+    with pytest.raises(ManifestError):
+        read_manifest(csv_file(SUMMARY_HEADER), 'manifest.txt')
+
+
+def test_batches_keep_accessories_with_their_order():
+    manifest = read_manifest(csv_file(
+        SUMMARY_HEADER
+        + 'C-1,"bolsa (x1),tapa (x1)",No,Celda 10,,Abierta\n'
+        + 'C-2,bolsa (x2),No,Celda 10,,Abierta\n'
+        + 'C-3,,No,Celda 10,,Abierta\n'
+    ), 'manifest.csv', valid_celdas=CELDAS)
+
+    assert [(len(orders), accessories) for orders, accessories in batches(manifest, 2)] == [
+        (2, [('C-1', 'bolsa', 1), ('C-1', 'tapa', 1), ('C-2', 'bolsa', 2)]),
+        (1, []),
+    ]
+
+
+def test_import_rejects_existing_order_numbers(client, add_order):
+    add_order('D-1')
+
+    response = client.post('/api/import_orders', data={'file': (csv_file(
+        SUMMARY_HEADER
+        + 'D-1,bolsa (x1),No,Celda 10,2024-05-01 08:30:00,Abierta\n'
+        + 'D-2,tapa (x2),No,Celda 10,2024-05-01 08:30:00,Abierta\n'
+        + 'D-3,tapa (x1),No,Celda 99,2024-05-01 08:30:00,Abierta\n'
+    ), 'manifest.csv')})
+
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert body['imported'] == 1
+    assert body['rejected'] == 2
+    assert [(error['row'], error['order_number'], error['error']) for error in body['errors']] == [
+        (2, 'D-1', 'El número de orden ya existe'),
+        (4, 'D-3', 'Celda inválida'),
+    ]
+
+    imported = client.get('/api/get_order/D-2').get_json()
+    assert imported['accessories'] == [{'accessory_type': 'tapa', 'quantity': 2}]
+    # La orden que ya existía no cambia
+    existing = client.get('/api/get_order/D-1').get_json()
+    assert existing['accessories'] == [{'accessory_type': 'bolsa', 'quantity': 1}]
@@ -0,0 +1,86 @@
+import pytest
+from flask import Flask, jsonify
+
+from response_cache import MemoryBackend, ResponseCache
+
+
+@pytest.fixture
+def cached_app():
+    app = Flask(__name__)
+    cache = ResponseCache(MemoryBackend(), ttl=60)
+    state = {'calls': 0, 'orders': ['A-1']}
+
+    @app.route('/orders')
+    @cache.cached
+    def orders():
+        state['calls'] += 1
+        return jsonify(state['orders'])
+
+    @app.route('/missing')
+    @cache.cached
+    def missing():
+        state['calls'] += 1
+        return jsonify({'error': 'Orden no encontrada'}), 404
+
+    return app.test_client(), cache, state
+
+
+def test_hit_is_served_without_calling_the_view(cached_app):
+    client, cache, state = cached_app
+    first = client.get('/orders?b=2&a=1')
+    second = client.get('/orders?a=1&b=2')
+
+    assert first.status_code == second.status_code == 200
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert second.get_json() == ['A-1']
+    # El orden de los parámetros no cambia la clave
+    assert state['calls'] == 1
+    assert cache.metrics()['hits'] == 1
+
+
+def test_matching_etag_returns_304(cached_app):
+    client, _, state = cached_app
+    etag = client.get('/orders').headers['ETag']
+
+    response = client.get('/orders', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert state['calls'] == 1
+
+
+def test_generation_bump_invalidates(cached_app):
+    client, cache, state = cached_app
+    etag = client.get('/orders').headers['ETag']
+
+    state['orders'].append('A-2')
+    cache.invalidate()
+
+    response = client.get('/orders', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json() == ['A-1', 'A-2']
+    assert response.headers['ETag'] != etag
+    assert state['calls'] == 2
+
+
+def test_errors_are_not_cached(cached_app):
+    client, _, state = cached_app
+    assert client.get('/missing').status_code == 404
+    assert client.get('/missing').status_code == 404
+    assert state['calls'] == 2
+
+
+def test_memory_backend_expires_and_evicts(monkeypatch):
+    backend = MemoryBackend(max_entries=2)
+    now = [100.0]
+    monkeypatch.setattr('response_cache.time.monotonic', lambda: now[0])
+
+    backend.set('a', 1, ttl=10)
+    backend.set('b', 2, ttl=10)
+    backend.get('a')
+    backend.set('c', 3, ttl=10)
+    # 'b' era la entrada menos usada
+    assert (backend.get('a'), backend.get('b'), backend.get('c')) == (1, None, 3)
+
+    now[0] += 11
+    assert backend.get('a') is None
@@ -0,0 +1,79 @@
+import time
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def half_hour_zone(monkeypatch):
+    # UTC+5:30: la medianoche local cae a mitad de una hora UTC
+    monkeypatch.setenv('TZ', 'Asia/Kolkata')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def insert_order(sqlite_app, order_number, celda, local_time, closed=False):
+    order_date = int(datetime.strptime(local_time, '%Y-%m-%d %H:%M').timestamp())
+    db = sqlite_app.get_db()
+    cursor = db.execute(
+        "INSERT INTO orders (order_number, extra_accessory, celda, order_date, is_closed) VALUES (?, 0, ?, ?, ?)",
+        (order_number, celda, order_date, closed)
+    )
+    db.execute(
+        "INSERT INTO order_accessories (order_id, accessory_type, quantity) VALUES (?, 'bolsa', 2)",
+        (cursor.lastrowid,)
+    )
+    db.commit()
+
+
+def stats(sqlite_app, client, **params):
+    sqlite_app.response_cache.invalidate()
+    response = client.get('/api/stats', query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_days_split_at_local_midnight_with_half_hour_offset(sqlite_app, client, half_hour_zone):
+    celda = 'Celda 6'
+    # 23:45 y 00:15 locales caen en la misma hora UTC (18:00-19:00)
+    insert_order(sqlite_app, 'S-1', celda, '2024-03-01 23:45')
+    insert_order(sqlite_app, 'S-2', celda, '2024-03-02 00:15', closed=True)
+
+    days = stats(sqlite_app, client, celda=celda, granularity='day')
+    assert [(row['bucket'], row['orders'], row['closed']) for row in days['orders']] == [
+        ('2024-03-01', 1, 0), ('2024-03-02', 1, 1),
+    ]
+    assert [(row['bucket'], row['quantity']) for row in days['accessories']] == [('2024-03-01', 2), ('2024-03-02', 2)]
+
+    hours = stats(sqlite_app, client, celda=celda, granularity='hour')
+    assert [row['bucket'] for row in hours['orders']] == ['2024-03-01 23:00', '2024-03-02 00:00']
+
+    # El filtro por fecha toma solo el día local pedido
+    day = stats(sqlite_app, client, celda=celda, date='2024-03-02')
+    assert [(row['bucket'], row['orders']) for row in day['orders']] == [('2024-03-02', 1)]
+
+
+def test_init_rebuilds_utc_hour_buckets(sqlite_app, client, half_hour_zone):
+    celda = 'Celda 5'
+    insert_order(sqlite_app, 'S-3', celda, '2024-03-01 23:45')
+    insert_order(sqlite_app, 'S-4', celda, '2024-03-02 00:15')
+
+    # Resúmenes calculados con el bucket anterior (hora UTC)
+    db = sqlite_app.get_db()
+    db.execute("DELETE FROM order_stats_hourly WHERE celda = ?", (celda,))
+    db.execute(
+        "INSERT INTO order_stats_hourly (bucket, celda, orders, closed) "
+        "SELECT order_date - order_date % 3600, celda, COUNT(*), 0 FROM orders WHERE celda = ? GROUP BY 1, 2",
+        (celda,)
+    )
+    db.commit()
+
+    cursor = db.cursor()
+    sqlite_app.init_stats(cursor)
+    db.commit()
+    cursor.close()
+
+    days = stats(sqlite_app, client, celda=celda)
+    assert [(row['bucket'], row['orders']) for row in days['orders']] == [('2024-03-01', 1), ('2024-03-02', 1)]
@@ -0,0 +1,52 @@
+import io
+import os
+from datetime import date, datetime
+
+import pytest
+
+from xlsx_stream import stream_xlsx
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+def load(chunks):
+    return openpyxl.load_workbook(io.BytesIO(b''.join(chunks)))
+
+
+def test_output_opens_in_openpyxl():
+    header = ['Número de Orden', 'Cantidad', 'Extra', 'Fecha', 'Día', 'Nota']
+    rows = [
+        ('A-1', 2, True, datetime(2024, 5, 1, 8, 30), date(2024, 5, 1), 'bolsa & tapa <x2>'),
+        ('A-2', 1.5, False, None, None, 'control\x07 eliminado'),
+    ]
+
+    workbook = load(stream_xlsx(header, iter(rows), sheet_name='Órdenes'))
+
+    sheet = workbook['Órdenes']
+    assert [cell.value for cell in sheet[1]] == header
+    assert sheet[1][0].font.bold
+    assert [cell.value for cell in sheet[2]] == ['A-1', 2, True, '2024-05-01 08:30:00', '2024-05-01', 'bolsa & tapa <x2>']
+    assert [cell.value for cell in sheet[3]] == ['A-2', 1.5, False, None, None, 'control eliminado']
+
+
+def test_rows_are_streamed_in_chunks():
+    consumed = []
+
+    def rows():
+        for number in range(2000):
+            consumed.append(number)
+            # Texto poco comprimible: deflate entrega bytes a medida que escribe
+            yield f'N-{number}', os.urandom(32).hex()
+
+    chunks = []
+    read_when_yielded = []
+    for chunk in stream_xlsx(['Orden', 'Dato'], rows(), chunk_rows=100):
+        chunks.append(chunk)
+        if chunk:
+            read_when_yielded.append(len(consumed))
+
+    # Hubo bloques antes de leer todas las filas (no se arma el archivo en memoria)
+    assert min(read_when_yielded[1:]) < 2000
+    sheet = load(chunks).active
+    assert sheet.max_row == 2001
+    assert sheet.cell(row=2001, column=1).value == 'N-1999'
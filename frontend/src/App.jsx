@@ -31,16 +31,13 @@ function App() {
       setLoading(true);
       setError('');
       
+      // ✅ ACTUALIZADO: El filtro por celda se envía a la API en lugar de
+      // filtrar en el frontend una lista que puede llegar incompleta
       let data;
       if (searchTerm || dateFilter) {
-        data = await api.searchOrders(searchTerm, dateFilter);
+        data = await api.searchOrders(searchTerm, dateFilter, celdaFilter);
       } else {
-        data = await api.getOrders();
-      }
-      
-      // ✅ NUEVO: Filtrar por celda en el frontend
-      if (celdaFilter) {
-        data = data.filter(order => order.celda === celdaFilter);
+        data = await api.getOrders(celdaFilter);
       }
       
       setOrders(data);
@@ -16,8 +16,8 @@ const getApiBaseUrl = () => {
 
 const API_BASE_URL = getApiBaseUrl()
 
-// Función helper para hacer peticiones HTTP
-const apiRequest = async (endpoint, options = {}) => {
+// Función helper para hacer peticiones HTTP (devuelve la respuesta para leer cabeceras)
+const apiFetch = async (endpoint, options = {}) => {
   const url = `${API_BASE_URL}${endpoint}`
   
   console.log(`🌐 API Request: ${url}`) // Para debugging
@@ -43,12 +43,7 @@ const apiRequest = async (endpoint, options = {}) => {
       throw new Error(`HTTP error! status: ${response.status}`)
     }
     
-    const contentType = response.headers.get('content-type')
-    if (contentType && (contentType.includes('application/vnd.openxmlformats') || contentType.includes('application/pdf'))) {
-      return response.blob()
-    }
-    
-    return await response.json()
+    return response
   } catch (error) {
     console.error('❌ API Request Error:', error)
     
@@ -60,10 +55,68 @@ const apiRequest = async (endpoint, options = {}) => {
   }
 }
 
+const apiRequest = async (endpoint, options = {}) => {
+  const response = await apiFetch(endpoint, options)
+  
+  const contentType = response.headers.get('content-type')
+  if (contentType && (contentType.includes('application/vnd.openxmlformats') || contentType.includes('application/pdf'))) {
+    return response.blob()
+  }
+  
+  return await response.json()
+}
+
+// ✅ NUEVO: Los listados llegan paginados (100 órdenes por defecto); se siguen
+// las páginas con el cursor de X-Next-Cursor hasta tener todas las órdenes
+const apiRequestAllPages = async (endpoint, params) => {
+  const orders = []
+  let cursor = null
+  
+  do {
+    const pageParams = new URLSearchParams(params)
+    if (cursor) pageParams.set('cursor', cursor)
+    const response = await apiFetch(`${endpoint}?${pageParams.toString()}`)
+    orders.push(...await response.json())
+    cursor = response.headers.get('X-Next-Cursor')
+  } while (cursor)
+  
+  return orders
+}
+
+// ✅ NUEVO: Cambios (altas y cierres) posteriores a la versión 'since'. El 'since'
+// inicial es la cabecera X-Change-Version del listado; se leen todas las
+// páginas (X-Has-More) y se devuelve la versión para la siguiente llamada
+const apiRequestChanges = async (since, celda) => {
+  const orders = []
+  let version = since
+  let hasMore
+  
+  do {
+    const params = orderParams({ celda })
+    params.set('since', version)
+    const response = await apiFetch(`/api/orders/changes?${params.toString()}`)
+    orders.push(...await response.json())
+    version = response.headers.get('X-Change-Version')
+    hasMore = response.headers.get('X-Has-More') === '1'
+  } while (hasMore)
+  
+  return { orders, version }
+}
+
+const orderParams = ({ query, date, celda } = {}) => {
+  const params = new URLSearchParams()
+  if (query) params.append('q', query)
+  if (date) params.append('date', date)
+  // ✅ NUEVO: El filtro por celda lo aplica el servidor
+  if (celda) params.append('celda', celda)
+  return params
+}
+
 // API endpoints
 export const api = {
   healthCheck: () => apiRequest('/health'),
-  getOrders: () => apiRequest('/api/orders'),
+  getOrders: (celda) => apiRequestAllPages('/api/orders', orderParams({ celda })),
+  getOrderChanges: (since, celda) => apiRequestChanges(since, celda),
   addOrder: (orderData) => apiRequest('/api/add_order', {
     method: 'POST',
     body: JSON.stringify(orderData)
@@ -72,12 +125,7 @@ export const api = {
     method: 'PUT',
     body: JSON.stringify({ accessories_added: accessoriesAdded })
   }),
-  searchOrders: (query, date) => {
-    const params = new URLSearchParams()
-    if (query) params.append('q', query)
-    if (date) params.append('date', date)
-    return apiRequest(`/api/orders/search?${params.toString()}`)
-  },
+  searchOrders: (query, date, celda) => apiRequestAllPages('/api/orders/search', orderParams({ query, date, celda })),
   exportExcel: async () => await apiRequest('/api/export/excel'),
   exportPdf: async () => await apiRequest('/api/export/pdf')
 }
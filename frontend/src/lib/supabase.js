@@ -46,15 +46,22 @@ export const testConnection = async () => {
 
 // ✅ API CORREGIDA para usar estructura de tabla actualizada
 export const api = {
-  // Obtener todas las órdenes
-  async getOrders() {
+  // Obtener todas las órdenes (opcional: solo las de una celda)
+  async getOrders(celda) {
     try {
-      console.log('📥 Fetching orders...')
+      console.log('📥 Fetching orders...', { celda })
       
       // ✅ CORREGIDO: Obtener directamente de la tabla orders (sin joins)
-      const { data: orders, error } = await supabase
+      let queryBuilder = supabase
         .from('orders')
         .select('*')
+
+      // ✅ NUEVO: Filtrar por celda en la consulta, no en el frontend
+      if (celda) {
+        queryBuilder = queryBuilder.eq('celda', celda)
+      }
+
+      const { data: orders, error } = await queryBuilder
         .order('order_date', { ascending: false })
 
       if (error) {
@@ -190,9 +197,9 @@ export const api = {
   },
 
   // ✅ CORREGIDO: Buscar órdenes incluyendo celda
-  async searchOrders(query, date) {
+  async searchOrders(query, date, celda) {
     try {
-      console.log('🔍 Searching orders:', { query, date })
+      console.log('🔍 Searching orders:', { query, date, celda })
       
       let queryBuilder = supabase
         .from('orders')
@@ -209,6 +216,11 @@ export const api = {
           .lt('order_date', `${date}T23:59:59`)
       }
 
+      // ✅ NUEVO: Filtro por celda en la consulta
+      if (celda) {
+        queryBuilder = queryBuilder.eq('celda', celda)
+      }
+
       const { data: orders, error } = await queryBuilder
         .order('order_date', { ascending: false })
 